@@ -1,15 +1,30 @@
-from fastapi import FastAPI, APIRouter, HTTPException, Depends, Request, UploadFile, File
+from fastapi import FastAPI, APIRouter, HTTPException, Depends, Request, Response, UploadFile, File, Query, WebSocket, WebSocketDisconnect
 from fastapi.staticfiles import StaticFiles
+from fastapi.responses import JSONResponse
+from fastapi.encoders import jsonable_encoder
 from dotenv import load_dotenv
 import shutil
 from starlette.middleware.cors import CORSMiddleware
 from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import UpdateOne, UpdateMany, ReturnDocument, CursorType
+from pymongo.errors import PyMongoError, BulkWriteError, CollectionInvalid, DuplicateKeyError
 import os
 import logging
 from pathlib import Path
 from pydantic import BaseModel, Field, ConfigDict, EmailStr
 from typing import List, Optional, Dict
 import uuid
+import json
+import asyncio
+import base64
+import time
+import bisect
+import csv
+import io
+import re
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
 from datetime import datetime, timezone, timedelta
 from passlib.context import CryptContext
 import jwt
@@ -37,6 +52,7 @@ UPLOADS_DIR = ROOT_DIR / 'uploads'
 UPLOADS_DIR.mkdir(exist_ok=True)
 (UPLOADS_DIR / 'profiles').mkdir(exist_ok=True)
 (UPLOADS_DIR / 'pets').mkdir(exist_ok=True)
+(UPLOADS_DIR / 'exports').mkdir(exist_ok=True)
 
 # MongoDB connection
 mongo_url = os.environ['MONGO_URL']
@@ -390,8 +406,11 @@ class Appointment(BaseModel):
     duration_type: str = "minutes"  # "minutes", "days", or "nights"
     end_date: Optional[str] = None  # For multi-day bookings
     # GPS Tracking fields
-    gps_route: List[Dict] = Field(default_factory=list)  # List of {lat, lng, timestamp}
+    gps_route: List[Dict] = Field(default_factory=list)  # Legacy; points now live in walk_points
     distance_meters: Optional[float] = None
+    gps_point_count: Optional[int] = None
+    last_point: Optional[Dict] = None  # {lat, lng, timestamp}
+    gps_bbox: Optional[Dict] = None  # {min_lat, max_lat, min_lng, max_lng}
     is_tracking: bool = False
     created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
     # Recurring schedule fields
@@ -652,10 +671,13 @@ async def get_current_user(request: Request) -> dict:
     if not auth_header or not auth_header.startswith("Bearer "):
         raise HTTPException(status_code=401, detail="Not authenticated")
     
-    token = auth_header.split(" ")[1]
+    return await get_user_from_token(auth_header.split(" ")[1])
+
+async def get_user_from_token(token: str) -> dict:
+    """Resolve a JWT to its user; used directly by WebSocket routes (?token=...)"""
     try:
         payload = jwt.decode(token, JWT_SECRET, algorithms=[JWT_ALGORITHM])
-        user = await db.users.find_one({"id": payload.get("user_id")}, {"_id": 0})
+        user = await db.users.find_one({"id": payload.get("user_id")}, {"_id": 0, "read_group_messages": 0})
         if not user:
             raise HTTPException(status_code=401, detail="User not found")
         return user
@@ -664,6 +686,219 @@ async def get_current_user(request: Request) -> dict:
     except jwt.InvalidTokenError:
         raise HTTPException(status_code=401, detail="Invalid token")
 
+class EnrichmentLoader:
+    """
+    Request-scoped batch loader for the users and pets referenced by appointments.
+
+    Collect every referenced id first, then resolve them with one $in query per
+    collection instead of a find_one per appointment:
+
+        loader = EnrichmentLoader()
+        loader.add_appointments(appointments)
+        await loader.load()
+        loader.user_name(appt['client_id'])
+    """
+
+    def __init__(self, user_projection: dict = None, pet_projection: dict = None):
+        self.user_projection = user_projection or {"_id": 0, "password_hash": 0}
+        self.pet_projection = pet_projection or {"_id": 0}
+        self._user_ids = set()
+        self._pet_ids = set()
+        self.users: Dict[str, dict] = {}
+        self.pets: Dict[str, dict] = {}
+
+    def add_user_ids(self, *user_ids):
+        self._user_ids.update(uid for uid in user_ids if uid)
+
+    def add_pet_ids(self, pet_ids):
+        self._pet_ids.update(pid for pid in (pet_ids or []) if pid)
+
+    def add_appointments(self, appointments: List[dict]):
+        for appt in appointments:
+            self.add_user_ids(appt.get('client_id'), appt.get('walker_id'))
+            self.add_pet_ids(appt.get('pet_ids'))
+
+    async def load(self):
+        """Resolve all collected ids not loaded yet (one query per collection)"""
+        missing_users = list(self._user_ids - self.users.keys())
+        if missing_users:
+            projection = dict(self.user_projection)
+            if any(v for k, v in projection.items() if k != "_id"):
+                projection["id"] = 1  # Inclusion projections must still return the key
+            users = await db.users.find({"id": {"$in": missing_users}}, projection).to_list(None)
+            self.users.update({u['id']: u for u in users})
+
+        missing_pets = list(self._pet_ids - self.pets.keys())
+        if missing_pets:
+            projection = dict(self.pet_projection)
+            if any(v for k, v in projection.items() if k != "_id"):
+                projection["id"] = 1
+            pets = await db.pets.find({"id": {"$in": missing_pets}}, projection).to_list(None)
+            self.pets.update({p['id']: p for p in pets})
+        return self
+
+    def user(self, user_id: Optional[str]) -> Optional[dict]:
+        return self.users.get(user_id) if user_id else None
+
+    def user_name(self, user_id: Optional[str], default: Optional[str] = None) -> Optional[str]:
+        user = self.user(user_id)
+        return user.get('full_name') if user else default
+
+    def pet_list(self, pet_ids) -> List[dict]:
+        """Pets for the given ids, in the order referenced (unknown ids skipped)"""
+        return [self.pets[pid] for pid in (pet_ids or []) if pid in self.pets]
+
+    def pet_names(self, pet_ids) -> List[str]:
+        return [p['name'] for p in self.pet_list(pet_ids) if p.get('name')]
+
+class LiveTopicHub:
+    """
+    In-process pub/sub for streaming endpoints.
+
+    Each subscriber gets its own bounded queue; publish() fans a message out to
+    every subscriber of the topic without awaiting, so writers are never slowed
+    by viewers. A subscriber that falls behind loses its oldest messages rather
+    than growing without bound. Subscribers only see messages published by this
+    process.
+    """
+
+    def __init__(self, queue_size: int = 256):
+        self.queue_size = queue_size
+        self._topics: Dict[str, set] = {}
+
+    def subscribe(self, topic: str, queue: Optional[asyncio.Queue] = None) -> asyncio.Queue:
+        """Subscribe to a topic; pass an existing queue to merge several topics into it"""
+        queue = queue or asyncio.Queue(maxsize=self.queue_size)
+        self._topics.setdefault(topic, set()).add(queue)
+        return queue
+
+    def unsubscribe(self, topic: str, queue: asyncio.Queue):
+        subscribers = self._topics.get(topic)
+        if subscribers:
+            subscribers.discard(queue)
+            if not subscribers:
+                del self._topics[topic]
+
+    def publish(self, topic: str, message: dict):
+        for queue in list(self._topics.get(topic, ())):
+            if queue.full():
+                queue.get_nowait()
+            queue.put_nowait(message)
+
+    def subscriber_count(self, topic: str) -> int:
+        return len(self._topics.get(topic, ()))
+
+live_hub = LiveTopicHub()
+
+class LocalBrokerBackend:
+    """Delivers broker events to subscribers in this process only"""
+    
+    async def publish(self, topic: str, message: dict):
+        live_hub.publish(topic, message)
+    
+    async def start(self):
+        pass
+    
+    async def stop(self):
+        pass
+
+class MongoBrokerBackend:
+    """
+    Shares broker events between workers through a capped collection: every
+    worker inserts its events there and tails the collection, republishing each
+    event to its own live hub subscribers.
+    """
+    
+    def __init__(self, collection_name: str = "broker_events", size_bytes: int = 16 * 1024 * 1024):
+        self.collection_name = collection_name
+        self.size_bytes = size_bytes
+        self._task: Optional[asyncio.Task] = None
+    
+    async def publish(self, topic: str, message: dict):
+        await db[self.collection_name].insert_one({
+            "topic": topic,
+            "message": message,
+            "created_at": datetime.now(timezone.utc).isoformat()
+        })
+    
+    async def start(self):
+        if self.collection_name not in await db.list_collection_names():
+            try:
+                await db.create_collection(self.collection_name, capped=True, size=self.size_bytes)
+            except CollectionInvalid:
+                pass  # Another worker created it first
+        self._task = asyncio.create_task(self._tail())
+    
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+    
+    async def _tail(self):
+        collection = db[self.collection_name]
+        latest = await collection.find_one({}, {"_id": 1}, sort=[("$natural", -1)])
+        last_id = latest["_id"] if latest else None
+        while True:
+            try:
+                cursor = collection.find(
+                    {"_id": {"$gt": last_id}} if last_id else {},
+                    cursor_type=CursorType.TAILABLE_AWAIT
+                )
+                async for event in cursor:
+                    last_id = event["_id"]
+                    live_hub.publish(event["topic"], event["message"])
+            except PyMongoError as e:
+                logging.warning(f"Broker tail interrupted: {e}")
+            # Tailable cursors die on an empty collection or a lost connection; reopen
+            await asyncio.sleep(1)
+
+# Events for per-user streams; MESSAGE_BROKER_BACKEND=mongo fans them out across workers
+message_broker = MongoBrokerBackend() if os.environ.get('MESSAGE_BROKER_BACKEND', 'local') == 'mongo' else LocalBrokerBackend()
+STAFF_GROUP_TOPIC = "group:staff"
+
+async def stream_topic(websocket: WebSocket, queue: asyncio.Queue,
+                       skip=lambda message: False, is_final=lambda message: False,
+                       prepare=lambda message: message):
+    """
+    Forward queued hub messages to an accepted WebSocket until the client
+    disconnects or a message for which is_final() is true has been sent.
+    Messages for which skip() is true (e.g. already covered by a snapshot) are
+    dropped; prepare() may return a trimmed copy, or None to drop the message.
+    Incoming client frames (e.g. keep-alive pings) are read and ignored.
+    """
+    async def forward():
+        while True:
+            message = await queue.get()
+            if skip(message):
+                continue
+            message = prepare(message)
+            if message is None:
+                continue
+            await websocket.send_json(message)
+            if is_final(message):
+                return
+
+    async def drain():
+        while True:
+            await websocket.receive_text()
+
+    tasks = [asyncio.create_task(forward()), asyncio.create_task(drain())]
+    try:
+        await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+async def authenticate_websocket(websocket: WebSocket) -> Optional[dict]:
+    """User for the ?token= query parameter, or None after closing the socket"""
+    try:
+        return await get_user_from_token(websocket.query_params.get("token", ""))
+    except HTTPException:
+        await websocket.close(code=1008)  # Policy violation
+        return None
+
 # Auth Routes
 @api_router.post("/auth/register", response_model=TokenResponse)
 async def register(user_data: UserCreate):
@@ -898,10 +1133,23 @@ async def delete_user(user_id: str, current_user: dict = Depends(get_current_use
     
     # Also delete related data
     await db.pets.delete_many({"owner_id": user_id})
+    await delete_walk_points({"$or": [{"client_id": user_id}, {"walker_id": user_id}]})
+    completed_ids = await db.appointments.distinct("id", {"client_id": user_id, "status": "completed"})
     await db.appointments.delete_many({"$or": [{"client_id": user_id}, {"walker_id": user_id}]})
+    await sync_payroll_ledger(completed_ids)
+    walker_schedule_index.invalidate()
+    # Stop the recurring scheduler from regenerating those appointments
+    await db.recurring_schedules.delete_many({"client_id": user_id})
+    await db.recurring_schedules.update_many(
+        {"walker_id": user_id},
+        {"$set": {"walker_id": None, "status": "pending_assignment", "materialized_through": None}}
+    )
     await db.messages.delete_many({"$or": [{"sender_id": user_id}, {"receiver_id": user_id}]})
+    await db.conversations.delete_many({"participants": user_id})
     await db.notifications.delete_many({"user_id": user_id})
     await db.paysheets.delete_many({"walker_id": user_id})
+    await db.payroll_ledger.delete_many({"walker_id": user_id})
+    await db.payroll_monthly_rollup.delete_many({"walker_id": user_id})
     
     return {"message": f"User {user.get('full_name', user_id)} deleted successfully"}
 
@@ -1147,7 +1395,7 @@ async def get_pet_appointments(pet_id: str, current_user: dict = Depends(get_cur
         "pet_ids": pet_id,
         "scheduled_date": {"$gte": today},
         "status": {"$in": ["scheduled", "in_progress"]}
-    }, {"_id": 0}).to_list(500)
+    }, APPOINTMENT_LIST_PROJECTION).to_list(500)
     
     # Categorize: sole pet vs shared with other pets
     sole_appointments = []
@@ -1187,7 +1435,7 @@ async def delete_pet(pet_id: str, delete_appointments: bool = False, current_use
         "pet_ids": pet_id,
         "scheduled_date": {"$gte": today},
         "status": {"$in": ["scheduled", "in_progress"]}
-    }, {"_id": 0}).to_list(500)
+    }, APPOINTMENT_LIST_PROJECTION).to_list(500)
     
     deleted_appointments = 0
     updated_appointments = 0
@@ -1197,7 +1445,9 @@ async def delete_pet(pet_id: str, delete_appointments: bool = False, current_use
         if len(pet_ids) == 1:
             # This pet is the only one - delete the appointment
             if delete_appointments:
+                await db.walk_points.delete_many({"appointment_id": appt["id"]})
                 await db.appointments.delete_one({"id": appt["id"]})
+                walker_schedule_index.invalidate(appt.get("scheduled_date"))
                 deleted_appointments += 1
         else:
             # Multiple pets - just remove this pet from the appointment
@@ -1331,11 +1581,256 @@ async def setup_client_pricing(user_id: str, pricing_data: dict, current_user: d
     return {"message": "Pricing setup completed", "appointments_created": appointments_created}
 
 
+# Day-based services that don't need a specific time
+DAY_SERVICES = ['doggy_day_care', 'doggy_day_camp', 'day_care', 'day_camp', 'stay_day']
+
+def materialized_key(appt: dict) -> str:
+    """Identity of a generated appointment: client, date, time and service"""
+    return "|".join([appt["client_id"], appt["scheduled_date"], appt["scheduled_time"] or "", appt["service_type"]])
+
+def recurring_appointment_docs(schedule: dict, start, end) -> List[dict]:
+    """Appointments a recurring schedule produces for dates in [start, end)"""
+    day_of_week = schedule.get("day_of_week", 0)
+    scheduled_time = schedule.get("scheduled_time", "09:00")
+    service_type = schedule.get("service_type", "walk_30")
+    
+    # For day-based services, use a default time if empty
+    if not scheduled_time:
+        if service_type in DAY_SERVICES:
+            scheduled_time = "08:00"  # Default drop-off time for day services
+        else:
+            return []  # Skip non-day services without a time
+    
+    docs = []
+    now = datetime.now(timezone.utc).isoformat()
+    target_date = start + timedelta(days=(day_of_week - start.weekday()) % 7)
+    while target_date < end:
+        docs.append({
+            "id": str(uuid.uuid4()),
+            "client_id": schedule["client_id"],
+            "walker_id": schedule.get("walker_id"),
+            "pet_ids": schedule.get("pet_ids", []),
+            "service_type": service_type,
+            "scheduled_date": target_date.isoformat(),
+            "scheduled_time": scheduled_time,
+            "duration_value": schedule.get("duration_value", 1),
+            "status": "scheduled",
+            "notes": schedule.get("notes", ""),
+            "is_recurring": True,
+            "recurring_schedule_id": schedule.get("id"),
+            "created_at": now
+        })
+        target_date += timedelta(days=7)
+    return docs
+
+async def materialize_appointments(candidates: List[dict]) -> int:
+    """
+    Insert the candidate appointments that don't exist yet; returns how many were created.
+    
+    An appointment already exists when the client has one, of any status, with the
+    same date, time and service type; a cancelled occurrence is not recreated. Existing rows for every candidate are read
+    with one range query and the missing ones are written with one unordered
+    insert_many. Each inserted row carries a materialized_key backed by a unique
+    index, so two runs racing on the same slots cannot both insert it; the loser's
+    duplicates are rejected and not counted.
+    
+    Rows that were moved since they were generated still hold the key of their
+    original slot; those keys are released first so the slot can be booked again.
+    """
+    keyed = {}
+    for appt in candidates:
+        keyed.setdefault(materialized_key(appt), appt)
+    if not keyed:
+        return 0
+    
+    held = await db.appointments.find(
+        {"materialized_key": {"$in": list(keyed)}},
+        {"_id": 0, "id": 1, "client_id": 1, "scheduled_date": 1, "scheduled_time": 1, "service_type": 1, "materialized_key": 1}
+    ).to_list(None)
+    released = [
+        appt["id"] for appt in held
+        if None in (appt.get("scheduled_date"), appt.get("service_type"))
+        or materialized_key(appt) != appt["materialized_key"]
+    ]
+    if released:
+        await db.appointments.update_many({"id": {"$in": released}}, {"$unset": {"materialized_key": ""}})
+    
+    dates = [appt["scheduled_date"] for appt in keyed.values()]
+    existing = await db.appointments.find({
+        "client_id": {"$in": list({appt["client_id"] for appt in keyed.values()})},
+        "scheduled_date": {"$gte": min(dates), "$lte": max(dates)}
+    }, {"_id": 0, "client_id": 1, "scheduled_date": 1, "scheduled_time": 1, "service_type": 1}).to_list(None)
+    existing_keys = {
+        materialized_key(appt) for appt in existing
+        if appt.get("scheduled_time") is not None and appt.get("service_type") is not None
+    }
+    
+    to_insert = [{**appt, "materialized_key": key} for key, appt in keyed.items() if key not in existing_keys]
+    if not to_insert:
+        return 0
+    
+    try:
+        result = await db.appointments.insert_many(to_insert, ordered=False)
+        created = len(result.inserted_ids)
+    except BulkWriteError as e:
+        # Duplicate keys mean a concurrent run already created those slots
+        if any(err.get("code") != 11000 for err in e.details.get("writeErrors", [])):
+            raise
+        created = e.details.get("nInserted", 0)
+    
+    walker_schedule_index.invalidate(*{appt["scheduled_date"] for appt in to_insert})
+    return created
+
+async def materialize_schedules(schedules: List[dict], end) -> int:
+    """
+    Materialize recurring schedules through the day before `end`.
+    
+    Each schedule only generates dates after its materialized_through watermark,
+    and the watermark is advanced (never moved back) once the rows are written.
+    An occurrence deleted or cancelled inside the materialized window therefore
+    stays gone, which is how skipping a single week works; editing the schedule's
+    day, time or service clears the watermark and regenerates from today.
+    """
+    # Schedules left behind by a deleted client or walker generate nothing
+    user_ids = {s.get("client_id") for s in schedules} | {s.get("walker_id") for s in schedules}
+    existing_users = set(await db.users.distinct("id", {"id": {"$in": [uid for uid in user_ids if uid]}}))
+    schedules = [
+        s for s in schedules
+        if s.get("client_id") in existing_users and (not s.get("walker_id") or s["walker_id"] in existing_users)
+    ]
+    
+    today = datetime.now(timezone.utc).date()
+    last_date = (end - timedelta(days=1)).isoformat()
+    candidates = []
+    for schedule in schedules:
+        start = today
+        if schedule.get("materialized_through"):
+            try:
+                start = max(today, datetime.strptime(schedule["materialized_through"], "%Y-%m-%d").date() + timedelta(days=1))
+            except ValueError:
+                pass
+        candidates.extend(recurring_appointment_docs(schedule, start, end))
+    
+    created = await materialize_appointments(candidates)
+    
+    watermarks = [
+        UpdateOne({"id": schedule["id"]}, {"$max": {"materialized_through": last_date}})
+        for schedule in schedules if schedule.get("id")
+    ]
+    if watermarks:
+        await db.recurring_schedules.bulk_write(watermarks, ordered=False)
+    return created
+
+class RecurringScheduler:
+    """
+    Background worker that keeps every active recurring schedule materialized
+    horizon_weeks ahead, so appointments exist without an admin request.
+    
+    Each pass loads the active schedules whose watermark is behind the horizon,
+    groups them by client and materializes batch_size clients at a time, with at
+    most `concurrency` batches in flight. Paused, stopped and pending schedules
+    are skipped. Several app workers may run passes at once; the unique
+    materialized_key index keeps their output free of duplicates.
+    """
+    
+    def __init__(self, horizon_weeks: int = 8, interval_seconds: int = 3600, concurrency: int = 4, batch_size: int = 50):
+        self.horizon_weeks = horizon_weeks
+        self.interval_seconds = interval_seconds
+        self.concurrency = concurrency
+        self.batch_size = batch_size
+        self.last_run: Optional[dict] = None
+        self._task: Optional[asyncio.Task] = None
+        self._wake = asyncio.Event()
+    
+    async def run_once(self) -> dict:
+        started = datetime.now(timezone.utc)
+        end = started.date() + timedelta(weeks=self.horizon_weeks)
+        last_date = (end - timedelta(days=1)).isoformat()
+        
+        schedules = await db.recurring_schedules.find({
+            "status": "active",
+            "$or": [
+                {"materialized_through": None},
+                {"materialized_through": {"$lt": last_date}}
+            ]
+        }, {"_id": 0}).to_list(None)
+        
+        by_client: Dict[str, list] = {}
+        for schedule in schedules:
+            by_client.setdefault(schedule["client_id"], []).append(schedule)
+        client_ids = list(by_client)
+        batches = [client_ids[i:i + self.batch_size] for i in range(0, len(client_ids), self.batch_size)]
+        
+        semaphore = asyncio.Semaphore(self.concurrency)
+        failures = []
+        
+        async def run_batch(batch: List[str]) -> int:
+            async with semaphore:
+                try:
+                    return await materialize_schedules([s for cid in batch for s in by_client[cid]], end)
+                except PyMongoError as e:
+                    logging.error(f"Recurring scheduler batch failed ({len(batch)} clients): {e}")
+                    failures.append(str(e))
+                    return 0
+        
+        created = sum(await asyncio.gather(*(run_batch(batch) for batch in batches)))
+        
+        self.last_run = {
+            "started_at": started.isoformat(),
+            "finished_at": datetime.now(timezone.utc).isoformat(),
+            "horizon_through": last_date,
+            "clients": len(client_ids),
+            "schedules": len(schedules),
+            "appointments_created": created,
+            "failed_batches": len(failures),
+        }
+        if created or failures:
+            logging.info(f"Recurring scheduler: {created} appointments for {len(client_ids)} clients, {len(failures)} failed batches")
+        return self.last_run
+    
+    async def _loop(self):
+        while True:
+            try:
+                await self.run_once()
+            except Exception as e:
+                logging.error(f"Recurring scheduler pass failed: {e}")
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=self.interval_seconds)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+    
+    def wake(self):
+        """Run a pass soon instead of waiting for the next interval"""
+        self._wake.set()
+    
+    def start(self):
+        if self._task is None or self._task.done():
+            self._wake = asyncio.Event()
+            self._task = asyncio.create_task(self._loop())
+    
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+recurring_scheduler = RecurringScheduler(
+    horizon_weeks=int(os.environ.get('RECURRING_HORIZON_WEEKS', '8')),
+    interval_seconds=int(os.environ.get('RECURRING_SCHEDULER_INTERVAL_SECONDS', '3600')),
+    concurrency=int(os.environ.get('RECURRING_SCHEDULER_CONCURRENCY', '4')),
+    batch_size=int(os.environ.get('RECURRING_SCHEDULER_BATCH_SIZE', '50')),
+)
+
 async def generate_appointments_for_client(client_id: str, weeks_ahead: int = 4):
     """
     Generate appointments from recurring schedules for a specific client.
     Creates appointments for the next N weeks.
     If no recurring schedules exist, attempts to create them from onboarding_data.
+    Schedules already materialized past the window only generate what is missing.
     """
     # Get all active recurring schedules for this client
     recurring_schedules = await db.recurring_schedules.find({
@@ -1386,7 +1881,7 @@ async def generate_appointments_for_client(client_id: str, weeks_ahead: int = 4)
                 for day in preferred_days:
                     day_num = day_to_num.get(day, 0)
                     for walk_time in preferred_times:
-                        recurring_schedule = {
+                        recurring_schedules.append({
                             "id": str(uuid.uuid4()),
                             "client_id": client_id,
                             "walker_id": od.get("preferred_walker_id"),
@@ -1398,76 +1893,18 @@ async def generate_appointments_for_client(client_id: str, weeks_ahead: int = 4)
                             "status": "active",
                             "created_at": datetime.now(timezone.utc).isoformat(),
                             "created_by": client_id
-                        }
-                        await db.recurring_schedules.insert_one(recurring_schedule)
+                        })
+                if recurring_schedules:
+                    await db.recurring_schedules.insert_many(recurring_schedules)
+                    for recurring_schedule in recurring_schedules:
                         recurring_schedule.pop("_id", None)
-                        recurring_schedules.append(recurring_schedule)
     
     if not recurring_schedules:
         # Log why we couldn't create schedules
         return 0
     
-    appointments_created = 0
-    today = datetime.now(timezone.utc).date()
-    today_weekday = today.weekday()  # Monday=0, Sunday=6
-    
-    # Day-based services that don't need a specific time
-    day_services = ['doggy_day_care', 'doggy_day_camp', 'day_care', 'day_camp', 'stay_day']
-    
-    for schedule in recurring_schedules:
-        day_of_week = schedule.get("day_of_week", 0)
-        scheduled_time = schedule.get("scheduled_time", "09:00")
-        service_type = schedule.get("service_type", "walk_30")
-        
-        # For day-based services, use a default time if empty
-        is_day_service = service_type in day_services
-        if not scheduled_time:
-            if is_day_service:
-                scheduled_time = "08:00"  # Default drop-off time for day services
-            else:
-                continue  # Skip non-day services without a time
-        
-        # Calculate days until the next occurrence of this day_of_week
-        days_until_next = (day_of_week - today_weekday) % 7
-        # If it's today and we want to include today, days_until_next will be 0
-        # If day already passed this week, this gives us next week's occurrence
-        
-        # Generate appointments for the next N weeks
-        for week in range(weeks_ahead):
-            target_date = today + timedelta(days=days_until_next + (week * 7))
-            
-            # Skip if target_date is in the past (shouldn't happen but safety check)
-            if target_date < today:
-                continue
-            
-            # Check if appointment already exists for this date/time/client
-            existing = await db.appointments.find_one({
-                "client_id": client_id,
-                "scheduled_date": target_date.isoformat(),
-                "scheduled_time": scheduled_time,
-                "service_type": schedule.get("service_type")
-            })
-            
-            if not existing:
-                appointment = {
-                    "id": str(uuid.uuid4()),
-                    "client_id": client_id,
-                    "walker_id": schedule.get("walker_id"),
-                    "pet_ids": schedule.get("pet_ids", []),
-                    "service_type": schedule.get("service_type"),
-                    "scheduled_date": target_date.isoformat(),
-                    "scheduled_time": scheduled_time,
-                    "duration_value": schedule.get("duration_value", 1),
-                    "status": "scheduled",
-                    "notes": schedule.get("notes", ""),
-                    "is_recurring": True,
-                    "recurring_schedule_id": schedule.get("id"),
-                    "created_at": datetime.now(timezone.utc).isoformat()
-                }
-                await db.appointments.insert_one(appointment)
-                appointments_created += 1
-    
-    return appointments_created
+    end = datetime.now(timezone.utc).date() + timedelta(weeks=weeks_ahead)
+    return await materialize_schedules(recurring_schedules, end)
 
 
 @api_router.get("/users/{user_id}/appointments-check")
@@ -1476,7 +1913,7 @@ async def check_client_appointments(user_id: str, current_user: dict = Depends(g
     if current_user['role'] != 'admin':
         raise HTTPException(status_code=403, detail="Admin only")
     
-    appointments = await db.appointments.find({"client_id": user_id}, {"_id": 0}).to_list(500)
+    appointments = await db.appointments.find({"client_id": user_id}, APPOINTMENT_LIST_PROJECTION).to_list(500)
     
     # Get client name
     client = await db.users.find_one({"id": user_id}, {"_id": 0, "full_name": 1})
@@ -1504,7 +1941,7 @@ async def debug_calendar_check(current_user: dict = Depends(get_current_user)):
         raise HTTPException(status_code=403, detail="Admin only")
     
     # Get all appointments
-    all_appointments = await db.appointments.find({}, {"_id": 0}).to_list(1000)
+    all_appointments = await db.appointments.find({}, APPOINTMENT_LIST_PROJECTION).to_list(1000)
     
     # Group by client
     by_client = {}
@@ -1553,7 +1990,7 @@ async def get_schedule_diagnostic(user_id: str, current_user: dict = Depends(get
     all_schedules = await db.recurring_schedules.find({"client_id": user_id}, {"_id": 0}).to_list(100)
     
     # Get appointments
-    appointments = await db.appointments.find({"client_id": user_id}, {"_id": 0}).to_list(500)
+    appointments = await db.appointments.find({"client_id": user_id}, APPOINTMENT_LIST_PROJECTION).to_list(500)
     
     # Get pets
     pets = await db.pets.find({"owner_id": user_id}, {"_id": 0}).to_list(100)
@@ -1660,18 +2097,20 @@ async def force_create_schedule_from_onboarding(user_id: str, current_user: dict
     deleted_schedules = await db.recurring_schedules.delete_many({"client_id": user_id})
     
     # Delete ALL existing appointments for this client (to start fresh)
+    await delete_walk_points({"client_id": user_id})
     deleted_appointments = await db.appointments.delete_many({"client_id": user_id})
+    walker_schedule_index.invalidate()
     
     # Map day names to numbers
     day_to_num = {"Monday": 0, "Tuesday": 1, "Wednesday": 2, "Thursday": 3, "Friday": 4, "Saturday": 5, "Sunday": 6, "monday": 0, "tuesday": 1, "wednesday": 2, "thursday": 3, "friday": 4, "saturday": 5, "sunday": 6}
     service_type_map = {30: "walk_30", 45: "walk_45", 60: "walk_60"}
     service_type = service_type_map.get(walk_duration, "walk_30")
     
-    schedules_created = 0
+    recurring_schedules = []
     for day in preferred_days:
         day_num = day_to_num.get(day, 0)
         for walk_time in preferred_times:
-            recurring_schedule = {
+            recurring_schedules.append({
                 "id": str(uuid.uuid4()),
                 "client_id": user_id,
                 "walker_id": od.get("preferred_walker_id"),
@@ -1683,9 +2122,10 @@ async def force_create_schedule_from_onboarding(user_id: str, current_user: dict
                 "status": "active",
                 "created_at": datetime.now(timezone.utc).isoformat(),
                 "created_by": current_user['id']
-            }
-            await db.recurring_schedules.insert_one(recurring_schedule)
-            schedules_created += 1
+            })
+    if recurring_schedules:
+        await db.recurring_schedules.insert_many(recurring_schedules)
+    schedules_created = len(recurring_schedules)
     
     # Now generate appointments starting from TODAY
     appointments_created = await generate_appointments_from_today(user_id, pet_ids, preferred_days, preferred_times, service_type, weeks_ahead=4)
@@ -1709,7 +2149,7 @@ async def generate_appointments_from_today(client_id: str, pet_ids: list, days:
     day_nums = [day_to_num.get(d, 0) for d in days]
     
     today = date.today()  # Use local date, not UTC
-    appointments_created = 0
+    candidates = []
     
     # Generate appointments for the next N weeks
     for day_offset in range(weeks_ahead * 7):
@@ -1719,7 +2159,7 @@ async def generate_appointments_from_today(client_id: str, pet_ids: list, days:
         # Check if this day of week is in the client's preferred days
         if target_weekday in day_nums:
             for walk_time in times:
-                appointment = {
+                candidates.append({
                     "id": str(uuid.uuid4()),
                     "client_id": client_id,
                     "walker_id": None,  # Unassigned
@@ -1732,11 +2172,9 @@ async def generate_appointments_from_today(client_id: str, pet_ids: list, days:
                     "notes": "",
                     "is_recurring": True,
                     "created_at": datetime.now(timezone.utc).isoformat()
-                }
-                await db.appointments.insert_one(appointment)
-                appointments_created += 1
+                })
     
-    return appointments_created
+    return await materialize_appointments(candidates)
 
 
 @api_router.get("/users/{user_id}/custom-pricing")
@@ -1826,12 +2264,12 @@ async def set_walking_schedule(user_id: str, schedule: dict, current_user: dict
             raise HTTPException(status_code=400, detail="End date must be on or after start date")
         
         # Don't delete existing schedules for one-time - just add new appointments
-        appointments_created = 0
+        candidates = []
         current_date = start
         
         while current_date <= end:
             for time in times_to_use:
-                appointment = {
+                candidates.append({
                     "id": str(uuid.uuid4()),
                     "client_id": user_id,
                     "walker_id": preferred_walker_id if preferred_walker_id else None,
@@ -1844,10 +2282,9 @@ async def set_walking_schedule(user_id: str, schedule: dict, current_user: dict
                     "notes": notes,
                     "is_recurring": False,
                     "created_at": datetime.now(timezone.utc).isoformat()
-                }
-                await db.appointments.insert_one(appointment)
-                appointments_created += 1
+                })
             current_date += timedelta(days=1)
+        appointments_created = await materialize_appointments(candidates)
         
         return {
             "message": f"One-time schedule created: {appointments_created} appointments from {start_date} to {end_date}",
@@ -1869,11 +2306,11 @@ async def set_walking_schedule(user_id: str, schedule: dict, current_user: dict
         })
         
         # Create recurring schedules
-        schedules_created = 0
+        recurring_schedules = []
         for day in days:
             day_num = day_to_num.get(day, 0)
             for time in times_to_use:
-                recurring_schedule = {
+                recurring_schedules.append({
                     "id": str(uuid.uuid4()),
                     "client_id": user_id,
                     "walker_id": preferred_walker_id if preferred_walker_id else None,
@@ -1886,20 +2323,21 @@ async def set_walking_schedule(user_id: str, schedule: dict, current_user: dict
                     "status": "active",
                     "created_at": datetime.now(timezone.utc).isoformat(),
                     "created_by": current_user['id']
-                }
-                await db.recurring_schedules.insert_one(recurring_schedule)
-                schedules_created += 1
+                })
+        if recurring_schedules:
+            await db.recurring_schedules.insert_many(recurring_schedules)
+        schedules_created = len(recurring_schedules)
         
         # Generate appointments for the next 4 weeks
         day_nums = [day_to_num.get(d, 0) for d in days]
         today_date = date.today()
-        appointments_created = 0
+        candidates = []
         
         for day_offset in range(28):  # 4 weeks
             target_date = today_date + timedelta(days=day_offset)
             if target_date.weekday() in day_nums:
                 for time in times_to_use:
-                    appointment = {
+                    candidates.append({
                         "id": str(uuid.uuid4()),
                         "client_id": user_id,
                         "walker_id": preferred_walker_id if preferred_walker_id else None,
@@ -1912,9 +2350,9 @@ async def set_walking_schedule(user_id: str, schedule: dict, current_user: dict
                         "notes": notes,
                         "is_recurring": True,
                         "created_at": datetime.now(timezone.utc).isoformat()
-                    }
-                    await db.appointments.insert_one(appointment)
-                    appointments_created += 1
+                    })
+        appointments_created = await materialize_appointments(candidates)
+        walker_schedule_index.invalidate()
         
         return {
             "message": f"Recurring schedule saved. Created {schedules_created} recurring schedules and {appointments_created} appointments",
@@ -1936,6 +2374,111 @@ async def get_walking_schedule(user_id: str, current_user: dict = Depends(get_cu
         return schedule
     return None
 
+# Prices for service types that have no services document yet
+FALLBACK_SERVICE_PRICES = {"walk_30": 25, "walk_45": 35, "walk_60": 40, "doggy_day_care": 45, "stay_overnight": 75}
+
+class ServicePriceCache:
+    """
+    Process-wide service_type -> price table used by all billing code.
+    
+    The table is rebuilt from the services collection whenever the version in
+    the settings document {"type": "service_prices"} moves; invalidate() bumps
+    it on every service write, and other workers notice within check_seconds.
+    Per-client custom prices and billing-plan discounts are read fresh for each
+    billing call and layered on top in price_appointments().
+    """
+    
+    SETTINGS_FILTER = {"type": "service_prices"}
+    
+    def __init__(self, check_seconds: int = 5):
+        self.check_seconds = check_seconds
+        self._prices: Optional[Dict[str, float]] = None
+        self._version = None
+        self._checked_at = 0.0
+        self._lock = asyncio.Lock()
+    
+    async def _current_version(self) -> int:
+        settings = await db.settings.find_one(self.SETTINGS_FILTER, {"_id": 0, "version": 1})
+        return (settings or {}).get("version", 0)
+    
+    async def prices(self) -> Dict[str, float]:
+        """Base price per service type, reloaded only when the version changes"""
+        if self._prices is not None and time.monotonic() - self._checked_at < self.check_seconds:
+            return self._prices
+        async with self._lock:
+            if self._prices is not None and time.monotonic() - self._checked_at < self.check_seconds:
+                return self._prices
+            version = await self._current_version()
+            if self._prices is None or version != self._version:
+                prices = dict(FALLBACK_SERVICE_PRICES)
+                loaded = set()
+                async for service in db.services.find({}, {"_id": 0, "service_type": 1, "price": 1}):
+                    if service.get("service_type") not in loaded and service.get("price") is not None:
+                        loaded.add(service["service_type"])
+                        prices[service["service_type"]] = service["price"]
+                self._prices, self._version = prices, version
+            self._checked_at = time.monotonic()
+            return self._prices
+    
+    async def invalidate(self):
+        """Bump the shared version after a service write"""
+        self._prices = None
+        await db.settings.update_one(self.SETTINGS_FILTER, {"$inc": {"version": 1}}, upsert=True)
+    
+    async def client_price_books(self, client_ids: List[str]) -> Dict[str, dict]:
+        """Custom prices and billing-plan discount for each client, in three queries"""
+        client_ids = list(set(client_ids))
+        users = await db.users.find(
+            {"id": {"$in": client_ids}},
+            {"_id": 0, "id": 1, "custom_prices": 1, "billing_plan_id": 1}
+        ).to_list(None)
+        legacy = {
+            row["user_id"]: row.get("pricing") or {}
+            async for row in db.custom_pricing.find({"user_id": {"$in": client_ids}}, {"_id": 0})
+        }
+        plan_ids = list({u["billing_plan_id"] for u in users if u.get("billing_plan_id")})
+        plans = {
+            plan["id"]: plan
+            async for plan in db.billing_plans.find({"id": {"$in": plan_ids}}, {"_id": 0})
+        } if plan_ids else {}
+        
+        books = {}
+        for user in users:
+            plan = plans.get(user.get("billing_plan_id")) or {}
+            # custom_prices on the user wins and {} there means "standard rates";
+            # only an unset value (None, as at registration) falls back to legacy
+            custom_prices = user.get("custom_prices")
+            if custom_prices is None:
+                custom_prices = legacy.get(user["id"])
+            books[user["id"]] = {
+                "custom_prices": custom_prices or {},
+                "discount_percent": plan.get("discount_percent") or 0,
+                "discount_services": plan.get("services") or []  # Empty: discount applies to every service
+            }
+        return books
+    
+    @staticmethod
+    def price(service_type: str, prices: Dict[str, float], book: Optional[dict] = None) -> float:
+        """One appointment's price: custom price or base price, less any plan discount"""
+        book = book or {}
+        custom = (book.get("custom_prices") or {}).get(service_type)
+        amount = float(custom) if custom not in (None, "") else prices.get(service_type, 0.0)
+        discount = book.get("discount_percent", 0)
+        if discount and (not book.get("discount_services") or service_type in book["discount_services"]):
+            amount = amount * (1 - discount / 100)
+        return round(float(amount), 2)
+    
+    async def price_appointments(self, appts: List[dict]) -> Dict[str, float]:
+        """Price for each appointment id, with each client's pricing applied"""
+        prices = await self.prices()
+        books = await self.client_price_books([a["client_id"] for a in appts if a.get("client_id")])
+        return {
+            a["id"]: self.price(a.get("service_type"), prices, books.get(a.get("client_id")))
+            for a in appts
+        }
+
+service_prices = ServicePriceCache()
+
 # Service Pricing Routes
 @api_router.get("/services", response_model=List[ServicePricing])
 async def get_services():
@@ -1952,6 +2495,7 @@ async def get_services():
         ]
         for service in default_services:
             await db.services.insert_one(service.model_dump())
+        await service_prices.invalidate()
         services = [s.model_dump() for s in default_services]
     
     # Ensure all services have correct duration_type
@@ -2020,6 +2564,7 @@ async def create_service(service: ServicePricing, current_user: dict = Depends(g
             counter += 1
     
     await db.services.insert_one(service_dict)
+    await service_prices.invalidate()
     service_dict.pop('_id', None)
     return service_dict
 
@@ -2123,7 +2668,112 @@ def get_walk_duration(service_type: str) -> int:
     }
     return durations.get(service_type, 30)  # Default to 30 minutes
 
-async def check_walker_availability(walker_id: str, scheduled_date: str, scheduled_time: str, exclude_appt_id: str = None, service_type: str = 'walk_30') -> dict:
+# Non-walk services can overlap - no conflict checking needed
+NON_CONFLICTING_SERVICES = ['overnight', 'stay_overnight', 'stay_extended', 'stay_day', 
+                            'day_visit', 'petsit_our_location', 'petsit_your_location',
+                            'doggy_day_camp', 'doggy_day_care', 'transport', 'concierge']
+
+WALK_BUFFER_MINUTES = 15
+
+class WalkerScheduleIndex:
+    """
+    In-memory, per-day interval index of walker WALK appointments.
+    
+    Each day is built from a single appointments query and holds, per walker, the
+    walks sorted by start minute, padded by the 15-minute buffer on both sides.
+    A new walk [start, end) conflicts with an existing walk exactly when it
+    overlaps the padded interval [existing_start - 15, existing_end + 15), which
+    is the same rule check_walker_availability has always enforced.
+    
+    Days are cached for a short TTL (so other workers' writes show up quickly)
+    and dropped explicitly via invalidate() whenever appointments are written.
+    """
+    
+    def __init__(self, ttl_seconds: int = 60):
+        self.ttl_seconds = ttl_seconds
+        self._days: Dict[str, tuple] = {}  # date -> (built_at, {walker_id: [entry, ...]})
+    
+    @staticmethod
+    def _build(appointments: List[dict]) -> Dict[str, Dict[str, list]]:
+        days: Dict[str, Dict[str, list]] = {}
+        for appt in appointments:
+            start = time_to_minutes(appt.get("scheduled_time") or "00:00")
+            end = start + get_walk_duration(appt.get("service_type", "walk_30"))
+            days.setdefault(appt["scheduled_date"], {}).setdefault(appt["walker_id"], []).append({
+                "padded_start": start - WALK_BUFFER_MINUTES,
+                "padded_end": end + WALK_BUFFER_MINUTES,
+                "start": start,
+                "end": end,
+                "appointment": appt,
+            })
+        for walkers in days.values():
+            for entries in walkers.values():
+                entries.sort(key=lambda e: e["padded_start"])
+        return days
+    
+    async def load_dates(self, dates: List[str], refresh: bool = False) -> Dict[str, Dict[str, list]]:
+        """Return the index for each date, fetching all stale dates with one query"""
+        now = time.monotonic()
+        wanted = set(d for d in dates if d)
+        stale = [d for d in wanted if refresh or d not in self._days or now - self._days[d][0] > self.ttl_seconds]
+        if stale:
+            appointments = await db.appointments.find({
+                "scheduled_date": {"$in": stale},
+                "walker_id": {"$ne": None},
+                "status": {"$nin": ["cancelled", "completed"]},
+                "service_type": {"$regex": "^walk_"}  # Only walks conflict with walks
+            }, {"_id": 0, "id": 1, "walker_id": 1, "client_id": 1, "scheduled_date": 1, "scheduled_time": 1, "service_type": 1}).to_list(None)
+            built = self._build(appointments)
+            for d in stale:
+                self._days[d] = (now, built.get(d, {}))
+        return {d: self._days[d][1] for d in wanted}
+    
+    async def get_day(self, scheduled_date: str, refresh: bool = False) -> Dict[str, list]:
+        return (await self.load_dates([scheduled_date], refresh=refresh))[scheduled_date]
+    
+    def invalidate(self, *dates):
+        """Drop cached days; with no arguments, drop everything"""
+        if not dates:
+            self._days.clear()
+        for d in dates:
+            self._days.pop(d, None)
+    
+    @staticmethod
+    def find_conflict(day: Dict[str, list], walker_id: str, start: int, end: int, exclude_appt_id: str = None) -> Optional[dict]:
+        """Earliest walk of walker_id whose buffered interval overlaps [start, end)"""
+        entries = day.get(walker_id)
+        if not entries:
+            return None
+        # Only entries whose padded start is before the new walk ends can overlap
+        padded_starts = [e["padded_start"] for e in entries]
+        for entry in entries[:bisect.bisect_left(padded_starts, end)]:
+            if entry["padded_end"] > start and entry["appointment"].get("id") != exclude_appt_id:
+                return entry
+        return None
+    
+    @staticmethod
+    def conflict_result(entry: dict, start: int, end: int) -> dict:
+        """The availability response for a conflicting walk"""
+        appt = entry["appointment"]
+        existing_start, existing_end = entry["start"], entry["end"]
+        # Case 1: New walk starts during or too soon after existing walk
+        if start >= existing_start:
+            message = f"Walker has a walk at {appt.get('scheduled_time')} that ends at {minutes_to_time(existing_end)}. Next walk can start at {minutes_to_time(existing_end + WALK_BUFFER_MINUTES)} (15-min buffer after walk ends)."
+        # Case 2: New walk would end during or too close to existing walk start
+        elif end <= existing_end:
+            message = f"Walker has a walk starting at {appt.get('scheduled_time')}. Your walk would end too close to it (15-min buffer required)."
+        # Case 3: New walk completely overlaps existing walk
+        else:
+            message = f"Walker already has a walk scheduled at {appt.get('scheduled_time')}."
+        return {"available": False, "conflict_time": appt.get("scheduled_time"), "message": message}
+    
+    def free_walkers(self, day: Dict[str, list], walker_ids: List[str], start: int, end: int) -> List[str]:
+        """Subset of walker_ids with no conflicting walk on this day"""
+        return [wid for wid in walker_ids if self.find_conflict(day, wid, start, end) is None]
+
+walker_schedule_index = WalkerScheduleIndex()
+
+async def check_walker_availability(walker_id: str, scheduled_date: str, scheduled_time: str, exclude_appt_id: str = None, service_type: str = 'walk_30', refresh: bool = False) -> dict:
     """
     Check if walker is available at the given time.
     
@@ -2137,70 +2787,20 @@ async def check_walker_availability(walker_id: str, scheduled_date: str, schedul
     Example: If walker has a 30-min walk at 10:00 (ends 10:30),
     next walk can start at 10:45 (10:30 + 15 min buffer)
     But an overnight or day visit can be scheduled at any time.
-    """
-    # Non-walk services can overlap - no conflict checking needed
-    non_conflicting_services = ['overnight', 'stay_overnight', 'stay_extended', 'stay_day', 
-                                 'day_visit', 'petsit_our_location', 'petsit_your_location',
-                                 'doggy_day_camp', 'doggy_day_care', 'transport', 'concierge']
     
-    if service_type in non_conflicting_services:
+    Pass refresh=True when the answer guards a write, so the check reads the
+    database instead of the cached day index.
+    """
+    if service_type in NON_CONFLICTING_SERVICES:
         return {"available": True, "message": "Service type allows overlapping schedules"}
     
     new_walk_start = time_to_minutes(scheduled_time)
-    new_walk_duration = get_walk_duration(service_type)
-    new_walk_end = new_walk_start + new_walk_duration
-    
-    # Get all walker's WALK appointments for that day (only walks conflict with walks)
-    query = {
-        "walker_id": walker_id,
-        "scheduled_date": scheduled_date,
-        "status": {"$nin": ["cancelled", "completed"]},
-        "service_type": {"$regex": "^walk_"}  # Only check against walk services
-    }
-    
-    if exclude_appt_id:
-        query["id"] = {"$ne": exclude_appt_id}
-    
-    existing_appointments = await db.appointments.find(query, {"_id": 0}).to_list(50)
-    
-    buffer_minutes = 15
+    new_walk_end = new_walk_start + get_walk_duration(service_type)
     
-    for appt in existing_appointments:
-        existing_start = time_to_minutes(appt.get("scheduled_time", "00:00"))
-        existing_duration = get_walk_duration(appt.get("service_type", "walk_30"))
-        existing_end = existing_start + existing_duration
-        
-        # Check for overlap or buffer violation
-        # New walk must start at least 15 min after existing walk ends
-        # OR new walk must end at least 15 min before existing walk starts
-        
-        # Case 1: New walk starts during or too soon after existing walk
-        # existing: 10:00-10:30, buffer ends at 10:45
-        # new walk at 10:15 or 10:30 or 10:40 would conflict
-        if new_walk_start < existing_end + buffer_minutes and new_walk_start >= existing_start:
-            return {
-                "available": False,
-                "conflict_time": appt.get("scheduled_time"),
-                "message": f"Walker has a walk at {appt.get('scheduled_time')} that ends at {minutes_to_time(existing_end)}. Next walk can start at {minutes_to_time(existing_end + buffer_minutes)} (15-min buffer after walk ends)."
-            }
-        
-        # Case 2: New walk would end during or too close to existing walk start
-        # existing: 11:00-11:30
-        # new walk 10:30-11:00 would need to end by 10:45 (15 min before 11:00)
-        if new_walk_end > existing_start - buffer_minutes and new_walk_end <= existing_end:
-            return {
-                "available": False,
-                "conflict_time": appt.get("scheduled_time"),
-                "message": f"Walker has a walk starting at {appt.get('scheduled_time')}. Your walk would end too close to it (15-min buffer required)."
-            }
-        
-        # Case 3: New walk completely overlaps existing walk
-        if new_walk_start <= existing_start and new_walk_end >= existing_end:
-            return {
-                "available": False,
-                "conflict_time": appt.get("scheduled_time"),
-                "message": f"Walker already has a walk scheduled at {appt.get('scheduled_time')}."
-            }
+    day = await walker_schedule_index.get_day(scheduled_date, refresh=refresh)
+    conflict = walker_schedule_index.find_conflict(day, walker_id, new_walk_start, new_walk_end, exclude_appt_id)
+    if conflict:
+        return walker_schedule_index.conflict_result(conflict, new_walk_start, new_walk_end)
     
     return {"available": True}
 
@@ -2231,21 +2831,21 @@ async def find_available_walker(
         {"_id": 0, "id": 1, "full_name": 1, "username": 1}
     ).to_list(100)
     
-    available_walkers = []
+    walkers = [w for w in walkers if not (exclude_walker_id and w["id"] == exclude_walker_id)]
     
-    for walker in walkers:
-        if exclude_walker_id and walker["id"] == exclude_walker_id:
-            continue
-        
-        availability = await check_walker_availability(
-            walker["id"], scheduled_date, scheduled_time, service_type=service_type
-        )
-        
-        if availability.get("available"):
-            available_walkers.append({
-                "id": walker["id"],
-                "name": walker.get("full_name") or walker.get("username", "Unknown")
-            })
+    # Answer for every walker from a single day index
+    if service_type in NON_CONFLICTING_SERVICES:
+        free_ids = set(w["id"] for w in walkers)
+    else:
+        start = time_to_minutes(scheduled_time)
+        end = start + get_walk_duration(service_type)
+        day = await walker_schedule_index.get_day(scheduled_date)
+        free_ids = set(walker_schedule_index.free_walkers(day, [w["id"] for w in walkers], start, end))
+    
+    available_walkers = [
+        {"id": w["id"], "name": w.get("full_name") or w.get("username", "Unknown")}
+        for w in walkers if w["id"] in free_ids
+    ]
     
     if available_walkers:
         return {
@@ -2292,15 +2892,19 @@ async def check_schedule_conflicts(
     today = datetime.now(timezone.utc).date()
     today_weekday = today.weekday()
     
+    # Calculate next occurrence of each day
+    day_dates = []
     for day in preferred_days:
         day_num = day_to_num.get(day, 0)
-        # Calculate next occurrence of this day
         days_ahead = day_num - today_weekday
         if days_ahead <= 0:
             days_ahead += 7
-        next_date = today + timedelta(days=days_ahead)
-        date_str = next_date.isoformat()
-        
+        day_dates.append((day, (today + timedelta(days=days_ahead)).isoformat()))
+    
+    # Load every day this check touches with one query
+    await walker_schedule_index.load_dates([date_str for _, date_str in day_dates])
+    
+    for day, date_str in day_dates:
         for walk_time in preferred_times:
             availability = await check_walker_availability(
                 walker_id, date_str, walk_time, service_type=service_type
@@ -2317,16 +2921,24 @@ async def check_schedule_conflicts(
     # Find alternative walkers for conflicting slots
     alternatives = []
     if conflicts:
+        walkers = await db.users.find(
+            {"role": "walker", "is_active": True, "frozen": {"$ne": True}, "id": {"$ne": walker_id}},
+            {"_id": 0, "id": 1, "full_name": 1, "username": 1}
+        ).to_list(100)
+        duration = get_walk_duration(service_type)
         for conflict in conflicts:
-            alt_result = await find_available_walker(
-                conflict["date"], conflict["time"], service_type, exclude_walker_id=walker_id,
-                current_user=current_user
-            )
-            if alt_result.get("found"):
+            day_index = await walker_schedule_index.get_day(conflict["date"])
+            start = time_to_minutes(conflict["time"])
+            free_ids = set(walker_schedule_index.free_walkers(day_index, [w["id"] for w in walkers], start, start + duration))
+            available_walkers = [
+                {"id": w["id"], "name": w.get("full_name") or w.get("username", "Unknown")}
+                for w in walkers if w["id"] in free_ids
+            ]
+            if available_walkers:
                 alternatives.append({
                     "day": conflict["day"],
                     "time": conflict["time"],
-                    "available_walkers": alt_result["available_walkers"]
+                    "available_walkers": available_walkers
                 })
     
     return {
@@ -2335,6 +2947,91 @@ async def check_schedule_conflicts(
         "alternatives": alternatives
     }
 
+class AvailabilityMatrixRequest(BaseModel):
+    dates: List[str]
+    times: List[str]
+    service_types: List[str] = ["walk_30"]
+    walker_ids: Optional[List[str]] = None  # Defaults to all active walkers
+
+@api_router.post("/walkers/availability-matrix")
+async def get_walker_availability_matrix(
+    data: AvailabilityMatrixRequest,
+    current_user: dict = Depends(get_current_user)
+):
+    """
+    Free/busy matrix for many walkers across dates x times x service types.
+
+    Same rules as /walkers/{walker_id}/check-availability, but every date is
+    loaded with a single appointments query instead of one request per cell.
+    Busy cells carry the conflicting appointment.
+    """
+    if current_user['role'] != 'admin':
+        raise HTTPException(status_code=403, detail="Admin only")
+
+    dates = list(dict.fromkeys(data.dates))
+    times = list(dict.fromkeys(data.times))
+    service_types = list(dict.fromkeys(data.service_types))
+    for date_str in dates:
+        try:
+            datetime.strptime(date_str, "%Y-%m-%d")
+        except ValueError:
+            raise HTTPException(status_code=400, detail=f"Invalid date: {date_str}")
+    for time_str in times:
+        try:
+            datetime.strptime(time_str, "%H:%M")
+        except ValueError:
+            raise HTTPException(status_code=400, detail=f"Invalid time: {time_str}")
+    if len(dates) * len(times) * len(service_types) > 5000:
+        raise HTTPException(status_code=400, detail="Matrix too large; request at most 5000 cells per walker")
+
+    walker_query = {"role": "walker", "is_active": True, "frozen": {"$ne": True}}
+    if data.walker_ids is not None:
+        walker_query["id"] = {"$in": data.walker_ids}
+    walkers = await db.users.find(
+        walker_query,
+        {"_id": 0, "id": 1, "full_name": 1, "username": 1, "walker_color": 1}
+    ).to_list(None)
+
+    days = await walker_schedule_index.load_dates(dates)
+
+    result = []
+    for walker in walkers:
+        cells = []
+        for date_str in dates:
+            day = days[date_str]
+            for time_str in times:
+                start = time_to_minutes(time_str)
+                for service_type in service_types:
+                    cell = {"date": date_str, "time": time_str, "service_type": service_type, "available": True, "conflict": None}
+                    if service_type not in NON_CONFLICTING_SERVICES:
+                        end = start + get_walk_duration(service_type)
+                        entry = walker_schedule_index.find_conflict(day, walker["id"], start, end)
+                        if entry:
+                            appt = entry["appointment"]
+                            cell["available"] = False
+                            cell["conflict"] = {
+                                "appointment_id": appt.get("id"),
+                                "client_id": appt.get("client_id"),
+                                "scheduled_time": appt.get("scheduled_time"),
+                                "service_type": appt.get("service_type"),
+                                "end_time": minutes_to_time(entry["end"]),
+                                "message": walker_schedule_index.conflict_result(entry, start, end)["message"],
+                            }
+                    cells.append(cell)
+        result.append({
+            "walker_id": walker["id"],
+            "walker_name": walker.get("full_name") or walker.get("username", "Unknown"),
+            "walker_color": walker.get("walker_color"),
+            "cells": cells,
+        })
+
+    return {
+        "dates": dates,
+        "times": times,
+        "service_types": service_types,
+        "walkers": result,
+    }
+
 # Appointment Routes
 @api_router.post("/appointments", response_model=Appointment)
 async def create_appointment(appt_data: AppointmentCreate, current_user: dict = Depends(get_current_user)):
@@ -2344,7 +3041,8 @@ async def create_appointment(appt_data: AppointmentCreate, current_user: dict =
             appt_data.walker_id, 
             appt_data.scheduled_date, 
             appt_data.scheduled_time,
-            service_type=appt_data.service_type
+            service_type=appt_data.service_type,
+            refresh=True
         )
         if not availability["available"]:
             raise HTTPException(status_code=400, detail=availability["message"])
@@ -2356,6 +3054,7 @@ async def create_appointment(appt_data: AppointmentCreate, current_user: dict =
     appt_dict = appointment.model_dump()
     appt_dict['created_at'] = appt_dict['created_at'].isoformat()
     await db.appointments.insert_one(appt_dict)
+    walker_schedule_index.invalidate(appt_dict['scheduled_date'])
     return appointment
 
 # Recurring Schedule Routes
@@ -2380,6 +3079,7 @@ async def create_recurring_schedule(schedule_data: RecurringScheduleCreate, curr
         schedule_dict['stopped_at'] = schedule_dict['stopped_at'].isoformat()
     
     await db.recurring_schedules.insert_one(schedule_dict)
+    recurring_scheduler.wake()
     
     # Return the created schedule from database to avoid serialization issues
     created_schedule = await db.recurring_schedules.find_one({"id": schedule.id}, {"_id": 0})
@@ -2441,6 +3141,7 @@ async def pause_recurring_schedule(schedule_id: str, pause_data: dict = None, cu
             },
             {"$set": {"status": "cancelled", "cancellation_reason": f"Schedule paused: {pause_data.get('reason', 'No reason provided')}"}}
         )
+        walker_schedule_index.invalidate()
     
     return {"message": "Schedule paused successfully"}
 
@@ -2458,6 +3159,7 @@ async def resume_recurring_schedule(schedule_id: str, current_user: dict = Depen
         {"id": schedule_id},
         {"$set": {"status": "active", "paused_at": None}}
     )
+    recurring_scheduler.wake()
     return {"message": "Schedule resumed"}
 
 @api_router.put("/recurring-schedules/{schedule_id}/stop")
@@ -2537,18 +3239,57 @@ async def update_recurring_schedule(
             "created_at": datetime.now(timezone.utc).isoformat()
         }
         await db.appointments.insert_one(exception_appt)
+        walker_schedule_index.invalidate(specific_date)
         return {"message": "One-time change created", "appointment": exception_appt}
     else:
         # Update the recurring schedule for all future appointments
         allowed_fields = ['walker_id', 'pet_ids', 'service_type', 'scheduled_time', 'day_of_week', 'notes']
         update_dict = {k: v for k, v in update_data.items() if k in allowed_fields}
+        update_ops = {"$set": update_dict}
+        # A new day, time or service means different appointments; regenerate from today
+        regenerate = any(k in update_dict for k in ['service_type', 'scheduled_time', 'day_of_week'])
+        if regenerate:
+            update_ops["$unset"] = {"materialized_through": ""}
         
-        await db.recurring_schedules.update_one(
-            {"id": schedule_id},
-            {"$set": update_dict}
-        )
+        await db.recurring_schedules.update_one({"id": schedule_id}, update_ops)
+        if regenerate:
+            await delete_future_schedule_appointments(schedule)
+        recurring_scheduler.wake()
         return {"message": "Schedule updated for all future appointments"}
 
+async def delete_future_schedule_appointments(schedule: dict) -> int:
+    """
+    Delete the not-yet-started appointments generated from a schedule, from today on.
+    
+    Rows generated before recurring_schedule_id was stamped are matched by client,
+    service, time and weekday instead. One-time exceptions are kept.
+    """
+    today = datetime.now(timezone.utc).strftime("%Y-%m-%d")
+    future = await db.appointments.find({
+        "client_id": schedule['client_id'],
+        "status": "scheduled",
+        "scheduled_date": {"$gte": today},
+        "is_recurring": True,
+        "is_one_time_exception": {"$ne": True},
+        "$or": [
+            {"recurring_schedule_id": schedule['id']},
+            {"recurring_schedule_id": {"$exists": False},
+             "service_type": schedule.get('service_type'),
+             "scheduled_time": schedule.get('scheduled_time')}
+        ]
+    }, {"_id": 0, "id": 1, "scheduled_date": 1, "recurring_schedule_id": 1}).to_list(None)
+    
+    stale = [
+        appt for appt in future
+        if appt.get('recurring_schedule_id') == schedule['id']
+        or datetime.strptime(appt['scheduled_date'], "%Y-%m-%d").weekday() == schedule.get('day_of_week', 0)
+    ]
+    if not stale:
+        return 0
+    await db.appointments.delete_many({"id": {"$in": [appt['id'] for appt in stale]}, "status": "scheduled"})
+    walker_schedule_index.invalidate(*{appt['scheduled_date'] for appt in stale})
+    return len(stale)
+
 @api_router.put("/recurring-schedules/{schedule_id}/change-walker")
 async def change_recurring_schedule_walker(
     schedule_id: str,
@@ -2601,6 +3342,7 @@ async def change_recurring_schedule_walker(
                 {"id": existing_exception["id"]},
                 {"$set": {"walker_id": walker_id}}
             )
+            walker_schedule_index.invalidate(specific_date)
             return {
                 "message": f"Walker changed for {specific_date} only. Original walker will resume next week.",
                 "change_type": "one_time",
@@ -2626,6 +3368,7 @@ async def change_recurring_schedule_walker(
                 "created_at": datetime.now(timezone.utc).isoformat()
             }
             await db.appointments.insert_one(exception_appt)
+            walker_schedule_index.invalidate(specific_date)
             
             return {
                 "message": f"Walker changed for {specific_date} only. Original walker will resume next week.",
@@ -2737,6 +3480,7 @@ async def cancel_appointment(
         {"id": appointment_id},
         {"$set": {"status": "cancelled"}}
     )
+    walker_schedule_index.invalidate(appointment.get('scheduled_date'))
     
     # If recurring and cancelling future, stop the recurring schedule
     if cancel_type == "future" and appointment.get('recurring_schedule_id'):
@@ -2748,15 +3492,118 @@ async def cancel_appointment(
     
     return {"message": "Appointment cancelled"}
 
+# Keyset pagination helpers
+def encode_cursor(values: list) -> str:
+    """Opaque, URL-safe cursor for the given sort-key values"""
+    return base64.urlsafe_b64encode(json.dumps(values).encode()).decode().rstrip("=")
+
+def decode_cursor(cursor: str, size: int) -> list:
+    """Decode a cursor made by encode_cursor, raising 400 if it was tampered with"""
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    if not isinstance(values, list) or len(values) != size:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    return values
+
+# Fields every appointment page returns, whatever projection was requested:
+# the Appointment model requires them and the cursor/enrichment read them.
+APPOINTMENT_BASE_FIELDS = ["id", "client_id", "walker_id", "pet_ids", "service_type", "scheduled_date", "scheduled_time", "status"]
+
+async def find_appointments_page(
+    query: dict,
+    response: Response,
+    start: Optional[str] = None,
+    end: Optional[str] = None,
+    fields: Optional[str] = None,
+    cursor: Optional[str] = None,
+    limit: int = 500
+) -> List[dict]:
+    """
+    Fetch one page of appointments ordered by (scheduled_date, scheduled_time, id).
+    - start/end: inclusive YYYY-MM-DD bounds on scheduled_date
+    - fields: comma-separated projection (APPOINTMENT_BASE_FIELDS are always included)
+    - cursor: value of the X-Next-Cursor header from the previous page
+    When more results remain, the next cursor is returned in the X-Next-Cursor header.
+    """
+    from datetime import date
+    
+    query = dict(query)
+    conditions = []
+    
+    date_range = {}
+    for op, value in (("$gte", start), ("$lte", end)):
+        if value:
+            try:
+                date.fromisoformat(value)
+            except ValueError:
+                raise HTTPException(status_code=400, detail="Invalid date format. Use YYYY-MM-DD")
+            date_range[op] = value
+    if date_range:
+        conditions.append({"scheduled_date": date_range})
+    
+    if cursor:
+        last_date, last_time, last_id = decode_cursor(cursor, 3)
+        if last_time is None:
+            # Null/missing times sort before every string, so the rest of this
+            # day is the remaining untimed rows plus every timed row
+            conditions.append({"$or": [
+                {"scheduled_date": {"$gt": last_date}},
+                {"scheduled_date": last_date, "scheduled_time": {"$type": "string"}},
+                {"scheduled_date": last_date, "scheduled_time": None, "id": {"$gt": last_id}}
+            ]})
+        else:
+            conditions.append({"$or": [
+                {"scheduled_date": {"$gt": last_date}},
+                {"scheduled_date": last_date, "scheduled_time": {"$gt": last_time}},
+                {"scheduled_date": last_date, "scheduled_time": last_time, "id": {"$gt": last_id}}
+            ]})
+    
+    if conditions:
+        query["$and"] = query.get("$and", []) + conditions
+    
+    projection = dict(APPOINTMENT_LIST_PROJECTION)
+    if fields:
+        projection = {"_id": 0}
+        requested = [f.strip() for f in fields.split(",") if f.strip() and not f.strip().startswith("_")]
+        projection.update({f: 1 for f in set(requested + APPOINTMENT_BASE_FIELDS)})
+    
+    appointments = await db.appointments.find(query, projection).sort(
+        [("scheduled_date", 1), ("scheduled_time", 1), ("id", 1)]
+    ).limit(limit + 1).to_list(limit + 1)
+    
+    if len(appointments) > limit:
+        appointments = appointments[:limit]
+        last = appointments[-1]
+        response.headers["X-Next-Cursor"] = encode_cursor([
+            last.get("scheduled_date") or "", last.get("scheduled_time"), last.get("id")
+        ])
+    
+    return appointments
+
 @api_router.get("/appointments", response_model=List[Appointment])
-async def get_appointments(current_user: dict = Depends(get_current_user)):
+async def get_appointments(
+    response: Response,
+    start: Optional[str] = None,
+    end: Optional[str] = None,
+    fields: Optional[str] = None,
+    cursor: Optional[str] = None,
+    limit: int = Query(500, ge=1, le=1000),
+    current_user: dict = Depends(get_current_user)
+):
     query = {}
     if current_user['role'] == 'client':
         query['client_id'] = current_user['id']
     elif current_user['role'] == 'walker':
         query['walker_id'] = current_user['id']
     
-    appointments = await db.appointments.find(query, {"_id": 0}).to_list(500)
+    appointments = await find_appointments_page(query, response, start, end, fields, cursor, limit)
+    
+    # Resolve every walker name in one query
+    loader = EnrichmentLoader(user_projection={"_id": 0, "full_name": 1})
+    loader.add_user_ids(*[appt.get('walker_id') for appt in appointments])
+    await loader.load()
     
     # Enrich appointments with walker name and formatted completion data
     enriched_appointments = []
@@ -2765,8 +3612,7 @@ async def get_appointments(current_user: dict = Depends(get_current_user)):
         
         # Add walker name
         if appt.get('walker_id'):
-            walker = await db.users.find_one({"id": appt['walker_id']}, {"_id": 0, "full_name": 1})
-            enriched['walker_name'] = walker.get('full_name') if walker else None
+            enriched['walker_name'] = loader.user_name(appt['walker_id'])
         
         # Format completion data for completed walks
         if appt.get('status') == 'completed' and appt.get('completion_data'):
@@ -2783,78 +3629,141 @@ async def get_appointments(current_user: dict = Depends(get_current_user)):
         
         enriched_appointments.append(enriched)
     
+    if fields:
+        # A projection returns only the requested fields; running it through the
+        # Appointment model would fill the rest in with made-up defaults
+        headers = {"X-Next-Cursor": response.headers["X-Next-Cursor"]} if "X-Next-Cursor" in response.headers else None
+        return JSONResponse(jsonable_encoder(enriched_appointments), headers=headers)
     return enriched_appointments
 
 @api_router.get("/appointments/calendar")
-async def get_calendar_appointments(current_user: dict = Depends(get_current_user)):
+async def get_calendar_appointments(
+    response: Response,
+    start: Optional[str] = None,
+    end: Optional[str] = None,
+    fields: Optional[str] = None,
+    cursor: Optional[str] = None,
+    limit: int = Query(500, ge=1, le=1000),
+    current_user: dict = Depends(get_current_user)
+):
+    """
+    Calendar events for the current user. Pass start/end (YYYY-MM-DD) to load only
+    the visible week or month; follow X-Next-Cursor to page through larger ranges.
+    """
     query = {}
     if current_user['role'] == 'client':
         query['client_id'] = current_user['id']
     elif current_user['role'] == 'walker':
         query['walker_id'] = current_user['id']
     
-    appointments = await db.appointments.find(query, {"_id": 0}).to_list(500)
+    appointments = await find_appointments_page(query, response, start, end, fields, cursor, limit)
+    
+    # Resolve client, walker and pet names with one query per collection
+    loader = EnrichmentLoader(user_projection={"_id": 0, "full_name": 1}, pet_projection={"_id": 0, "name": 1})
+    loader.add_appointments(appointments)
+    await loader.load()
     
     # Format for calendar view
     calendar_events = []
     for appt in appointments:
-        client = await db.users.find_one({"id": appt['client_id']}, {"_id": 0, "full_name": 1})
-        walker = None
-        if appt.get('walker_id'):
-            walker = await db.users.find_one({"id": appt['walker_id']}, {"_id": 0, "full_name": 1})
-        
-        # Get pet names for this appointment
-        pet_names = []
-        if appt.get('pet_ids'):
-            for pet_id in appt['pet_ids']:
-                pet = await db.pets.find_one({"id": pet_id}, {"_id": 0, "name": 1})
-                if pet:
-                    pet_names.append(pet['name'])
-        
         calendar_events.append({
             **appt,
-            "client_name": client.get('full_name') if client else "Unknown",
-            "walker_name": walker.get('full_name') if walker else "Unassigned",
-            "pet_names": pet_names
+            "client_name": loader.user_name(appt['client_id'], "Unknown"),
+            "walker_name": loader.user_name(appt.get('walker_id'), "Unassigned"),
+            "pet_names": loader.pet_names(appt.get('pet_ids'))
         })
     return calendar_events
 
 # Get available time slots for a date
+# 15-minute booking slots from 6:00 AM to 8:45 PM, as minutes since midnight
+BOOKING_SLOT_LENGTH = 15
+BOOKING_SLOT_MINUTES = np.arange(6 * 60, 21 * 60, BOOKING_SLOT_LENGTH)
+SLOT_FULL_COUNT = 3
+
+def compute_slot_occupancy(appointments: List[dict], dates: List[str], walker_ids: List[str]):
+    """
+    Per-slot booking counts and walker occupancy for a set of days in one pass.
+    
+    An appointment occupies every slot it overlaps, from the slot containing its
+    start up to the one containing start + get_walk_duration, so a 60-minute walk
+    at 10:00 counts toward 10:00, 10:15, 10:30 and 10:45, and one at 10:05 also
+    counts toward 11:00. Each appointment adds +1/-1 at the slot positions it
+    starts and stops covering, and a cumulative sum over the slot axis yields the
+    occupancy for all slots at once.
+    
+    Returns (booked, walker_busy): int array [day, slot] and bool array [day, walker, slot].
+    """
+    n_slots = len(BOOKING_SLOT_MINUTES)
+    day_pos = {d: i for i, d in enumerate(dates)}
+    walker_pos = {w: i for i, w in enumerate(walker_ids)}
+    
+    appts = [a for a in appointments if a.get("scheduled_date") in day_pos]
+    day_idx = np.fromiter((day_pos[a["scheduled_date"]] for a in appts), dtype=np.intp, count=len(appts))
+    starts = np.fromiter((time_to_minutes(a.get("scheduled_time") or "00:00") for a in appts), dtype=np.int64, count=len(appts))
+    ends = starts + np.fromiter((get_walk_duration(a.get("service_type")) for a in appts), dtype=np.int64, count=len(appts))
+    # First slot ending after the start (floor), first slot starting at or after the end (ceil)
+    first = np.searchsorted(BOOKING_SLOT_MINUTES + BOOKING_SLOT_LENGTH, starts, side="right")
+    last = np.searchsorted(BOOKING_SLOT_MINUTES, ends, side="left")
+    
+    delta = np.zeros((len(dates), n_slots + 1), dtype=np.int64)
+    np.add.at(delta, (day_idx, first), 1)
+    np.add.at(delta, (day_idx, last), -1)
+    booked = np.cumsum(delta, axis=1)[:, :n_slots]
+    
+    walker_idx = np.fromiter((walker_pos.get(a.get("walker_id"), -1) for a in appts), dtype=np.intp, count=len(appts))
+    assigned = walker_idx >= 0
+    walker_delta = np.zeros((len(dates), len(walker_ids), n_slots + 1), dtype=np.int64)
+    np.add.at(walker_delta, (day_idx[assigned], walker_idx[assigned], first[assigned]), 1)
+    np.add.at(walker_delta, (day_idx[assigned], walker_idx[assigned], last[assigned]), -1)
+    walker_busy = np.cumsum(walker_delta, axis=2)[:, :, :n_slots] > 0
+    
+    return booked, walker_busy
+
 @api_router.get("/appointments/available-slots")
-async def get_available_slots(date: str, current_user: dict = Depends(get_current_user)):
-    """Get available time slots and walker availability for a given date"""
-    # Generate 15-minute increment time slots from 6:00 AM to 8:00 PM
-    time_slots = []
-    for hour in range(6, 21):  # 6 AM to 8 PM
-        for minute in [0, 15, 30, 45]:
-            time_slots.append(f"{hour:02d}:{minute:02d}")
-    
-    # Get all appointments for this date
+async def get_available_slots(date: str, end_date: Optional[str] = None, current_user: dict = Depends(get_current_user)):
+    """
+    Get available time slots and walker availability for a given date.
+    
+    Pass end_date to get every day from date through end_date (up to 62 days)
+    as {"start_date", "end_date", "days": [{"date", "slots"}, ...]}.
+    """
+    try:
+        first_day = datetime.strptime(date, "%Y-%m-%d").date()
+        last_day = datetime.strptime(end_date, "%Y-%m-%d").date() if end_date else first_day
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Dates must be YYYY-MM-DD")
+    if last_day < first_day or (last_day - first_day).days >= 62:
+        raise HTTPException(status_code=400, detail="end_date must be within 62 days after date")
+    dates = [(first_day + timedelta(days=i)).isoformat() for i in range((last_day - first_day).days + 1)]
+    
+    # Get all appointments for these dates
     appointments = await db.appointments.find({
-        "scheduled_date": date,
+        "scheduled_date": {"$gte": dates[0], "$lte": dates[-1]},
         "status": {"$nin": ["cancelled"]}
-    }, {"_id": 0}).to_list(100)
+    }, {"_id": 0, "scheduled_date": 1, "scheduled_time": 1, "service_type": 1, "walker_id": 1}).to_list(None)
     
     # Get all walkers
-    walkers = await db.users.find({"role": "walker", "is_active": True}, {"_id": 0, "password_hash": 0}).to_list(100)
-    
-    slot_info = []
-    for slot in time_slots:
-        appts_at_slot = [a for a in appointments if a.get('scheduled_time') == slot]
-        slot_count = len(appts_at_slot)
-        
-        # Find available walkers for this slot
-        booked_walker_ids = [a.get('walker_id') for a in appts_at_slot if a.get('walker_id')]
-        available_walkers = [w for w in walkers if w['id'] not in booked_walker_ids]
-        
-        slot_info.append({
-            "time": slot,
-            "booked_count": slot_count,
-            "is_full": slot_count >= 3,
-            "available_walkers": available_walkers
-        })
+    walkers = await db.users.find({"role": "walker", "is_active": True}, {"_id": 0, "password_hash": 0}).to_list(None)
+    
+    booked, walker_busy = compute_slot_occupancy(appointments, dates, [w["id"] for w in walkers])
+    slot_times = [minutes_to_time(int(m)) for m in BOOKING_SLOT_MINUTES]
+    
+    days = []
+    for d, date_str in enumerate(dates):
+        slot_info = []
+        for s, slot in enumerate(slot_times):
+            slot_count = int(booked[d, s])
+            slot_info.append({
+                "time": slot,
+                "booked_count": slot_count,
+                "is_full": slot_count >= SLOT_FULL_COUNT,
+                "available_walkers": [w for w, busy in zip(walkers, walker_busy[d, :, s]) if not busy]
+            })
+        days.append({"date": date_str, "slots": slot_info})
     
-    return {"date": date, "slots": slot_info}
+    if end_date:
+        return {"start_date": dates[0], "end_date": dates[-1], "days": days}
+    return days[0]
 
 # Get appointments needing reassignment - Must be before parameterized route
 @api_router.get("/appointments/needs-reassignment")
@@ -2865,16 +3774,17 @@ async def get_appointments_needing_reassignment(current_user: dict = Depends(get
     
     appts = await db.appointments.find(
         {"needs_reassignment": True, "status": "scheduled"},
-        {"_id": 0}
+        APPOINTMENT_LIST_PROJECTION
     ).to_list(1000)
     
     # Enrich with client and walker info
+    loader = EnrichmentLoader()
+    loader.add_appointments(appts)
+    await loader.load()
     for appt in appts:
-        client = await db.users.find_one({"id": appt["client_id"]}, {"_id": 0, "password_hash": 0})
-        appt["client"] = client
+        appt["client"] = loader.user(appt["client_id"])
         if appt.get("walker_id"):
-            walker = await db.users.find_one({"id": appt["walker_id"]}, {"_id": 0, "password_hash": 0})
-            appt["original_walker"] = walker
+            appt["original_walker"] = loader.user(appt["walker_id"])
     
     return appts
 
@@ -2935,7 +3845,8 @@ async def update_appointment(appt_id: str, update_data: dict, current_user: dict
         availability = await check_walker_availability(
             new_walker, new_date, new_time, 
             exclude_appt_id=appt_id,
-            service_type=new_service
+            service_type=new_service,
+            refresh=True
         )
         if not availability["available"]:
             raise HTTPException(status_code=400, detail=availability["message"])
@@ -2944,6 +3855,9 @@ async def update_appointment(appt_id: str, update_data: dict, current_user: dict
     update_dict = {k: v for k, v in update_data.items() if k in allowed_fields}
     
     await db.appointments.update_one({"id": appt_id}, {"$set": update_dict})
+    walker_schedule_index.invalidate(appt.get('scheduled_date'), new_date)
+    if appt.get('status') == 'completed' or update_dict.get('status') == 'completed':
+        await sync_payroll_ledger([appt_id])
     
     updated_appt = await db.appointments.find_one({"id": appt_id}, {"_id": 0})
     return updated_appt
@@ -2963,7 +3877,8 @@ async def admin_create_appointment(appt_data: dict, current_user: dict = Depends
     if walker_id:
         availability = await check_walker_availability(
             walker_id, scheduled_date, scheduled_time,
-            service_type=service_type
+            service_type=service_type,
+            refresh=True
         )
         if not availability["available"]:
             raise HTTPException(status_code=400, detail=availability["message"])
@@ -2980,6 +3895,7 @@ async def admin_create_appointment(appt_data: dict, current_user: dict = Depends
     appt_dict = appointment.model_dump()
     appt_dict['created_at'] = appt_dict['created_at'].isoformat()
     await db.appointments.insert_one(appt_dict)
+    walker_schedule_index.invalidate(scheduled_date)
     return appointment
 
 @api_router.post("/appointments/{appt_id}/start")
@@ -2992,6 +3908,7 @@ async def start_walk(appt_id: str, current_user: dict = Depends(get_current_user
         {"id": appt_id},
         {"$set": {"status": "in_progress", "start_time": start_time, "walker_id": current_user['id']}}
     )
+    walker_schedule_index.invalidate()
     return {"message": "Walk started", "start_time": start_time}
 
 @api_router.post("/appointments/{appt_id}/end")
@@ -3016,6 +3933,9 @@ async def end_walk(appt_id: str, current_user: dict = Depends(get_current_user))
             "is_tracking": False
         }}
     )
+    walker_schedule_index.invalidate(appt.get('scheduled_date'))
+    active_walks.stop(appt_id)
+    await sync_payroll_ledger([appt_id])
     return {"message": "Walk completed", "duration_minutes": duration}
 
 # Walk completion with questionnaire
@@ -3051,6 +3971,9 @@ async def complete_walk(appt_id: str, completion_data: WalkCompletionData = None
         }
     
     await db.appointments.update_one({"id": appt_id}, {"$set": update_data})
+    walker_schedule_index.invalidate(appt.get('scheduled_date'))
+    active_walks.stop(appt_id)
+    await sync_payroll_ledger([appt_id])
     
     return {"message": "Walk completed successfully", "completion_data": update_data.get("completion_data")}
 
@@ -3060,36 +3983,416 @@ async def assign_walker(appt_id: str, walker_id: str, current_user: dict = Depen
         raise HTTPException(status_code=403, detail="Admin only")
     
     await db.appointments.update_one({"id": appt_id}, {"$set": {"walker_id": walker_id}})
+    walker_schedule_index.invalidate()
     return {"message": "Walker assigned successfully"}
 
 # GPS Walk Tracking Routes
-import math
+EARTH_RADIUS_METERS = 6371000
 
-def calculate_distance(coords: List[Dict]) -> float:
-    """Calculate total distance in meters from GPS coordinates using Haversine formula"""
-    if len(coords) < 2:
-        return 0.0
+# Segments faster than this are GPS jitter (or the walker got in a car) and
+# don't count toward walk distance; ~29 km/h by default
+GPS_MAX_SPEED_MPS = float(os.environ.get('GPS_MAX_SPEED_MPS', '8'))
+# Slower than this counts as standing still for moving time and pace
+GPS_MOVING_SPEED_MPS = 0.2
+
+def parse_gps_timestamp(value: str) -> datetime:
+    """
+    Parse a client ISO timestamp into UTC; naive values are taken as UTC.
+    
+    Stored points use the UTC isoformat of the result, so their timestamp strings
+    sort chronologically and one instant always has one spelling.
+    """
+    parsed = datetime.fromisoformat(value.replace('Z', '+00:00'))
+    return parsed.astimezone(timezone.utc) if parsed.tzinfo else parsed.replace(tzinfo=timezone.utc)
+
+def segment_distances(lat, lng) -> np.ndarray:
+    """Haversine distance in meters between consecutive points (degree arrays)"""
+    lat, lng = np.radians(np.asarray(lat, dtype=float)), np.radians(np.asarray(lng, dtype=float))
+    dlat = np.diff(lat)
+    dlng = np.diff(lng)
+    h = np.sin(dlat / 2) ** 2 + np.cos(lat[:-1]) * np.cos(lat[1:]) * np.sin(dlng / 2) ** 2
+    return 2 * EARTH_RADIUS_METERS * np.arctan2(np.sqrt(h), np.sqrt(1 - h))
+
+def route_metrics(points: List[Dict], max_speed_mps: float = GPS_MAX_SPEED_MPS) -> dict:
+    """
+    Distance, speed and pace for a route in one vectorized pass.
+    
+    Per segment (len n-1): segment_meters, elapsed_seconds (nan when a timestamp is
+    missing or unparseable), speed_mps, and valid (False when the implied speed is
+    impossible). Per point (len n): cumulative_meters over valid segments and
+    pace_min_per_km of the segment ending there (nan for the first point or when
+    stationary), and spike, marking isolated jitter points whose segments in and
+    out are both invalid. distance_meters sums the valid segments only.
+    """
+    n = len(points)
+    if n < 2:
+        return {
+            "segment_meters": np.zeros(0), "elapsed_seconds": np.zeros(0), "speed_mps": np.zeros(0),
+            "valid": np.zeros(0, dtype=bool), "cumulative_meters": np.zeros(n), "pace_min_per_km": np.full(n, np.nan),
+            "spike": np.zeros(n, dtype=bool), "distance_meters": 0.0,
+        }
     
-    total_distance = 0.0
-    R = 6371000  # Earth's radius in meters
+    meters = segment_distances([p['lat'] for p in points], [p['lng'] for p in points])
     
-    for i in range(1, len(coords)):
-        lat1, lon1 = math.radians(coords[i-1]['lat']), math.radians(coords[i-1]['lng'])
-        lat2, lon2 = math.radians(coords[i]['lat']), math.radians(coords[i]['lng'])
-        
-        dlat = lat2 - lat1
-        dlon = lon2 - lon1
-        
-        a = math.sin(dlat/2)**2 + math.cos(lat1) * math.cos(lat2) * math.sin(dlon/2)**2
-        c = 2 * math.atan2(math.sqrt(a), math.sqrt(1-a))
-        
-        total_distance += R * c
+    seconds = np.full(n, np.nan)
+    for i, p in enumerate(points):
+        try:
+            seconds[i] = parse_gps_timestamp(p['timestamp']).timestamp()
+        except (KeyError, TypeError, ValueError, AttributeError):
+            pass
+    elapsed = np.diff(seconds)
+    
+    with np.errstate(divide='ignore', invalid='ignore'):
+        speed = np.where(elapsed > 0, meters / elapsed, np.nan)
+        # Unknown or zero elapsed time: trust the segment
+        valid = ~(speed > max_speed_mps)
+        pace = np.concatenate([[np.nan], np.where(speed > 0, 1000 / speed / 60, np.nan)])
+    
+    cumulative = np.concatenate([[0.0], np.cumsum(np.where(valid, meters, 0.0))])
+    spike = np.zeros(n, dtype=bool)
+    spike[1:-1] = ~valid[:-1] & ~valid[1:]
     
-    return round(total_distance, 2)
+    return {
+        "segment_meters": meters,
+        "elapsed_seconds": elapsed,
+        "speed_mps": speed,
+        "valid": valid,
+        "cumulative_meters": cumulative,
+        "pace_min_per_km": pace,
+        "spike": spike,
+        "distance_meters": float(cumulative[-1]),
+    }
+
+def route_stats(points: List[Dict]) -> dict:
+    """Summary analytics for a route: distance, moving time, speed and pace"""
+    metrics = route_metrics(points)
+    with np.errstate(invalid='ignore'):
+        moving = metrics["valid"] & (metrics["speed_mps"] >= GPS_MOVING_SPEED_MPS)
+    moving_seconds = float(np.nansum(metrics["elapsed_seconds"][moving]))
+    moving_meters = float(metrics["segment_meters"][moving].sum())
+    avg_speed = moving_meters / moving_seconds if moving_seconds > 0 else None
+    return {
+        "distance_meters": round(metrics["distance_meters"], 2),
+        "moving_seconds": round(moving_seconds),
+        "avg_speed_mps": round(avg_speed, 2) if avg_speed else None,
+        "avg_pace_min_per_km": round(1000 / avg_speed / 60, 2) if avg_speed else None,
+        "max_speed_mps": round(float(np.nanmax(metrics["speed_mps"][moving])), 2) if moving.any() else None,
+        "outlier_segments": int((~metrics["valid"]).sum()),
+    }
+
+def calculate_distance(coords: List[Dict]) -> float:
+    """Calculate total distance in meters from GPS coordinates, ignoring jitter outliers"""
+    return round(route_metrics(coords)["distance_meters"], 2)
+
+# GPS points are stored one per document in walk_points ({appointment_id, lat,
+# lng, timestamp}); the appointment keeps only a summary: distance_meters,
+# gps_point_count, last_point and gps_bbox. Walks recorded before walk_points
+# still embed gps_route until the walk_points migration moves them, so this
+# projection keeps any such route out of appointment reads.
+TRACKING_PROJECTION = {"_id": 0, "gps_route": 0}
+
+# Appointment lists (calendar, billing, schedules) also leave out the stored
+# route of completed walks; the walk endpoints read it when needed.
+APPOINTMENT_LIST_PROJECTION = {"_id": 0, "gps_route": 0, "gps_route_simplified": 0, "gps_polyline": 0}
+
+async def get_last_gps_point(appt: dict) -> Optional[Dict]:
+    """Last recorded point of a walk, from last_point or (unmigrated walks) the route tail"""
+    if appt.get('last_point'):
+        return appt['last_point']
+    if 'gps_route' in appt:
+        return appt['gps_route'][-1] if appt['gps_route'] else None
+    tail = await db.appointments.find_one({"id": appt['id']}, {"_id": 0, "gps_route": {"$slice": -1}})
+    route = (tail or {}).get('gps_route') or []
+    return route[-1] if route else None
+
+async def insert_walk_points(appt_id: str, points: List[Dict]) -> List[Dict]:
+    """Store points in walk_points; returns the ones that were new (same timestamp = duplicate)"""
+    docs = [{"appointment_id": appt_id, "lat": p["lat"], "lng": p["lng"], "timestamp": p["timestamp"]} for p in points]
+    if not docs:
+        return []
+    try:
+        await db.walk_points.insert_many(docs, ordered=False)
+        return points
+    except BulkWriteError as e:
+        errors = e.details.get("writeErrors", [])
+        if any(err.get("code") != 11000 for err in errors):
+            raise
+        rejected = {err.get("index") for err in errors}
+        return [p for i, p in enumerate(points) if i not in rejected]
+
+def gps_summary_update(points: List[Dict], distance_delta: float, point_count: int) -> dict:
+    """Appointment update that folds new points into the tracking summary"""
+    return {
+        "$inc": {"distance_meters": distance_delta, "gps_point_count": point_count},
+        "$set": {"last_point": points[-1]},
+        "$min": {"gps_bbox.min_lat": min(p["lat"] for p in points), "gps_bbox.min_lng": min(p["lng"] for p in points)},
+        "$max": {"gps_bbox.max_lat": max(p["lat"] for p in points), "gps_bbox.max_lng": max(p["lng"] for p in points)},
+    }
+
+async def append_gps_points(appt: dict, points: List[Dict]) -> dict:
+    """
+    Append points (already in time order) to a walk: one insert into walk_points
+    and one summary update adding the distance from the walk's last point
+    through the new ones. Returns the updated distance_meters and gps_point_count.
+    """
+    last_point = await get_last_gps_point(appt)
+    # Retried batches may resend stored points; only new ones add distance
+    points = await insert_walk_points(appt['id'], points)
+    if not points:
+        return await db.appointments.find_one(
+            {"id": appt['id']}, {"_id": 0, "distance_meters": 1, "gps_point_count": 1}
+        )
+    delta = route_metrics(([last_point] if last_point else []) + points)["distance_meters"]
+    
+    updated = await db.appointments.find_one_and_update(
+        {"id": appt['id']},
+        gps_summary_update(points, delta, len(points)),
+        projection={"_id": 0, "distance_meters": 1, "gps_point_count": 1},
+        return_document=ReturnDocument.AFTER
+    )
+    live_hub.publish(f"walk:{appt['id']}", {
+        "type": "points",
+        "appointment_id": appt['id'],
+        "points": points,
+        "distance_meters": round(updated.get('distance_meters', 0), 2),
+        "point_count": updated.get('gps_point_count', 0),
+    })
+    await active_walks.move(appt['id'], points[-1], updated.get('distance_meters', 0), updated.get('gps_point_count', 0))
+    return updated
+
+async def load_gps_routes(appt_ids: List[str]) -> Dict[str, List[Dict]]:
+    """Full routes for several walks with one walk_points query, in time order"""
+    routes = {appt_id: [] for appt_id in appt_ids}
+    if not routes:
+        return routes
+    async for point in db.walk_points.find(
+        {"appointment_id": {"$in": list(routes)}},
+        {"_id": 0, "appointment_id": 1, "lat": 1, "lng": 1, "timestamp": 1}
+    ).sort([("appointment_id", 1), ("timestamp", 1)]):
+        routes[point.pop("appointment_id")].append(point)
+    
+    # Routes not yet moved by the walk_points migration are still embedded
+    missing = [appt_id for appt_id, route in routes.items() if not route]
+    if missing:
+        async for appt in db.appointments.find(
+            {"id": {"$in": missing}, "gps_route.0": {"$exists": True}},
+            {"_id": 0, "id": 1, "gps_route": 1}
+        ):
+            routes[appt["id"]] = appt["gps_route"]
+    return routes
+
+async def delete_walk_points(appointment_query: dict):
+    """Remove stored GPS points for the appointments matching a query (call before deleting them)"""
+    appt_ids = await db.appointments.distinct("id", {**appointment_query, "gps_point_count": {"$gt": 0}})
+    if appt_ids:
+        await db.walk_points.delete_many({"appointment_id": {"$in": appt_ids}})
+
+class ActiveWalkRegistry:
+    """
+    In-memory view of the walks being GPS tracked, for the live map: walker,
+    pets and latest position/distance only, never the route. Built from the
+    database on first use; after that start/update/stop tracking keep it
+    current and every change is published on the live hub as a versioned delta.
+    Per-process: walks started or stopped on another worker are caught by
+    reconcile(), which compares the registry with the tracking walks in the
+    database every reconcile_seconds (and on the next location update for
+    walks started elsewhere).
+    """
+    TOPIC = "walks:active"
+    
+    def __init__(self, reconcile_seconds: int = 15):
+        self.reconcile_seconds = reconcile_seconds
+        self._walks: Dict[str, dict] = {}
+        self._loaded = False
+        self._lock = asyncio.Lock()
+        self._task: Optional[asyncio.Task] = None
+        self.version = 0
+    
+    async def _entries(self, walks: List[dict]) -> List[dict]:
+        loader = EnrichmentLoader(
+            user_projection={"_id": 0, "full_name": 1, "walker_color": 1},
+            pet_projection={"_id": 0, "name": 1}
+        )
+        loader.add_appointments(walks)
+        await loader.load()
+        
+        entries = []
+        for walk in walks:
+            walker = loader.user(walk.get('walker_id'))
+            entries.append({
+                "id": walk['id'],
+                "walker_id": walk.get('walker_id'),
+                "client_id": walk.get('client_id'),
+                "walker_name": walker.get('full_name') if walker else "Unknown",
+                "walker_color": walker.get('walker_color') if walker else "#9CA3AF",
+                "client_name": loader.user_name(walk.get('client_id'), "Unknown"),
+                "pet_names": loader.pet_names(walk.get('pet_ids')),
+                "start_time": walk.get('start_time'),
+                "is_tracking": True,
+                "current_location": await get_last_gps_point(walk),
+                "distance_meters": round(walk.get('distance_meters') or 0, 2),
+                "point_count": walk.get('gps_point_count', 0)
+            })
+        return entries
+    
+    async def ensure_loaded(self):
+        async with self._lock:
+            if self._loaded:
+                return
+            walks = await db.appointments.find(
+                {"is_tracking": True, "status": "in_progress"}, TRACKING_PROJECTION
+            ).to_list(None)
+            self._walks = {entry['id']: entry for entry in await self._entries(walks)}
+            self._loaded = True
+            self.version += 1
+    
+    def _publish(self, change: str, entry: dict):
+        self.version += 1
+        live_hub.publish(self.TOPIC, {"type": change, "version": self.version, "walk": entry})
+    
+    async def start(self, appt_id: str):
+        """Add (or reset) a walk that just started tracking"""
+        await self.ensure_loaded()
+        walk = await db.appointments.find_one({"id": appt_id, "is_tracking": True}, TRACKING_PROJECTION)
+        if walk:
+            entry = (await self._entries([walk]))[0]
+            self._walks[appt_id] = entry
+            self._publish("upsert", entry)
+    
+    async def move(self, appt_id: str, location: dict, distance_meters: float, point_count: int):
+        """Record a walk's latest position; no database access for known walks"""
+        if not self._loaded:
+            return  # The first load will read it from the database
+        entry = self._walks.get(appt_id)
+        if entry is None:
+            await self.start(appt_id)
+            return
+        entry.update({
+            "current_location": location,
+            "distance_meters": round(distance_meters, 2),
+            "point_count": point_count
+        })
+        self._publish("upsert", entry)
+    
+    def stop(self, appt_id: str):
+        entry = self._walks.pop(appt_id, None)
+        if entry:
+            self._publish("remove", entry)
+    
+    async def reconcile(self):
+        """Drop walks no longer tracking and add ones started on other workers"""
+        if not self._loaded:
+            return
+        tracking = set(await db.appointments.distinct("id", {"is_tracking": True, "status": "in_progress"}))
+        for appt_id in [appt_id for appt_id in self._walks if appt_id not in tracking]:
+            self.stop(appt_id)
+        for appt_id in tracking - set(self._walks):
+            await self.start(appt_id)
+    
+    async def _reconcile_loop(self):
+        while True:
+            await asyncio.sleep(self.reconcile_seconds)
+            try:
+                await self.reconcile()
+            except PyMongoError as e:
+                logging.warning(f"Active walk reconcile failed: {e}")
+    
+    def start_reconciler(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._reconcile_loop())
+    
+    async def stop_reconciler(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+    
+    @staticmethod
+    def visible_to(entry: dict, user: dict) -> bool:
+        if user['role'] == 'client':
+            return entry['client_id'] == user['id']
+        if user['role'] == 'walker':
+            return entry['walker_id'] == user['id']
+        return True
+    
+    async def snapshot(self, user: dict) -> dict:
+        await self.ensure_loaded()
+        return {
+            "version": self.version,
+            "walks": [entry for entry in self._walks.values() if self.visible_to(entry, user)]
+        }
+
+active_walks = ActiveWalkRegistry(reconcile_seconds=int(os.environ.get('ACTIVE_WALKS_RECONCILE_SECONDS', '15')))
+
+MAX_GPS_BATCH_POINTS = 2000
+
+# Douglas-Peucker tolerance for the compact route stored on completed walks
+GPS_SIMPLIFY_TOLERANCE_METERS = float(os.environ.get('GPS_SIMPLIFY_TOLERANCE_METERS', '5'))
+
+def simplify_route(points: List[Dict], tolerance_meters: float = GPS_SIMPLIFY_TOLERANCE_METERS) -> List[Dict]:
+    """
+    Douglas-Peucker simplification: the subset of points (first and last always
+    kept) such that no dropped point is further than tolerance_meters from the
+    simplified line. Points are projected to local meters around the route, which
+    is accurate at walk scale.
+    """
+    n = len(points)
+    if n < 3:
+        return list(points)
+    
+    lat = np.radians([p['lat'] for p in points])
+    lng = np.radians([p['lng'] for p in points])
+    x = 6371000 * lng * np.cos(lat.mean())
+    y = 6371000 * lat
+    
+    keep = np.zeros(n, dtype=bool)
+    keep[0] = keep[-1] = True
+    stack = [(0, n - 1)]
+    while stack:
+        first, last = stack.pop()
+        if last - first < 2:
+            continue
+        dx, dy = x[last] - x[first], y[last] - y[first]
+        px, py = x[first + 1:last] - x[first], y[first + 1:last] - y[first]
+        length_sq = dx * dx + dy * dy
+        t = np.clip((px * dx + py * dy) / length_sq, 0, 1) if length_sq > 0 else 0
+        distances = np.hypot(px - t * dx, py - t * dy)
+        i = int(np.argmax(distances))
+        if distances[i] > tolerance_meters:
+            split = first + 1 + i
+            keep[split] = True
+            stack.append((first, split))
+            stack.append((split, last))
+    
+    return [points[i] for i in np.flatnonzero(keep)]
+
+def encode_polyline(points: List[Dict], precision: int = 5) -> str:
+    """Encoded polyline (Google polyline algorithm) of the points' lat/lng"""
+    factor = 10 ** precision
+    chunks = []
+    prev_lat = prev_lng = 0
+    for p in points:
+        lat, lng = int(round(p['lat'] * factor)), int(round(p['lng'] * factor))
+        for delta in (lat - prev_lat, lng - prev_lng):
+            value = ~(delta << 1) if delta < 0 else delta << 1
+            while value >= 0x20:
+                chunks.append(chr((0x20 | (value & 0x1f)) + 63))
+                value >>= 5
+            chunks.append(chr(value + 63))
+        prev_lat, prev_lng = lat, lng
+    return "".join(chunks)
+
+def compact_route_fields(route: List[Dict]) -> dict:
+    """Simplified route and polyline stored on a completed walk"""
+    simplified = simplify_route(route)
+    return {"gps_route_simplified": simplified, "gps_polyline": encode_polyline(simplified)}
 
 @api_router.post("/appointments/{appt_id}/start-tracking")
-async def start_gps_tracking(appt_id: str, lat: float, lng: float, current_user: dict = Depends(get_current_user)):
-    """Start GPS tracking for a walk"""
+async def start_gps_tracking(appt_id: str, lat: float, lng: float, timestamp: Optional[str] = None, current_user: dict = Depends(get_current_user)):
+    """Start GPS tracking for a walk; `timestamp` is the phone's fix time, so the route uses one clock"""
     if current_user['role'] not in ['admin', 'walker']:
         raise HTTPException(status_code=403, detail="Not authorized")
     
@@ -3098,19 +4401,34 @@ async def start_gps_tracking(appt_id: str, lat: float, lng: float, current_user:
         raise HTTPException(status_code=404, detail="Appointment not found")
     
     start_time = datetime.now(timezone.utc).isoformat()
-    initial_coord = {"lat": lat, "lng": lng, "timestamp": start_time}
+    try:
+        point_time = parse_gps_timestamp(timestamp).isoformat() if timestamp else start_time
+    except ValueError:
+        raise HTTPException(status_code=400, detail=f"Invalid timestamp: {timestamp}")
+    initial_coord = {"lat": lat, "lng": lng, "timestamp": point_time}
+    
+    # (Re)starting tracking begins a fresh route
+    await db.walk_points.delete_many({"appointment_id": appt_id})
+    await insert_walk_points(appt_id, [initial_coord])
     
     await db.appointments.update_one(
         {"id": appt_id},
-        {"$set": {
-            "status": "in_progress",
-            "start_time": start_time,
-            "walker_id": current_user['id'],
-            "is_tracking": True,
-            "gps_route": [initial_coord],
-            "distance_meters": 0
-        }}
+        {
+            "$set": {
+                "status": "in_progress",
+                "start_time": start_time,
+                "walker_id": current_user['id'],
+                "is_tracking": True,
+                "gps_point_count": 1,
+                "last_point": initial_coord,
+                "gps_bbox": {"min_lat": lat, "max_lat": lat, "min_lng": lng, "max_lng": lng},
+                "distance_meters": 0
+            },
+            "$unset": {"gps_route": "", "last_upload_timestamp": ""}
+        }
     )
+    walker_schedule_index.invalidate(appt.get('scheduled_date'))
+    await active_walks.start(appt_id)
     return {"message": "Walk tracking started", "start_time": start_time}
 
 @api_router.post("/appointments/{appt_id}/update-location")
@@ -3119,7 +4437,7 @@ async def update_gps_location(appt_id: str, lat: float, lng: float, current_user
     if current_user['role'] not in ['admin', 'walker']:
         raise HTTPException(status_code=403, detail="Not authorized")
     
-    appt = await db.appointments.find_one({"id": appt_id}, {"_id": 0})
+    appt = await db.appointments.find_one({"id": appt_id}, TRACKING_PROJECTION)
     if not appt:
         raise HTTPException(status_code=404, detail="Appointment not found")
     
@@ -3129,41 +4447,99 @@ async def update_gps_location(appt_id: str, lat: float, lng: float, current_user
     timestamp = datetime.now(timezone.utc).isoformat()
     new_coord = {"lat": lat, "lng": lng, "timestamp": timestamp}
     
-    # Get existing route and add new coordinate
-    route = appt.get('gps_route', [])
-    route.append(new_coord)
+    # Append the point and add only the distance from the previous one
+    updated = await append_gps_points(appt, [new_coord])
+    return {
+        "message": "Location updated",
+        "distance_meters": round(updated.get('distance_meters', 0), 2),
+        "point_count": updated.get('gps_point_count', 0)
+    }
+
+@api_router.post("/appointments/{appt_id}/locations:batch")
+async def upload_gps_locations(appt_id: str, points: List[GPSCoordinate], current_user: dict = Depends(get_current_user)):
+    """
+    Upload positions buffered on the walker's phone, e.g. after losing signal.
+    Points are de-duplicated by timestamp, ordered, and anything not newer than
+    the newest point of an earlier batch is dropped, so replaying a batch is
+    harmless. Only batch timestamps are compared: they come from the phone's
+    clock, and server-stamped points would drop everything from a phone running
+    behind.
+    """
+    if current_user['role'] not in ['admin', 'walker']:
+        raise HTTPException(status_code=403, detail="Not authorized")
+    
+    if len(points) > MAX_GPS_BATCH_POINTS:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_GPS_BATCH_POINTS} points per batch")
+    
+    appt = await db.appointments.find_one({"id": appt_id}, TRACKING_PROJECTION)
+    if not appt:
+        raise HTTPException(status_code=404, detail="Appointment not found")
+    
+    if not appt.get('is_tracking'):
+        raise HTTPException(status_code=400, detail="Walk tracking not started")
+    
+    by_time = {}
+    for point in points:
+        try:
+            ts = parse_gps_timestamp(point.timestamp)
+        except ValueError:
+            raise HTTPException(status_code=400, detail=f"Invalid timestamp: {point.timestamp}")
+        by_time.setdefault(ts, {"lat": point.lat, "lng": point.lng, "timestamp": ts.isoformat()})
+    
+    if appt.get('last_upload_timestamp'):
+        last_ts = parse_gps_timestamp(appt['last_upload_timestamp'])
+        by_time = {ts: p for ts, p in by_time.items() if ts > last_ts}
     
-    # Calculate total distance
-    distance = calculate_distance(route)
+    new_points = [by_time[ts] for ts in sorted(by_time)]
+    if not new_points:
+        return {
+            "message": "No new locations",
+            "accepted": 0,
+            "dropped": len(points),
+            "distance_meters": round(appt.get('distance_meters') or 0, 2),
+            "point_count": appt.get('gps_point_count', 0)
+        }
     
+    updated = await append_gps_points(appt, new_points)
     await db.appointments.update_one(
-        {"id": appt_id},
-        {"$set": {
-            "gps_route": route,
-            "distance_meters": distance
-        }}
+        {"id": appt_id}, {"$max": {"last_upload_timestamp": new_points[-1]['timestamp']}}
     )
-    return {"message": "Location updated", "distance_meters": distance, "point_count": len(route)}
+    return {
+        "message": "Locations updated",
+        "accepted": len(new_points),
+        "dropped": len(points) - len(new_points),
+        "distance_meters": round(updated.get('distance_meters', 0), 2),
+        "point_count": updated.get('gps_point_count', 0)
+    }
 
 @api_router.post("/appointments/{appt_id}/stop-tracking")
-async def stop_gps_tracking(appt_id: str, lat: Optional[float] = None, lng: Optional[float] = None, current_user: dict = Depends(get_current_user)):
-    """Stop GPS tracking and complete the walk"""
+async def stop_gps_tracking(appt_id: str, lat: Optional[float] = None, lng: Optional[float] = None, timestamp: Optional[str] = None, current_user: dict = Depends(get_current_user)):
+    """Stop GPS tracking and complete the walk; `timestamp` is the final fix's phone time"""
     if current_user['role'] not in ['admin', 'walker']:
         raise HTTPException(status_code=403, detail="Not authorized")
     
-    appt = await db.appointments.find_one({"id": appt_id}, {"_id": 0})
+    appt = await db.appointments.find_one({"id": appt_id}, TRACKING_PROJECTION)
     if not appt:
         raise HTTPException(status_code=404, detail="Appointment not found")
     
     end_time = datetime.now(timezone.utc)
+    distance = appt.get('distance_meters') or 0
+    point_count = appt.get('gps_point_count', 0)
+    update_ops = {"$set": {}}
     
     # Add final location if provided
-    route = appt.get('gps_route', [])
     if lat is not None and lng is not None:
-        route.append({"lat": lat, "lng": lng, "timestamp": end_time.isoformat()})
-    
-    # Calculate final distance
-    distance = calculate_distance(route)
+        try:
+            point_time = parse_gps_timestamp(timestamp).isoformat() if timestamp else end_time.isoformat()
+        except ValueError:
+            raise HTTPException(status_code=400, detail=f"Invalid timestamp: {timestamp}")
+        final_coord = {"lat": lat, "lng": lng, "timestamp": point_time}
+        last_point = await get_last_gps_point(appt)
+        if await insert_walk_points(appt_id, [final_coord]):
+            update_ops = gps_summary_update([final_coord], 0, 1)
+            distance += route_metrics([last_point, final_coord])["distance_meters"] if last_point else 0.0
+            point_count += 1
+    distance = round(distance, 2)
     
     # Calculate duration
     duration = 0
@@ -3171,59 +4547,203 @@ async def stop_gps_tracking(appt_id: str, lat: Optional[float] = None, lng: Opti
         start_time = datetime.fromisoformat(appt['start_time'].replace('Z', '+00:00'))
         duration = int((end_time - start_time).total_seconds() / 60)
     
-    await db.appointments.update_one(
-        {"id": appt_id},
-        {"$set": {
-            "status": "completed",
-            "end_time": end_time.isoformat(),
-            "actual_duration_minutes": duration,
-            "is_tracking": False,
-            "gps_route": route,
-            "distance_meters": distance
-        }}
-    )
+    route = (await load_gps_routes([appt_id]))[appt_id]
+    update_ops["$set"].update({
+        "status": "completed",
+        "end_time": end_time.isoformat(),
+        "actual_duration_minutes": duration,
+        "is_tracking": False,
+        "distance_meters": distance,
+        **compact_route_fields(route)
+    })
+    update_ops.get("$inc", {}).pop("distance_meters", None)
+    await db.appointments.update_one({"id": appt_id}, update_ops)
+    walker_schedule_index.invalidate(appt.get('scheduled_date'))
+    active_walks.stop(appt_id)
+    await sync_payroll_ledger([appt_id])
+    live_hub.publish(f"walk:{appt_id}", {
+        "type": "completed",
+        "appointment_id": appt_id,
+        "points": [final_coord] if lat is not None and lng is not None else [],
+        "distance_meters": distance,
+        "point_count": point_count,
+        "duration_minutes": duration,
+    })
     return {
         "message": "Walk completed",
         "duration_minutes": duration,
         "distance_meters": distance,
-        "route_points": len(route)
+        "route_points": point_count
     }
 
-@api_router.get("/appointments/{appt_id}/live-tracking")
-async def get_live_tracking(appt_id: str, current_user: dict = Depends(get_current_user)):
-    """Get live tracking data for an appointment (client, walker, admin can view)"""
-    appt = await db.appointments.find_one({"id": appt_id}, {"_id": 0})
+async def load_compact_routes(walks: List[dict]) -> Dict[str, List[Dict]]:
+    """
+    Simplified routes for completed walks. Walks finished before simplified
+    routes were stored get them computed now and saved (fills in gps_polyline too).
+    """
+    routes = {walk['id']: walk.get('gps_route_simplified') for walk in walks}
+    missing = [appt_id for appt_id, route in routes.items() if route is None]
+    if missing:
+        full_routes = await load_gps_routes(missing)
+        updates = []
+        for walk in walks:
+            if walk['id'] in full_routes:
+                compact = compact_route_fields(full_routes[walk['id']])
+                walk.update(compact)
+                routes[walk['id']] = compact["gps_route_simplified"]
+                updates.append(UpdateOne({"id": walk['id']}, {"$set": compact}))
+        await db.appointments.bulk_write(updates, ordered=False)
+    return routes
+
+@api_router.get("/appointments/{appt_id}/route")
+async def get_walk_route(
+    appt_id: str,
+    resolution: str = Query("full", pattern="^(simplified|full)$"),
+    include_metrics: bool = False,
+    current_user: dict = Depends(get_current_user)
+):
+    """
+    GPS route of a walk at full resolution or simplified, with its polyline and summary.
+    stats (moving time, speed, pace) are computed from the full route; pass
+    include_metrics=true to also get per-point cumulative distance, speed and pace.
+    """
+    appt = await db.appointments.find_one({"id": appt_id}, TRACKING_PROJECTION)
     if not appt:
         raise HTTPException(status_code=404, detail="Appointment not found")
     
-    # Clients can only view their own appointments
     if current_user['role'] == 'client' and appt['client_id'] != current_user['id']:
         raise HTTPException(status_code=403, detail="Not authorized to view this walk")
     
+    full_route = (await load_gps_routes([appt_id]))[appt_id]
+    if resolution == "simplified" and appt.get('status') == 'completed':
+        route = (await load_compact_routes([appt]))[appt_id]
+        polyline = appt.get('gps_polyline')
+    else:
+        route = simplify_route(full_route) if resolution == "simplified" else full_route
+        polyline = encode_polyline(route)
+    
+    result = {
+        "appointment_id": appt_id,
+        "resolution": resolution,
+        "gps_route": route,
+        "gps_polyline": polyline,
+        "point_count": appt.get('gps_point_count', len(full_route)),
+        "distance_meters": round(appt.get('distance_meters') or 0, 2),
+        "gps_bbox": appt.get('gps_bbox'),
+        "stats": route_stats(full_route),
+    }
+    if include_metrics:
+        metrics = route_metrics(route)
+        speed = np.concatenate([[np.nan], metrics["speed_mps"]])
+        result["metrics"] = {
+            "cumulative_meters": np.round(metrics["cumulative_meters"], 2).tolist(),
+            # JSON has no NaN; unknown values are null
+            "speed_mps": [None if np.isnan(v) else round(float(v), 2) for v in speed],
+            "pace_min_per_km": [None if np.isnan(v) else round(float(v), 2) for v in metrics["pace_min_per_km"]],
+            "spike": metrics["spike"].tolist(),
+        }
+    return result
+
+async def build_live_tracking(appt: dict, include_route: bool = True) -> dict:
+    """Live tracking payload for an appointment read with TRACKING_PROJECTION"""
+    appt_id = appt['id']
+    
     # Get walker info
     walker = None
     if appt.get('walker_id'):
         walker = await db.users.find_one({"id": appt['walker_id']}, {"_id": 0, "full_name": 1, "phone": 1, "walker_color": 1})
     
     # Get pet info
-    pets = []
-    for pet_id in appt.get('pet_ids', []):
-        pet = await db.pets.find_one({"id": pet_id}, {"_id": 0, "name": 1, "breed": 1})
-        if pet:
-            pets.append(pet)
+    loader = EnrichmentLoader(pet_projection={"_id": 0, "name": 1, "breed": 1})
+    loader.add_pet_ids(appt.get('pet_ids'))
+    await loader.load()
+    pets = [{k: v for k, v in pet.items() if k != 'id'} for pet in loader.pet_list(appt.get('pet_ids'))]
+    
+    route = (await load_gps_routes([appt_id]))[appt_id] if include_route else None
     
     return {
         "appointment_id": appt_id,
         "status": appt.get('status'),
         "is_tracking": appt.get('is_tracking', False),
         "start_time": appt.get('start_time'),
-        "gps_route": appt.get('gps_route', []),
-        "distance_meters": appt.get('distance_meters', 0),
+        "gps_route": route,
+        # The route is read after the appointment, so it may already hold newer points
+        "point_count": max(appt.get('gps_point_count') or 0, len(route or [])),
+        "distance_meters": round(appt.get('distance_meters') or 0, 2),
         "walker": walker,
         "pets": pets,
-        "current_location": appt.get('gps_route', [])[-1] if appt.get('gps_route') else None
+        "current_location": await get_last_gps_point(appt)
     }
 
+async def get_trackable_appointment(appt_id: str, current_user: dict) -> dict:
+    appt = await db.appointments.find_one({"id": appt_id}, TRACKING_PROJECTION)
+    if not appt:
+        raise HTTPException(status_code=404, detail="Appointment not found")
+    
+    # Clients can only view their own appointments
+    if current_user['role'] == 'client' and appt['client_id'] != current_user['id']:
+        raise HTTPException(status_code=403, detail="Not authorized to view this walk")
+    return appt
+
+@api_router.get("/appointments/{appt_id}/live-tracking")
+async def get_live_tracking(appt_id: str, include_route: bool = True, current_user: dict = Depends(get_current_user)):
+    """
+    Get live tracking data for an appointment (client, walker, admin can view).
+    Pass include_route=false to poll just the current position and distance.
+    """
+    appt = await get_trackable_appointment(appt_id, current_user)
+    return await build_live_tracking(appt, include_route)
+
+@api_router.websocket("/appointments/{appt_id}/live-tracking/ws")
+async def stream_live_tracking(websocket: WebSocket, appt_id: str):
+    """
+    Live tracking stream: authenticate with ?token=<jwt>. Sends one
+    {"type": "snapshot", "data": <live-tracking payload>} message, then
+    {"type": "points", ...} as new points are recorded, and finally
+    {"type": "completed", ...} when the walk is stopped.
+    """
+    current_user = await authenticate_websocket(websocket)
+    if not current_user:
+        return
+    try:
+        appt = await get_trackable_appointment(appt_id, current_user)
+    except HTTPException:
+        await websocket.close(code=1008)
+        return
+    
+    await websocket.accept()
+    # Subscribe before reading the snapshot so no point falls in between
+    topic = f"walk:{appt_id}"
+    queue = live_hub.subscribe(topic)
+    try:
+        appt = await db.appointments.find_one({"id": appt_id}, TRACKING_PROJECTION) or appt
+        snapshot = await build_live_tracking(appt)
+        await websocket.send_json({"type": "snapshot", "data": snapshot})
+        if not snapshot["is_tracking"]:
+            await websocket.close()
+            return
+        
+        # Points published while the snapshot was read may already be in its route
+        route = snapshot["gps_route"] or []
+        cutoff = route[-1]["timestamp"] if route else ""
+        
+        def only_new_points(message: dict) -> Optional[dict]:
+            if message["type"] != "points":
+                return message
+            points = [p for p in message["points"] if p["timestamp"] > cutoff]
+            return {**message, "points": points} if points else None
+        
+        await stream_topic(
+            websocket, queue,
+            prepare=only_new_points,
+            is_final=lambda message: message["type"] == "completed"
+        )
+        await websocket.close()
+    except (WebSocketDisconnect, RuntimeError):
+        pass  # Viewer went away
+    finally:
+        live_hub.unsubscribe(topic, queue)
+
 @api_router.get("/walks/active")
 async def get_active_walks(current_user: dict = Depends(get_current_user)):
     """Get all currently active walks with GPS tracking"""
@@ -3237,37 +4757,77 @@ async def get_active_walks(current_user: dict = Depends(get_current_user)):
         query["walker_id"] = current_user['id']
     # Admins see all
     
-    walks = await db.appointments.find(query, {"_id": 0}).to_list(100)
+    walks = await db.appointments.find(query, TRACKING_PROJECTION).to_list(100)
     
     # Enrich with walker and pet info
+    loader = EnrichmentLoader(
+        user_projection={"_id": 0, "full_name": 1, "walker_color": 1},
+        pet_projection={"_id": 0, "name": 1}
+    )
+    loader.add_appointments(walks)
+    await loader.load()
+    
     enriched = []
     for walk in walks:
-        walker = None
-        if walk.get('walker_id'):
-            walker = await db.users.find_one({"id": walk['walker_id']}, {"_id": 0, "full_name": 1, "walker_color": 1})
-        
-        pets = []
-        for pet_id in walk.get('pet_ids', []):
-            pet = await db.pets.find_one({"id": pet_id}, {"_id": 0, "name": 1})
-            if pet:
-                pets.append(pet['name'])
-        
-        client = await db.users.find_one({"id": walk['client_id']}, {"_id": 0, "full_name": 1})
+        walker = loader.user(walk.get('walker_id'))
         
         enriched.append({
             **walk,
             "walker_name": walker.get('full_name') if walker else "Unknown",
             "walker_color": walker.get('walker_color') if walker else "#9CA3AF",
-            "pet_names": pets,
-            "client_name": client.get('full_name') if client else "Unknown"
+            "pet_names": loader.pet_names(walk.get('pet_ids')),
+            "client_name": loader.user_name(walk['client_id'], "Unknown")
         })
     
     return enriched
 
+@api_router.get("/walks/live-map")
+async def get_live_map(current_user: dict = Depends(get_current_user)):
+    """
+    Active walks from the in-memory registry: walker, pets, current_location and
+    distance only (no routes). Cheap enough to poll every few seconds; the
+    version matches the deltas sent by /walks/live-map/ws.
+    """
+    return await active_walks.snapshot(current_user)
+
+@api_router.websocket("/walks/live-map/ws")
+async def stream_live_map(websocket: WebSocket):
+    """
+    Live map stream: authenticate with ?token=<jwt>. Sends
+    {"type": "snapshot", "version", "walks"} and then one
+    {"type": "upsert" | "remove", "version", "walk"} delta per change.
+    """
+    current_user = await authenticate_websocket(websocket)
+    if not current_user:
+        return
+    
+    await websocket.accept()
+    queue = live_hub.subscribe(ActiveWalkRegistry.TOPIC)
+    try:
+        snapshot = await active_walks.snapshot(current_user)
+        await websocket.send_json({"type": "snapshot", **snapshot})
+        await stream_topic(
+            websocket, queue,
+            skip=lambda message: (message["version"] <= snapshot["version"]
+                                  or not ActiveWalkRegistry.visible_to(message["walk"], current_user))
+        )
+    except (WebSocketDisconnect, RuntimeError):
+        pass  # Viewer went away
+    finally:
+        live_hub.unsubscribe(ActiveWalkRegistry.TOPIC, queue)
+
 @api_router.get("/walks/completed")
-async def get_completed_walks(current_user: dict = Depends(get_current_user), limit: int = 20):
-    """Get completed walks with GPS route data"""
-    query = {"status": "completed", "gps_route": {"$exists": True, "$ne": []}}
+async def get_completed_walks(
+    current_user: dict = Depends(get_current_user),
+    limit: int = 20,
+    route: str = Query("simplified", pattern="^(simplified|full)$")
+):
+    """
+    Get completed walks with GPS route data.
+    gps_route is the simplified route by default (plus gps_polyline);
+    pass route=full for every recorded point.
+    """
+    query = {"status": "completed", "$or": [{"gps_point_count": {"$gt": 0}}, {"gps_route.0": {"$exists": True}}]}
     
     # Filter by role
     if current_user['role'] == 'client':
@@ -3275,22 +4835,23 @@ async def get_completed_walks(current_user: dict = Depends(get_current_user), li
     elif current_user['role'] == 'walker':
         query["walker_id"] = current_user['id']
     
-    walks = await db.appointments.find(query, {"_id": 0}).sort("end_time", -1).limit(limit).to_list(limit)
+    walks = await db.appointments.find(query, TRACKING_PROJECTION).sort("end_time", -1).limit(limit).to_list(limit)
+    if route == "full":
+        routes = await load_gps_routes([walk['id'] for walk in walks])
+    else:
+        routes = await load_compact_routes(walks)
     
     # Enrich with info
+    loader = EnrichmentLoader(
+        user_projection={"_id": 0, "full_name": 1, "walker_color": 1},
+        pet_projection={"_id": 0, "name": 1}
+    )
+    loader.add_appointments(walks)
+    await loader.load()
+    
     enriched = []
     for walk in walks:
-        walker = None
-        if walk.get('walker_id'):
-            walker = await db.users.find_one({"id": walk['walker_id']}, {"_id": 0, "full_name": 1, "walker_color": 1})
-        
-        pets = []
-        for pet_id in walk.get('pet_ids', []):
-            pet = await db.pets.find_one({"id": pet_id}, {"_id": 0, "name": 1})
-            if pet:
-                pets.append(pet['name'])
-        
-        client = await db.users.find_one({"id": walk['client_id']}, {"_id": 0, "full_name": 1})
+        walker = loader.user(walk.get('walker_id'))
         
         enriched.append({
             "id": walk['id'],
@@ -3299,11 +4860,13 @@ async def get_completed_walks(current_user: dict = Depends(get_current_user), li
             "end_time": walk.get('end_time'),
             "duration_minutes": walk.get('actual_duration_minutes', 0),
             "distance_meters": walk.get('distance_meters', 0),
-            "gps_route": walk.get('gps_route', []),
+            "gps_route": routes[walk['id']],
+            "gps_polyline": walk.get('gps_polyline'),
+            "point_count": walk.get('gps_point_count'),
             "walker_name": walker.get('full_name') if walker else "Unknown",
             "walker_color": walker.get('walker_color') if walker else "#9CA3AF",
-            "pet_names": pets,
-            "client_name": client.get('full_name') if client else "Unknown"
+            "pet_names": loader.pet_names(walk.get('pet_ids')),
+            "client_name": loader.user_name(walk['client_id'], "Unknown")
         })
     
     return enriched
@@ -3315,13 +4878,10 @@ async def create_invoice(client_id: str, appointment_ids: List[str], current_use
         raise HTTPException(status_code=403, detail="Admin only")
     
     # Calculate total from appointments
-    total = 0.0
-    for appt_id in appointment_ids:
-        appt = await db.appointments.find_one({"id": appt_id}, {"_id": 0})
-        if appt:
-            service = await db.services.find_one({"service_type": appt['service_type']}, {"_id": 0})
-            if service:
-                total += service['price']
+    appts = await db.appointments.find(
+        {"id": {"$in": appointment_ids}}, {"_id": 0, "id": 1, "client_id": 1, "service_type": 1}
+    ).to_list(None)
+    total = sum((await service_prices.price_appointments(appts)).values())
     
     due_date = (datetime.now(timezone.utc) + timedelta(days=30)).strftime("%Y-%m-%d")
     invoice = Invoice(
@@ -3505,7 +5065,7 @@ async def debug_client_billing(client_id: str, current_user: dict = Depends(get_
     all_appts = await db.appointments.find({
         "client_id": client_id,
         "scheduled_date": {"$gte": start_str, "$lte": end_str}
-    }, {"_id": 0}).to_list(100)
+    }, APPOINTMENT_LIST_PROJECTION).to_list(100)
     
     # Check which ones are billable
     auto_billable_pattern = {"$regex": "day_care|day_camp|daycare|overnight|petsit|transport|boarding", "$options": "i"}
@@ -3515,7 +5075,7 @@ async def debug_client_billing(client_id: str, current_user: dict = Depends(get_
         "status": {"$in": ["completed", "scheduled"]},
         "scheduled_date": {"$gte": start_str, "$lte": end_str},
         "$or": [{"invoiced": {"$ne": True}}, {"invoiced": {"$exists": False}}]
-    }, {"_id": 0}).to_list(100)
+    }, APPOINTMENT_LIST_PROJECTION).to_list(100)
     
     return {
         "today": str(today),
@@ -3554,6 +5114,8 @@ async def get_invoice_detail(invoice_id: str, current_user: dict = Depends(get_c
     client = await db.users.find_one({"id": invoice['client_id']}, {"_id": 0, "password_hash": 0})
     
     # Get appointment details with service info
+    prices = await service_prices.prices()
+    price_book = (await service_prices.client_price_books([invoice['client_id']])).get(invoice['client_id'])
     appointment_details = []
     for appt_id in invoice.get('appointment_ids', []):
         appt = await db.appointments.find_one({"id": appt_id}, {"_id": 0})
@@ -3573,7 +5135,7 @@ async def get_invoice_detail(invoice_id: str, current_user: dict = Depends(get_c
             appointment_details.append({
                 "id": appt['id'],
                 "service_name": service['name'] if service else appt['service_type'],
-                "service_price": service['price'] if service else 0,
+                "service_price": service_prices.price(appt['service_type'], prices, price_book),
                 "scheduled_date": appt['scheduled_date'],
                 "scheduled_time": appt['scheduled_time'],
                 "walker_name": walker['full_name'] if walker else "Unassigned",
@@ -3988,6 +5550,103 @@ async def stripe_webhook(request: Request):
         return {"received": False}
 
 # Message Routes
+def message_doc(message: Message) -> dict:
+    """Message as stored: created_at as an ISO string so it sorts consistently"""
+    doc = message.model_dump()
+    doc['created_at'] = doc['created_at'].isoformat()
+    return doc
+
+def message_timestamp(message: dict) -> str:
+    created_at = message.get('created_at', '')
+    return created_at.isoformat() if hasattr(created_at, 'isoformat') else str(created_at or '')
+
+def conversation_id(user_a: str, user_b: str) -> str:
+    """Key of the conversations document for a pair of users (order independent)"""
+    return "|".join(sorted([user_a, user_b]))
+
+async def save_message(message: Message):
+    """Store a message; direct messages also update the pair's conversation summary"""
+    doc = message_doc(message)
+    await db.messages.insert_one(doc)
+    doc.pop('_id', None)
+    if message.is_group_message or not message.receiver_id:
+        await message_broker.publish(STAFF_GROUP_TOPIC, {"type": "message", "message": doc})
+        return
+    
+    conv_id = conversation_id(message.sender_id, message.receiver_id)
+    await db.conversations.update_one(
+        {"id": conv_id},
+        {
+            "$setOnInsert": {"participants": sorted([message.sender_id, message.receiver_id])},
+            "$inc": {f"unread.{message.receiver_id}": 1, f"unread.{message.sender_id}": 0}
+        },
+        upsert=True
+    )
+    # Concurrent sends may finish out of order; keep the newest as last_message
+    await db.conversations.update_one(
+        {"id": conv_id, "$or": [{"last_message_at": {"$lt": doc['created_at']}}, {"last_message_at": {"$exists": False}}]},
+        {"$set": {"last_message": doc, "last_message_at": doc['created_at']}}
+    )
+    
+    for user_id in {message.sender_id, message.receiver_id}:
+        await message_broker.publish(f"user:{user_id}", {"type": "message", "message": doc})
+    receiver = await db.users.find_one({"id": message.receiver_id}, {"_id": 0, "id": 1, "role": 1, "group_read_at": 1})
+    if receiver:
+        await publish_unread_counts(receiver)
+
+CONVERSATIONS_MIGRATION = {"type": "migration", "name": "conversations"}
+_conversations_ready = False
+
+async def conversations_ready() -> bool:
+    """Whether the conversations migration has finished, so summaries can be trusted"""
+    global _conversations_ready
+    if not _conversations_ready:
+        state = await db.settings.find_one(CONVERSATIONS_MIGRATION, {"_id": 0, "completed_at": 1})
+        _conversations_ready = bool(state and state.get('completed_at'))
+    return _conversations_ready
+
+async def direct_message_summaries_from_messages(user_id: str) -> Dict[str, dict]:
+    """direct_message_summaries computed from the messages themselves, used until conversations are backfilled"""
+    pipeline = [
+        {"$match": {
+            "$or": [{"sender_id": user_id}, {"receiver_id": user_id}],
+            "is_group_message": False
+        }},
+        {"$sort": {"created_at": -1}},
+        {"$group": {
+            "_id": {"$cond": [{"$eq": ["$sender_id", user_id]}, "$receiver_id", "$sender_id"]},
+            "last_message": {"$first": "$$ROOT"},
+            "unread_count": {"$sum": {"$cond": [
+                {"$and": [{"$eq": ["$receiver_id", user_id]}, {"$eq": ["$read", False]}]}, 1, 0
+            ]}}
+        }},
+        {"$sort": {"last_message.created_at": -1}}
+    ]
+    summaries = {}
+    async for row in db.messages.aggregate(pipeline, allowDiskUse=True):
+        row['last_message'].pop('_id', None)
+        summaries[row['_id']] = {"unread_count": row['unread_count'], "last_message": row['last_message']}
+    return summaries
+
+async def direct_message_summaries(user_id: str) -> Dict[str, dict]:
+    """
+    Per counterpart of the user's direct messages: unread_count (messages from
+    them not yet read) and last_message (either direction), most recent first.
+    """
+    if not await conversations_ready():
+        return await direct_message_summaries_from_messages(user_id)
+    summaries = {}
+    async for conv in db.conversations.find(
+        {"participants": user_id, "last_message": {"$exists": True}},
+        {"_id": 0, "participants": 1, "last_message": 1, f"unread.{user_id}": 1}
+    ).sort("last_message_at", -1):
+        counterpart = next((p for p in conv['participants'] if p != user_id), user_id)
+        summaries[counterpart] = {
+            "unread_count": conv.get('unread', {}).get(user_id, 0),
+            "last_message": conv['last_message']
+        }
+    return summaries
+
 @api_router.get("/messages/contacts")
 async def get_message_contacts(contact_type: str = "all", current_user: dict = Depends(get_current_user)):
     """Get contacts for messaging based on type: clients, team, all
@@ -4093,75 +5752,20 @@ async def get_message_contacts(contact_type: str = "all", current_user: dict = D
             contacts = [{"type": u['role'], **u} for u in all_users]
     
     # Add unread count and last message info for each contact
+    summaries = await direct_message_summaries(current_user['id'])
     for contact in contacts:
-        unread_count = await db.messages.count_documents({
-            "sender_id": contact['id'],
-            "receiver_id": current_user['id'],
-            "is_group_message": False,
-            "read": False
-        })
-        contact['unread_count'] = unread_count
-        
-        # Find the most recent message with this contact (either direction)
-        last_message = await db.messages.find_one(
-            {
-                "$or": [
-                    {"sender_id": contact['id'], "receiver_id": current_user['id']},
-                    {"sender_id": current_user['id'], "receiver_id": contact['id']}
-                ],
-                "is_group_message": False
-            },
-            {"_id": 0},
-            sort=[("created_at", -1)]
-        )
-        
-        if last_message:
-            contact['has_messages'] = True
-            # Ensure last_message_at is always a string
-            last_msg_time = last_message.get('created_at', '')
-            if hasattr(last_msg_time, 'isoformat'):
-                contact['last_message_at'] = last_msg_time.isoformat()
-            else:
-                contact['last_message_at'] = str(last_msg_time) if last_msg_time else ''
-            contact['last_message_preview'] = last_message.get('content', '')[:50]
-        else:
-            contact['has_messages'] = False
-            contact['last_message_at'] = ''
-            contact['last_message_preview'] = ''
-    
-    # Sort contacts: active chats first (by last message), then unread, then alphabetically
-    def sort_key(c):
-        has_msgs = 1 if c.get('has_messages') else 0
-        unread = c.get('unread_count', 0)
-        last_msg = c.get('last_message_at', '')
-        name = c.get('full_name', '').lower()
-        # Priority: has_messages DESC, last_message_at DESC, unread DESC, name ASC
-        return (-has_msgs, -unread if not last_msg else 0, last_msg if last_msg else 'zzz', name)
-    
-    # Sort: contacts with messages first (most recent first), then by unread count, then alphabetically
-    contacts.sort(key=lambda c: (
-        -1 if c.get('has_messages') else 0,  # Has messages first
-        c.get('last_message_at', '') if c.get('has_messages') else '',  # Sort by last message time (descending)
-        -c.get('unread_count', 0),  # Then by unread count
-        c.get('full_name', '').lower()  # Then alphabetically
-    ), reverse=False)
-    
-    # Re-sort properly: active chats first (most recent), then others
-    active_chats = [c for c in contacts if c.get('has_messages')]
-    inactive_contacts = [c for c in contacts if not c.get('has_messages')]
-    
-    # Sort active chats by last_message_at descending (most recent first)
-    # Ensure we compare strings consistently (handle both datetime and string formats)
-    def get_last_message_sort_key(c):
-        last_msg = c.get('last_message_at', '')
-        if hasattr(last_msg, 'isoformat'):
-            return last_msg.isoformat()
-        return str(last_msg) if last_msg else ''
-    
-    active_chats.sort(key=lambda c: get_last_message_sort_key(c), reverse=True)
-    # Sort inactive by unread then name
-    inactive_contacts.sort(key=lambda c: (-c.get('unread_count', 0), c.get('full_name', '').lower()))
-    
+        summary = summaries.get(contact['id'])
+        contact['unread_count'] = summary['unread_count'] if summary else 0
+        contact['has_messages'] = summary is not None
+        contact['last_message_at'] = message_timestamp(summary['last_message']) if summary else ''
+        contact['last_message_preview'] = summary['last_message'].get('content', '')[:50] if summary else ''
+    
+    # Active chats first (most recent message first), then by unread count and name
+    active_chats = sorted((c for c in contacts if c['has_messages']), key=lambda c: c['last_message_at'], reverse=True)
+    inactive_contacts = sorted(
+        (c for c in contacts if not c['has_messages']),
+        key=lambda c: (-c['unread_count'], c.get('full_name', '').lower())
+    )
     return active_chats + inactive_contacts
 
 @api_router.post("/messages", response_model=Message)
@@ -4172,96 +5776,136 @@ async def send_message(msg_data: MessageCreate, current_user: dict = Depends(get
         is_group_message=msg_data.is_group_message,
         content=msg_data.content
     )
-    msg_dict = message.model_dump()
-    msg_dict['created_at'] = msg_dict['created_at'].isoformat()
-    await db.messages.insert_one(msg_dict)
+    await save_message(message)
     return message
 
 @api_router.get("/messages", response_model=List[Message])
-async def get_messages(receiver_id: Optional[str] = None, group: bool = False, current_user: dict = Depends(get_current_user)):
+async def get_messages(
+    response: Response,
+    receiver_id: Optional[str] = None,
+    group: bool = False,
+    before: Optional[str] = None,
+    after: Optional[str] = None,
+    limit: int = Query(100, ge=1, le=500),
+    current_user: dict = Depends(get_current_user)
+):
+    """
+    Messages newest first, paged on (created_at, id).
+    - before: X-Before-Cursor from a previous page, to load older messages
+    - after: X-After-Cursor from a previous page, to load messages sent since
+    X-Before-Cursor is returned while older messages remain; X-After-Cursor
+    always marks the newest message returned.
+    """
+    if before and after:
+        raise HTTPException(status_code=400, detail="Use either before or after, not both")
+    
     if group:
         # Staff group chat
         if current_user['role'] == 'client':
             raise HTTPException(status_code=403, detail="Not authorized")
-        messages = await db.messages.find({"is_group_message": True}, {"_id": 0}).sort("created_at", -1).to_list(100)
+        query = {"is_group_message": True}
     elif receiver_id:
         # Direct messages between two users
-        messages = await db.messages.find({
+        query = {
             "$or": [
                 {"sender_id": current_user['id'], "receiver_id": receiver_id},
                 {"sender_id": receiver_id, "receiver_id": current_user['id']}
             ],
             "is_group_message": False
-        }, {"_id": 0}).sort("created_at", -1).to_list(100)
+        }
     else:
-        # All messages for current user
-        messages = await db.messages.find({
+        # All direct messages for current user
+        query = {
             "$or": [
                 {"sender_id": current_user['id']},
                 {"receiver_id": current_user['id']}
-            ]
-        }, {"_id": 0}).sort("created_at", -1).to_list(100)
+            ],
+            "is_group_message": False
+        }
+    
+    direction = 1 if after else -1
+    if before or after:
+        created_at, msg_id = decode_cursor(before or after, 2)
+        op = "$gt" if after else "$lt"
+        query = {"$and": [query, {"$or": [
+            {"created_at": {op: created_at}},
+            {"created_at": created_at, "id": {op: msg_id}}
+        ]}]}
+    
+    messages = await db.messages.find(query, {"_id": 0}).sort(
+        [("created_at", direction), ("id", direction)]
+    ).limit(limit + 1).to_list(limit + 1)
+    
+    has_more = len(messages) > limit
+    messages = messages[:limit]
+    if after:
+        messages.reverse()
+    
+    if messages:
+        newest, oldest = messages[0], messages[-1]
+        response.headers["X-After-Cursor"] = encode_cursor([message_timestamp(newest), newest['id']])
+        if has_more and not after:
+            response.headers["X-Before-Cursor"] = encode_cursor([message_timestamp(oldest), oldest['id']])
+    elif after:
+        response.headers["X-After-Cursor"] = after
     
     return messages
 
 @api_router.get("/messages/conversations")
 async def get_conversations(current_user: dict = Depends(get_current_user)):
-    # Get unique conversation partners
-    messages = await db.messages.find({
-        "$or": [
-            {"sender_id": current_user['id']},
-            {"receiver_id": current_user['id']}
-        ],
-        "is_group_message": False
-    }, {"_id": 0}).to_list(1000)
-    
-    partners = set()
-    for msg in messages:
-        if msg['sender_id'] != current_user['id']:
-            partners.add(msg['sender_id'])
-        if msg.get('receiver_id') and msg['receiver_id'] != current_user['id']:
-            partners.add(msg['receiver_id'])
-    
-    conversations = []
-    for partner_id in partners:
-        partner = await db.users.find_one({"id": partner_id}, {"_id": 0, "password_hash": 0})
-        if partner:
-            last_msg = await db.messages.find_one({
-                "$or": [
-                    {"sender_id": current_user['id'], "receiver_id": partner_id},
-                    {"sender_id": partner_id, "receiver_id": current_user['id']}
-                ]
-            }, {"_id": 0}, sort=[("created_at", -1)])
-            conversations.append({
-                "partner": UserResponse(**partner).model_dump(),
-                "last_message": last_msg
-            })
+    summaries = await direct_message_summaries(current_user['id'])
+    partners = {
+        partner['id']: partner async for partner in db.users.find(
+            {"id": {"$in": list(summaries)}}, {"_id": 0, "password_hash": 0}
+        )
+    }
     
-    return conversations
+    return [
+        {
+            "partner": UserResponse(**partners[partner_id]).model_dump(),
+            "last_message": summary['last_message'],
+            "unread_count": summary['unread_count']
+        }
+        for partner_id, summary in summaries.items() if partner_id in partners
+    ]
 
-@api_router.get("/messages/unread-count")
-async def get_unread_message_count(current_user: dict = Depends(get_current_user)):
-    """Get count of unread messages for the current user"""
-    # Count direct messages sent to user that are unread
-    unread_direct = await db.messages.count_documents({
-        "receiver_id": current_user['id'],
-        "is_group_message": False,
-        "read": False
-    })
+async def group_read_watermark(user: dict) -> str:
+    """
+    The user's group_read_at, initialised on first use when missing: from the
+    newest message in a not-yet-migrated read_group_messages list, otherwise from
+    when the account was created, so group messages sent since then stay unread.
+    """
+    if user.get('group_read_at'):
+        return user['group_read_at']
+    legacy = await db.users.find_one(
+        {"id": user['id']}, {"_id": 0, "group_read_at": 1, "read_group_messages": 1, "created_at": 1}
+    ) or {}
+    watermark = legacy.get('group_read_at')
+    if not watermark:
+        latest = await db.messages.find_one(
+            {"id": {"$in": legacy.get('read_group_messages') or []}, "is_group_message": True},
+            {"_id": 0, "created_at": 1}, sort=[("created_at", -1)]
+        )
+        watermark = message_timestamp(latest or legacy) or datetime.fromtimestamp(0, timezone.utc).isoformat()
+        await db.users.update_one({"id": user['id'], "group_read_at": {"$exists": False}}, {"$set": {"group_read_at": watermark}})
+    user['group_read_at'] = watermark
+    return watermark
+
+async def unread_message_counts(user: dict) -> dict:
+    """Unread direct and group message counts for a user (needs id, role and group_read_at)"""
+    # Unread direct messages, from the user's conversation summaries
+    unread_direct = sum(summary['unread_count'] for summary in (await direct_message_summaries(user['id'])).values())
     
     # For staff, also count unread group messages
     unread_group = 0
-    if current_user['role'] in ['admin', 'walker']:
-        # Get IDs of group messages user has read (stored in user's read_group_messages array)
-        user_data = await db.users.find_one({"id": current_user['id']}, {"_id": 0, "read_group_messages": 1})
-        read_group_ids = user_data.get('read_group_messages', []) if user_data else []
-        
-        # Count group messages not in user's read list
-        unread_group = await db.messages.count_documents({
+    if user['role'] in ['admin', 'walker']:
+        # Group messages newer than the user's read watermark
+        query = {
             "is_group_message": True,
-            "sender_id": {"$ne": current_user['id']},  # Exclude own messages
-            "id": {"$nin": read_group_ids}
-        })
+            "sender_id": {"$ne": user['id']},  # Exclude own messages
+            "created_at": {"$gt": await group_read_watermark(user)}
+        }
+        unread_group = await db.messages.count_documents(query)
     
     total_unread = unread_direct + unread_group
     
@@ -4271,30 +5915,187 @@ async def get_unread_message_count(current_user: dict = Depends(get_current_user
         "unread_group": unread_group
     }
 
+async def publish_unread_counts(user: dict):
+    await message_broker.publish(f"user:{user['id']}", {"type": "unread_count", **await unread_message_counts(user)})
+
+@api_router.get("/messages/unread-count")
+async def get_unread_message_count(current_user: dict = Depends(get_current_user)):
+    """Get count of unread messages for the current user"""
+    return await unread_message_counts(current_user)
+
+@api_router.websocket("/messages/ws")
+async def stream_messages(websocket: WebSocket):
+    """
+    Message stream for the authenticated user (?token=<jwt>). Sends the current
+    {"type": "unread_count", ...} and then {"type": "message", "message": ...}
+    for direct messages to or from the user, group messages for staff, and a
+    fresh unread_count whenever the user's direct unread count changes.
+    """
+    current_user = await authenticate_websocket(websocket)
+    if not current_user:
+        return
+    
+    await websocket.accept()
+    topics = [f"user:{current_user['id']}"]
+    if current_user['role'] in ['admin', 'walker']:
+        topics.append(STAFF_GROUP_TOPIC)
+    queue = live_hub.subscribe(topics[0])
+    for topic in topics[1:]:
+        live_hub.subscribe(topic, queue)
+    try:
+        await websocket.send_json({"type": "unread_count", **await unread_message_counts(current_user)})
+        await stream_topic(websocket, queue)
+    except (WebSocketDisconnect, RuntimeError):
+        pass  # Client went away
+    finally:
+        for topic in topics:
+            live_hub.unsubscribe(topic, queue)
+
 @api_router.post("/messages/mark-read")
 async def mark_messages_read(sender_id: Optional[str] = None, mark_group: bool = False, current_user: dict = Depends(get_current_user)):
     """Mark messages as read"""
     if mark_group:
-        # Mark group messages as read by adding to user's read list
-        group_messages = await db.messages.find(
-            {"is_group_message": True, "sender_id": {"$ne": current_user['id']}},
-            {"_id": 0, "id": 1}
-        ).to_list(1000)
-        group_ids = [m['id'] for m in group_messages]
-        
-        await db.users.update_one(
-            {"id": current_user['id']},
-            {"$addToSet": {"read_group_messages": {"$each": group_ids}}}
+        # Move the user's group read watermark up to the newest group message
+        latest = await db.messages.find_one(
+            {"is_group_message": True}, {"_id": 0, "created_at": 1}, sort=[("created_at", -1)]
         )
+        if latest:
+            await db.users.update_one(
+                {"id": current_user['id']},
+                {"$max": {"group_read_at": message_timestamp(latest)}}
+            )
+            current_user['group_read_at'] = max(current_user.get('group_read_at') or '', message_timestamp(latest))
     elif sender_id:
         # Mark direct messages from sender as read
         await db.messages.update_many(
             {"sender_id": sender_id, "receiver_id": current_user['id'], "is_group_message": False},
             {"$set": {"read": True}}
         )
+        await db.conversations.update_one(
+            {"id": conversation_id(sender_id, current_user['id'])},
+            {"$set": {f"unread.{current_user['id']}": 0}}
+        )
     
+    # Other open sessions of this user update their badges
+    await publish_unread_counts(current_user)
+
     return {"message": "Messages marked as read"}
 
+# Walker payroll ledger: one row per completed appointment with a walker,
+# earnings precomputed. Rows are "current payroll" until a paysheet claims them
+# by setting paysheet_id; claimed rows are never rewritten.
+async def sync_payroll_ledger(appt_ids: List[str]):
+    """Create, refresh or drop the unclaimed ledger rows for these appointments"""
+    appt_ids = list(set(appt_ids))
+    if not appt_ids:
+        return
+    appts = await db.appointments.find(
+        {"id": {"$in": appt_ids}, "status": "completed", "walker_id": {"$nin": [None, ""]}},
+        {"_id": 0, "id": 1, "walker_id": 1, "client_id": 1, "pet_ids": 1, "service_type": 1,
+         "scheduled_date": 1, "scheduled_time": 1, "actual_duration_minutes": 1, "distance_meters": 1}
+    ).to_list(None)
+    
+    # Appointments no longer completed (or unassigned) leave current payroll
+    completed_ids = {appt['id'] for appt in appts}
+    stale_ids = [appt_id for appt_id in appt_ids if appt_id not in completed_ids]
+    if stale_ids:
+        await db.payroll_ledger.delete_many({"appointment_id": {"$in": stale_ids}, "paysheet_id": None})
+    if not appts:
+        return
+    
+    loader = EnrichmentLoader(user_projection={"_id": 0, "full_name": 1}, pet_projection={"_id": 0, "name": 1})
+    loader.add_appointments(appts)
+    await loader.load()
+    
+    # Walks on a paysheet submitted before the ledger existed are created already claimed
+    legacy_claims = {}
+    async for paysheet in db.paysheets.find(
+        {"submitted": True, "appointment_ids": {"$in": list(completed_ids)}}, {"_id": 0, "id": 1, "appointment_ids": 1}
+    ):
+        for appt_id in paysheet.get('appointment_ids') or []:
+            legacy_claims.setdefault(appt_id, paysheet['id'])
+    
+    now = datetime.now(timezone.utc).isoformat()
+    updates = []
+    for appt in appts:
+        duration = appt.get('actual_duration_minutes') or 0
+        updates.append(UpdateOne(
+            {"appointment_id": appt['id'], "paysheet_id": None},
+            {
+                "$set": {
+                    "paysheet_id": legacy_claims.get(appt['id']),
+                    "walker_id": appt['walker_id'],
+                    "scheduled_date": appt.get('scheduled_date'),
+                    "scheduled_time": appt.get('scheduled_time', ''),
+                    "service_type": appt.get('service_type', ''),
+                    "duration_minutes": duration,
+                    "earnings": calculate_walk_earnings(appt.get('service_type', ''), duration),
+                    "client_name": loader.user_name(appt.get('client_id'), "Unknown"),
+                    "pet_names": loader.pet_names(appt.get('pet_ids')),
+                    "distance_meters": appt.get('distance_meters', 0),
+                    "updated_at": now
+                },
+                "$setOnInsert": {"created_at": now}
+            },
+            upsert=True
+        ))
+    try:
+        await db.payroll_ledger.bulk_write(updates, ordered=False)
+    except BulkWriteError as e:
+        # Rows already claimed by a paysheet hit the unique appointment_id index; leave them
+        if any(err.get('code') != 11000 for err in e.details.get('writeErrors', [])):
+            raise
+
+PAYROLL_LEDGER_MIGRATION = {"type": "migration", "name": "payroll_ledger"}
+_payroll_ledger_ready = False
+
+async def payroll_ledger_ready() -> bool:
+    """Whether the payroll_ledger migration has finished, so every completed walk has a row"""
+    global _payroll_ledger_ready
+    if not _payroll_ledger_ready:
+        state = await db.settings.find_one(PAYROLL_LEDGER_MIGRATION, {"_id": 0, "completed_at": 1})
+        _payroll_ledger_ready = bool(state and state.get('completed_at'))
+    return _payroll_ledger_ready
+
+async def unledgered_walk_ids(walker_id: Optional[str] = None) -> List[str]:
+    """Completed walks (of one walker, or all) that have no ledger row yet"""
+    in_ledger = await db.payroll_ledger.distinct("appointment_id", {"walker_id": walker_id} if walker_id else {})
+    return await db.appointments.distinct("id", {
+        "status": "completed", "walker_id": walker_id or {"$nin": [None, ""]}, "id": {"$nin": in_ledger}
+    })
+
+async def backfill_walker_ledger(walker_id: str):
+    """Until the payroll_ledger migration finishes, add this walker's missing rows on demand"""
+    if not await payroll_ledger_ready():
+        await sync_payroll_ledger(await unledgered_walk_ids(walker_id))
+
+def ledger_walk_details(rows: List[dict]) -> List[dict]:
+    """Ledger rows in the walk_details shape used by payroll and paysheets"""
+    return [
+        {
+            "id": row['appointment_id'],
+            "date": row['scheduled_date'],
+            "time": row.get('scheduled_time', ''),
+            "service_type": row.get('service_type', ''),
+            "duration_minutes": row.get('duration_minutes', 0),
+            "earnings": row.get('earnings', 0),
+            "client_name": row.get('client_name', "Unknown"),
+            "pet_names": row.get('pet_names', []),
+            "distance_meters": row.get('distance_meters', 0)
+        }
+        for row in rows
+    ]
+
+def payroll_totals(walk_details: List[dict]) -> dict:
+    total_minutes = sum(w['duration_minutes'] for w in walk_details)
+    return {
+        "total_hours": round(total_minutes / 60, 2),
+        "total_minutes": total_minutes,
+        "total_walks": len(walk_details),
+        "total_earnings": round(sum(w['earnings'] for w in walk_details), 2),
+        "total_distance_meters": round(sum(w['distance_meters'] or 0 for w in walk_details), 2)
+    }
+
 # Paysheet Routes
 @api_router.get("/paysheets")
 async def get_paysheets(current_user: dict = Depends(get_current_user)):
@@ -4344,80 +6145,29 @@ async def get_current_payroll(current_user: dict = Depends(get_current_user)):
     if current_user['role'] != 'walker':
         raise HTTPException(status_code=403, detail="Walkers only")
     
-    # Get IDs of walks already included in submitted paysheets
-    submitted_paysheets = await db.paysheets.find(
-        {"walker_id": current_user['id'], "submitted": True},
-        {"_id": 0, "appointment_ids": 1}
-    ).to_list(500)
-    
-    submitted_appointment_ids = set()
-    for ts in submitted_paysheets:
-        submitted_appointment_ids.update(ts.get('appointment_ids', []))
-    
-    # Get completed appointments NOT yet submitted
-    all_appointments = await db.appointments.find({
-        "walker_id": current_user['id'],
-        "status": "completed"
-    }, {"_id": 0}).sort("scheduled_date", -1).to_list(500)
-    
-    # Filter out already submitted walks
-    pending_walks = [a for a in all_appointments if a['id'] not in submitted_appointment_ids]
-    
-    # Calculate totals
-    total_minutes = 0
-    total_earnings = 0.0
-    walk_details = []
-    
-    for walk in pending_walks:
-        duration = walk.get('actual_duration_minutes', 0)
-        service_type = walk.get('service_type', '')
-        earnings = calculate_walk_earnings(service_type, duration)
-        
-        total_minutes += duration
-        total_earnings += earnings
-        
-        # Get client and pet names
-        client = await db.users.find_one({"id": walk['client_id']}, {"_id": 0, "full_name": 1})
-        pet_names = []
-        for pet_id in walk.get('pet_ids', []):
-            pet = await db.pets.find_one({"id": pet_id}, {"_id": 0, "name": 1})
-            if pet:
-                pet_names.append(pet['name'])
-        
-        walk_details.append({
-            "id": walk['id'],
-            "date": walk['scheduled_date'],
-            "time": walk.get('scheduled_time', ''),
-            "service_type": service_type,
-            "duration_minutes": duration,
-            "earnings": earnings,
-            "client_name": client.get('full_name') if client else "Unknown",
-            "pet_names": pet_names,
-            "distance_meters": walk.get('distance_meters', 0)
-        })
+    # Unclaimed ledger rows are the walks not yet on a paysheet
+    await backfill_walker_ledger(current_user['id'])
+    rows = await db.payroll_ledger.find(
+        {"walker_id": current_user['id'], "paysheet_id": None}, {"_id": 0}
+    ).sort([("scheduled_date", -1), ("scheduled_time", -1)]).to_list(None)
+    walk_details = ledger_walk_details(rows)
     
     return {
-        "total_hours": round(total_minutes / 60, 2),
-        "total_minutes": total_minutes,
-        "total_walks": len(pending_walks),
-        "total_earnings": round(total_earnings, 2),
+        **payroll_totals(walk_details),
         "walks": walk_details,
         "pay_rates": WALKER_PAY_RATES
     }
 
-@api_router.post("/paysheets/submit")
-async def submit_paysheet(current_user: dict = Depends(get_current_user)):
-    """Submit accumulated walks as a paysheet"""
-    if current_user['role'] != 'walker':
-        raise HTTPException(status_code=403, detail="Walkers only")
-    
-    # Get current accumulated data
-    current_payroll = await get_current_payroll(current_user)
-    
-    if current_payroll['total_walks'] == 0:
-        raise HTTPException(status_code=400, detail="No walks to submit")
-    
-    walks = current_payroll['walks']
+async def release_paysheet_ledger(paysheet_ids: List[str]):
+    """Return ledger rows claimed by these paysheets to the unclaimed pool"""
+    await db.payroll_ledger.update_many(
+        {"paysheet_id": {"$in": paysheet_ids}}, {"$set": {"paysheet_id": None}}
+    )
+
+async def insert_claimed_paysheet(walker_id: str, paysheet_id: str, rows: List[dict]) -> Paysheet:
+    """Build and store the paysheet for ledger rows already claimed under paysheet_id"""
+    walks = ledger_walk_details(rows)
+    current_payroll = payroll_totals(walks)
     
     # Determine period dates
     dates = [w['date'] for w in walks]
@@ -4425,7 +6175,8 @@ async def submit_paysheet(current_user: dict = Depends(get_current_user)):
     period_end = max(dates) if dates else datetime.now(timezone.utc).strftime("%Y-%m-%d")
     
     paysheet = Paysheet(
-        walker_id=current_user['id'],
+        id=paysheet_id,
+        walker_id=walker_id,
         period_start=period_start,
         period_end=period_end,
         total_hours=current_payroll['total_hours'],
@@ -4439,6 +6190,34 @@ async def submit_paysheet(current_user: dict = Depends(get_current_user)):
     ts_dict = paysheet.model_dump()
     ts_dict['created_at'] = ts_dict['created_at'].isoformat()
     await db.paysheets.insert_one(ts_dict)
+    return paysheet
+
+@api_router.post("/paysheets/submit")
+async def submit_paysheet(current_user: dict = Depends(get_current_user)):
+    """Submit accumulated walks as a paysheet"""
+    if current_user['role'] != 'walker':
+        raise HTTPException(status_code=403, detail="Walkers only")
+    
+    # Claim the unclaimed ledger rows first, so a concurrent submit can't include them twice
+    await backfill_walker_ledger(current_user['id'])
+    paysheet_id = str(uuid.uuid4())
+    await db.payroll_ledger.update_many(
+        {"walker_id": current_user['id'], "paysheet_id": None},
+        {"$set": {"paysheet_id": paysheet_id}}
+    )
+    rows = await db.payroll_ledger.find({"paysheet_id": paysheet_id}, {"_id": 0}).sort(
+        [("scheduled_date", -1), ("scheduled_time", -1)]
+    ).to_list(None)
+    
+    if not rows:
+        raise HTTPException(status_code=400, detail="No walks to submit")
+    
+    try:
+        paysheet = await insert_claimed_paysheet(current_user['id'], paysheet_id, rows)
+    except Exception:
+        # Hand the claimed walks back so they show up on the next submit
+        await release_paysheet_ledger([paysheet_id])
+        raise
     
     return {
         "message": "Paysheet submitted successfully",
@@ -4461,10 +6240,74 @@ async def mark_paysheet_paid(paysheet_id: str, current_user: dict = Depends(get_
     if current_user['role'] != 'admin':
         raise HTTPException(status_code=403, detail="Admin only")
     
-    await db.paysheets.update_one({"id": paysheet_id}, {"$set": {"paid": True}})
+    paysheet = await db.paysheets.find_one_and_update(
+        {"id": paysheet_id, "paid": {"$ne": True}},
+        {"$set": {"paid": True}},
+        projection={"_id": 0, "walk_details": 0}
+    )
+    # Only the request that flips paid adds the paysheet to the rollup
+    if paysheet:
+        await add_to_payroll_rollup(paysheet)
     return {"message": "Paysheet marked as paid"}
 
 # 1099 Payroll Reports
+# Paid paysheets are totalled per walker and month (by period_end). Reports
+# aggregate the paysheets directly, or read the payroll_monthly_rollup
+# collection (kept current by mark-paid) when PAYROLL_ROLLUP_REPORTS=true; run
+# the payroll_monthly_rollup migration before switching that on.
+PAYROLL_ROLLUP_REPORTS = os.environ.get('PAYROLL_ROLLUP_REPORTS', 'false').lower() == 'true'
+
+async def add_to_payroll_rollup(paysheet: dict):
+    """Add a newly paid paysheet to its walker/month rollup; a paysheet is only ever counted once"""
+    if not paysheet.get('walker_id') or not paysheet.get('period_end'):
+        return
+    month = paysheet['period_end'][:7]
+    try:
+        await db.payroll_monthly_rollup.update_one(
+            {"id": f"{paysheet['walker_id']}|{month}", "paysheet_ids": {"$ne": paysheet['id']}},
+            {
+                "$inc": {
+                    "earnings": paysheet.get('total_earnings', 0),
+                    "walks": paysheet.get('total_walks', 0),
+                    "hours": paysheet.get('total_hours', 0),
+                    "paysheets": 1
+                },
+                "$addToSet": {"paysheet_ids": paysheet['id']},
+                "$setOnInsert": {"walker_id": paysheet['walker_id'], "month": month}
+            },
+            upsert=True
+        )
+    except DuplicateKeyError:
+        pass  # Already counted in this month's rollup
+
+async def payroll_monthly_totals(year: int, walker_id: Optional[str] = None) -> List[dict]:
+    """Paid earnings, walks, hours and paysheet count per walker and month of a year"""
+    if PAYROLL_ROLLUP_REPORTS:
+        query = {"month": {"$gte": f"{year}-01", "$lte": f"{year}-12"}}
+        if walker_id:
+            query["walker_id"] = walker_id
+        return await db.payroll_monthly_rollup.find(
+            query, {"_id": 0, "walker_id": 1, "month": 1, "earnings": 1, "walks": 1, "hours": 1, "paysheets": 1}
+        ).to_list(None)
+    
+    match = {"paid": True, "period_end": {"$gte": f"{year}-01-01", "$lte": f"{year}-12-31"}}
+    if walker_id:
+        match["walker_id"] = walker_id
+    pipeline = [
+        {"$match": match},
+        {"$group": {
+            "_id": {"walker_id": "$walker_id", "month": {"$substr": ["$period_end", 0, 7]}},
+            "earnings": {"$sum": "$total_earnings"},
+            "walks": {"$sum": "$total_walks"},
+            "hours": {"$sum": "$total_hours"},
+            "paysheets": {"$sum": 1}
+        }}
+    ]
+    return [
+        {**row['_id'], **{k: row[k] for k in ("earnings", "walks", "hours", "paysheets")}}
+        async for row in db.paysheets.aggregate(pipeline)
+    ]
+
 @api_router.get("/reports/payroll/1099")
 async def get_1099_payroll_report(year: int = None, current_user: dict = Depends(get_current_user)):
     """
@@ -4476,9 +6319,7 @@ async def get_1099_payroll_report(year: int = None, current_user: dict = Depends
     
     now = datetime.now(timezone.utc)
     report_year = year or now.year
-    year_start = f"{report_year}-01-01"
-    year_end = f"{report_year}-12-31"
-    month_start = now.replace(day=1).strftime("%Y-%m-%d")
+    current_month = now.strftime("%Y-%m")
     
     # Get all walkers and sitters
     staff = await db.users.find(
@@ -4486,12 +6327,6 @@ async def get_1099_payroll_report(year: int = None, current_user: dict = Depends
         {"_id": 0, "password_hash": 0}
     ).to_list(500)
     
-    # Get all paid paysheets for the year
-    paysheets = await db.paysheets.find(
-        {"paid": True},
-        {"_id": 0}
-    ).to_list(10000)
-    
     # Calculate earnings per staff member
     staff_earnings = {}
     total_ytd = 0.0
@@ -4511,25 +6346,18 @@ async def get_1099_payroll_report(year: int = None, current_user: dict = Depends
             "paysheets_count": 0
         }
     
-    for ts in paysheets:
-        walker_id = ts.get('walker_id')
-        if not walker_id:
+    for row in await payroll_monthly_totals(report_year):
+        member = staff_earnings.get(row['walker_id'])
+        if not member:
             continue
-            
-        earnings = ts.get('total_earnings', 0)
-        period_end = ts.get('period_end', '')
+        member['year_total'] += row['earnings']
+        member['paysheets_count'] += row['paysheets']
+        total_ytd += row['earnings']
         
-        # Check if this paysheet falls within the report year
-        if period_end and period_end >= year_start and period_end <= year_end:
-            if walker_id in staff_earnings:
-                staff_earnings[walker_id]['year_total'] += earnings
-                staff_earnings[walker_id]['paysheets_count'] += 1
-                total_ytd += earnings
-                
-                # Check if it's in current month
-                if period_end >= month_start:
-                    staff_earnings[walker_id]['month_total'] += earnings
-                    total_mtd += earnings
+        # Check if it's the current month
+        if row['month'] == current_month:
+            member['month_total'] += row['earnings']
+            total_mtd += row['earnings']
     
     # Convert to list and sort by year_total descending
     staff_list = list(staff_earnings.values())
@@ -4585,46 +6413,23 @@ async def get_staff_1099_detail(staff_id: str, year: int = None, current_user: d
         {"_id": 0}
     ).sort("period_end", -1).to_list(1000)
     
-    # Calculate totals by month
-    monthly_breakdown = {}
-    total_earnings = 0.0
-    total_walks = 0
-    total_hours = 0.0
-    
-    for ts in paysheets:
-        earnings = ts.get('total_earnings', 0)
-        walks = ts.get('total_walks', 0)
-        hours = ts.get('total_hours', 0)
-        period_end = ts.get('period_end', '')
-        
-        total_earnings += earnings
-        total_walks += walks
-        total_hours += hours
-        
-        # Group by month
-        if period_end:
-            month_key = period_end[:7]  # YYYY-MM
-            if month_key not in monthly_breakdown:
-                monthly_breakdown[month_key] = {
-                    "month": month_key,
-                    "earnings": 0.0,
-                    "walks": 0,
-                    "hours": 0.0,
-                    "paysheets": 0
-                }
-            monthly_breakdown[month_key]['earnings'] += earnings
-            monthly_breakdown[month_key]['walks'] += walks
-            monthly_breakdown[month_key]['hours'] += hours
-            monthly_breakdown[month_key]['paysheets'] += 1
-    
-    # Convert monthly breakdown to sorted list
-    months_list = list(monthly_breakdown.values())
-    months_list.sort(key=lambda x: x['month'])
-    
-    # Round values
-    for month in months_list:
-        month['earnings'] = round(month['earnings'], 2)
-        month['hours'] = round(month['hours'], 2)
+    # Totals by month
+    months_list = sorted(
+        [
+            {
+                "month": row['month'],
+                "earnings": round(row['earnings'], 2),
+                "walks": row['walks'],
+                "hours": round(row['hours'], 2),
+                "paysheets": row['paysheets']
+            }
+            for row in await payroll_monthly_totals(report_year, staff_id)
+        ],
+        key=lambda month: month['month']
+    )
+    total_earnings = sum(month['earnings'] for month in months_list)
+    total_walks = sum(month['walks'] for month in months_list)
+    total_hours = sum(month['hours'] for month in months_list)
     
     return {
         "year": report_year,
@@ -4647,6 +6452,267 @@ async def get_staff_1099_detail(staff_id: str, year: int = None, current_user: d
         "paysheets": paysheets
     }
 
+# 1099 Export Jobs
+# POST /admin/exports/1099 queues a job that writes a ZIP of per-staff CSV and
+# PDF statements to uploads/exports. Statements are rendered in a process pool
+# so the event loop stays free; progress is kept on the export_jobs document.
+# Jobs run in the worker that accepted them and refresh heartbeat_at as they go.
+# A graceful shutdown marks its in-flight jobs failed; after a crash, startup
+# fails any queued/running job whose heartbeat is older than EXPORT_STALE_SECONDS.
+EXPORT_RENDER_WORKERS = int(os.environ.get('EXPORT_RENDER_WORKERS', '2'))
+EXPORT_STALE_SECONDS = int(os.environ.get('EXPORT_STALE_SECONDS', '300'))
+_export_executor: Optional[ProcessPoolExecutor] = None
+
+def get_export_executor() -> ProcessPoolExecutor:
+    global _export_executor
+    if _export_executor is None:
+        _export_executor = ProcessPoolExecutor(max_workers=EXPORT_RENDER_WORKERS)
+    return _export_executor
+
+def render_text_pdf(lines: List[str], lines_per_page: int = 52) -> bytes:
+    """Plain text PDF (Helvetica 10pt on Letter pages); no PDF library needed for statements"""
+    def escape(text: str) -> str:
+        return text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+    
+    pages = [lines[i:i + lines_per_page] for i in range(0, len(lines), lines_per_page)] or [[]]
+    objects = [
+        "<< /Type /Catalog /Pages 2 0 R >>",
+        "<< /Type /Pages /Kids [%s] /Count %d >>" % (" ".join(f"{4 + 2 * i} 0 R" for i in range(len(pages))), len(pages)),
+        "<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>",
+    ]
+    for i, page in enumerate(pages):
+        stream = "BT /F1 10 Tf 14 TL 50 760 Td " + " ".join(f"({escape(line)}) '" for line in page) + " ET"
+        objects.append(
+            "<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] "
+            f"/Resources << /Font << /F1 3 0 R >> >> /Contents {5 + 2 * i} 0 R >>"
+        )
+        objects.append(f"<< /Length {len(stream.encode('latin-1', 'replace'))} >>\nstream\n{stream}\nendstream")
+    
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(out))
+        out += f"{number} 0 obj\n{body}\nendobj\n".encode('latin-1', 'replace')
+    xref_at = len(out)
+    out += f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode()
+    out += "".join(f"{offset:010d} 00000 n \n" for offset in offsets).encode()
+    out += f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref_at}\n%%EOF\n".encode()
+    return bytes(out)
+
+def render_1099_statement(staff: dict, paysheets: List[dict], year: int) -> dict:
+    """
+    CSV and PDF earnings statement for one staff member's paid paysheets in a
+    year. Pure function of its arguments so it can run in the export process pool.
+    """
+    months = {}
+    for ps in paysheets:
+        month = months.setdefault(ps.get('period_end', '')[:7], {"earnings": 0.0, "walks": 0, "hours": 0.0, "paysheets": 0})
+        month['earnings'] += ps.get('total_earnings', 0)
+        month['walks'] += ps.get('total_walks', 0)
+        month['hours'] += ps.get('total_hours', 0)
+        month['paysheets'] += 1
+    total_earnings = round(sum(m['earnings'] for m in months.values()), 2)
+    totals = {
+        "year_earnings": total_earnings,
+        "total_walks": sum(m['walks'] for m in months.values()),
+        "total_hours": round(sum(m['hours'] for m in months.values()), 2),
+        "requires_1099": total_earnings >= 600
+    }
+    
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(["1099 earnings statement", year])
+    for label, key in (("Name", "full_name"), ("Email", "email"), ("Phone", "phone"), ("Address", "address"), ("Role", "role")):
+        writer.writerow([label, staff.get(key, '')])
+    writer.writerow(["Year earnings", f"{totals['year_earnings']:.2f}"])
+    writer.writerow(["Total walks", totals['total_walks']])
+    writer.writerow(["Total hours", f"{totals['total_hours']:.2f}"])
+    writer.writerow(["Requires 1099", "yes" if totals['requires_1099'] else "no"])
+    writer.writerow([])
+    writer.writerow(["Month", "Earnings", "Walks", "Hours", "Paysheets"])
+    for key in sorted(months):
+        m = months[key]
+        writer.writerow([key, f"{m['earnings']:.2f}", m['walks'], f"{m['hours']:.2f}", m['paysheets']])
+    writer.writerow([])
+    writer.writerow(["Paysheet", "Period start", "Period end", "Earnings", "Walks", "Hours"])
+    for ps in paysheets:
+        writer.writerow([ps.get('id'), ps.get('period_start', ''), ps.get('period_end', ''),
+                         f"{ps.get('total_earnings', 0):.2f}", ps.get('total_walks', 0), f"{ps.get('total_hours', 0):.2f}"])
+    
+    lines = [
+        f"1099 Earnings Statement - {year}",
+        "",
+        f"Name: {staff.get('full_name', 'Unknown')}",
+        f"Email: {staff.get('email', '')}",
+        f"Phone: {staff.get('phone', '')}",
+        f"Address: {staff.get('address', '')}",
+        "",
+        f"Year earnings: ${totals['year_earnings']:,.2f}",
+        f"Total walks: {totals['total_walks']}    Total hours: {totals['total_hours']:.2f}",
+        f"Requires 1099: {'Yes' if totals['requires_1099'] else 'No'}",
+        "",
+        "Monthly breakdown",
+    ] + [
+        f"  {key}    ${months[key]['earnings']:,.2f}    {months[key]['walks']} walks    {months[key]['hours']:.2f} h"
+        for key in sorted(months)
+    ]
+    
+    slug = re.sub(r"[^A-Za-z0-9]+", "_", staff.get('full_name') or 'staff').strip("_") or "staff"
+    return {
+        "name": f"{slug}_{staff['id'][:8]}",
+        "csv": buffer.getvalue().encode(),
+        "pdf": render_text_pdf(lines),
+        "summary": {"id": staff['id'], "full_name": staff.get('full_name', 'Unknown'), **totals}
+    }
+
+async def run_1099_export(job_id: str, year: int):
+    """Render every paid staff member's statement for the year into one ZIP"""
+    path = UPLOADS_DIR / 'exports' / f"1099_{year}_{job_id}.zip"
+    try:
+        # One pass over the year's paid paysheets, grouped by walker
+        pipeline = [
+            {"$match": {"paid": True, "walker_id": {"$nin": [None, ""]},
+                        "period_end": {"$gte": f"{year}-01-01", "$lte": f"{year}-12-31"}}},
+            {"$sort": {"period_end": 1}},
+            {"$group": {"_id": "$walker_id", "paysheets": {"$push": {
+                "id": "$id", "period_start": "$period_start", "period_end": "$period_end",
+                "total_earnings": "$total_earnings", "total_walks": "$total_walks", "total_hours": "$total_hours"
+            }}}}
+        ]
+        by_walker = {row['_id']: row['paysheets'] async for row in db.paysheets.aggregate(pipeline)}
+        staff = await db.users.find(
+            {"id": {"$in": list(by_walker)}},
+            {"_id": 0, "id": 1, "full_name": 1, "email": 1, "phone": 1, "address": 1, "role": 1}
+        ).to_list(None)
+        # Paid walkers whose account was deleted still get a statement, under "Unknown"
+        found = {member['id'] for member in staff}
+        missing_staff = sorted(wid for wid in by_walker if wid not in found)
+        staff += [{"id": wid, "full_name": "Unknown"} for wid in missing_staff]
+        if missing_staff:
+            logging.warning(f"1099 export {job_id}: {len(missing_staff)} paid walkers have no user record")
+        await db.export_jobs.update_one({"id": job_id}, {"$set": {
+            "status": "running", "total": len(staff), "missing_staff": missing_staff,
+            "heartbeat_at": datetime.now(timezone.utc).isoformat()
+        }})
+        
+        loop = asyncio.get_running_loop()
+        executor = get_export_executor()
+        renders = [
+            loop.run_in_executor(executor, render_1099_statement, member, by_walker[member['id']], year)
+            for member in staff
+        ]
+        summaries = []
+        with zipfile.ZipFile(path, "w", compression=zipfile.ZIP_DEFLATED) as archive:
+            for processed, render in enumerate(asyncio.as_completed(renders), start=1):
+                statement = await render
+                await asyncio.to_thread(archive.writestr, f"{statement['name']}.csv", statement['csv'])
+                await asyncio.to_thread(archive.writestr, f"{statement['name']}.pdf", statement['pdf'])
+                summaries.append(statement['summary'])
+                if processed % 10 == 0 or processed == len(renders):
+                    await db.export_jobs.update_one({"id": job_id}, {"$set": {
+                        "processed": processed, "heartbeat_at": datetime.now(timezone.utc).isoformat()
+                    }})
+            
+            summary_csv = io.StringIO()
+            writer = csv.writer(summary_csv)
+            writer.writerow(["Staff ID", "Name", "Year earnings", "Total walks", "Total hours", "Requires 1099"])
+            for row in sorted(summaries, key=lambda r: r['year_earnings'], reverse=True):
+                writer.writerow([row['id'], row['full_name'], f"{row['year_earnings']:.2f}",
+                                 row['total_walks'], f"{row['total_hours']:.2f}", "yes" if row['requires_1099'] else "no"])
+            archive.writestr("summary.csv", summary_csv.getvalue())
+        
+        await db.export_jobs.update_one({"id": job_id}, {"$set": {
+            "status": "completed",
+            "file_name": path.name,
+            "file_size": path.stat().st_size,
+            "completed_at": datetime.now(timezone.utc).isoformat()
+        }})
+    except asyncio.CancelledError:
+        path.unlink(missing_ok=True)
+        await db.export_jobs.update_one({"id": job_id}, {"$set": {
+            "status": "failed", "error": "Interrupted by server restart",
+            "completed_at": datetime.now(timezone.utc).isoformat()
+        }})
+        raise
+    except Exception as e:
+        logging.error(f"1099 export {job_id} failed: {e}")
+        path.unlink(missing_ok=True)
+        await db.export_jobs.update_one({"id": job_id}, {"$set": {
+            "status": "failed", "error": str(e), "completed_at": datetime.now(timezone.utc).isoformat()
+        }})
+
+_export_tasks = set()
+
+async def fail_stale_export_jobs() -> int:
+    """Mark queued/running exports with no recent heartbeat as failed; returns how many"""
+    now = datetime.now(timezone.utc)
+    cutoff = (now - timedelta(seconds=EXPORT_STALE_SECONDS)).isoformat()
+    result = await db.export_jobs.update_many(
+        {"status": {"$in": ["queued", "running"]}, "$or": [
+            {"heartbeat_at": {"$lt": cutoff}},
+            {"heartbeat_at": {"$exists": False}, "created_at": {"$lt": cutoff}}
+        ]},
+        {"$set": {"status": "failed", "error": "Interrupted by server restart", "completed_at": now.isoformat()}}
+    )
+    return result.modified_count
+
+async def cancel_export_tasks():
+    """Cancel this worker's in-flight exports so they are recorded as failed"""
+    for task in list(_export_tasks):
+        task.cancel()
+    await asyncio.gather(*_export_tasks, return_exceptions=True)
+
+@api_router.post("/admin/exports/1099")
+async def start_1099_export(year: int = None, current_user: dict = Depends(get_current_user)):
+    """Queue a ZIP export of every staff member's 1099 statement for a year (admin only)"""
+    if current_user['role'] != 'admin':
+        raise HTTPException(status_code=403, detail="Admin only")
+    
+    now = datetime.now(timezone.utc).isoformat()
+    job = {
+        "id": str(uuid.uuid4()),
+        "type": "1099",
+        "year": year or datetime.now(timezone.utc).year,
+        "status": "queued",
+        "total": 0,
+        "processed": 0,
+        "created_by": current_user['id'],
+        "created_at": now,
+        "heartbeat_at": now
+    }
+    await db.export_jobs.insert_one(job)
+    job.pop('_id', None)
+    
+    task = asyncio.create_task(run_1099_export(job['id'], job['year']))
+    _export_tasks.add(task)  # Keep a reference until it finishes
+    task.add_done_callback(_export_tasks.discard)
+    return job
+
+@api_router.get("/admin/exports/{job_id}")
+async def get_export_job(job_id: str, current_user: dict = Depends(get_current_user)):
+    """Export job status and progress (admin only)"""
+    if current_user['role'] != 'admin':
+        raise HTTPException(status_code=403, detail="Admin only")
+    job = await db.export_jobs.find_one({"id": job_id}, {"_id": 0})
+    if not job:
+        raise HTTPException(status_code=404, detail="Export not found")
+    return job
+
+@api_router.get("/admin/exports/{job_id}/download")
+async def download_export(job_id: str, current_user: dict = Depends(get_current_user)):
+    """Download a completed export's ZIP (admin only)"""
+    if current_user['role'] != 'admin':
+        raise HTTPException(status_code=403, detail="Admin only")
+    job = await db.export_jobs.find_one({"id": job_id}, {"_id": 0})
+    if not job:
+        raise HTTPException(status_code=404, detail="Export not found")
+    if job['status'] != 'completed':
+        raise HTTPException(status_code=409, detail=f"Export is {job['status']}")
+    path = UPLOADS_DIR / 'exports' / job['file_name']
+    if not path.exists():
+        raise HTTPException(status_code=410, detail="Export file no longer available")
+    return FileResponse(path, media_type="application/zip", filename=f"1099_statements_{job['year']}.zip")
+
 # Accounts Receivable Aging Report
 @api_router.get("/reports/receivable-aging")
 async def get_receivable_aging_report(current_user: dict = Depends(get_current_user)):
@@ -4804,7 +6870,7 @@ async def auto_complete_past_services(current_user: dict = Depends(get_current_u
         "service_type": auto_complete_pattern,
         "scheduled_date": {"$lt": yesterday},
         "status": "scheduled"
-    }, {"_id": 0}).to_list(1000)
+    }, APPOINTMENT_LIST_PROJECTION).to_list(1000)
     
     completed_count = 0
     for appt in past_services:
@@ -4821,6 +6887,7 @@ async def auto_complete_past_services(current_user: dict = Depends(get_current_u
             }}
         )
         completed_count += 1
+    await sync_payroll_ledger([appt['id'] for appt in past_services])
     
     return {
         "message": f"Auto-completed {completed_count} past daycare/overnight appointments",
@@ -4838,50 +6905,50 @@ async def get_clients_due_for_billing(current_user: dict = Depends(get_current_u
     # Only auto-complete day care, overnight, transport services (walks must be completed by walker)
     auto_complete_pattern = {"$regex": "day_care|day_camp|daycare|overnight|petsit|transport|boarding", "$options": "i"}
     
+    auto_complete_query = {
+        "service_type": auto_complete_pattern,
+        "scheduled_date": {"$lt": yesterday},
+        "status": "scheduled"
+    }
+    auto_completed_ids = await db.appointments.distinct("id", auto_complete_query)
     auto_complete_result = await db.appointments.update_many(
-        {
-            "service_type": auto_complete_pattern,
-            "scheduled_date": {"$lt": yesterday},
-            "status": "scheduled"
-        },
+        {**auto_complete_query, "id": {"$in": auto_completed_ids}},
         {"$set": {
             "status": "completed",
             "completed_at": datetime.now(timezone.utc).isoformat(),
             "auto_completed": True
         }}
     )
+    await sync_payroll_ledger(auto_completed_ids)
     
     # Get all clients with their billing cycles
     clients = await db.users.find({"role": "client"}, {"_id": 0, "password_hash": 0}).to_list(1000)
     
-    clients_due = []
+    due = []
     for client in clients:
-        billing_cycle = client.get('billing_cycle', 'weekly')
-        
         # Get uninvoiced completed appointments for this client
         uninvoiced_appts = await db.appointments.find({
             "client_id": client['id'],
             "status": "completed",
             "invoiced": {"$ne": True}
-        }, {"_id": 0}).to_list(500)
-        
+        }, {"_id": 0, "id": 1, "client_id": 1, "service_type": 1}).to_list(500)
         if uninvoiced_appts:
-            # Calculate total amount
-            total = 0.0
-            for appt in uninvoiced_appts:
-                service = await db.services.find_one({"service_type": appt['service_type']}, {"_id": 0})
-                if service:
-                    total += service['price']
-            
-            clients_due.append({
-                "client_id": client['id'],
-                "client_name": client['full_name'],
-                "email": client['email'],
-                "billing_cycle": billing_cycle,
-                "uninvoiced_appointments": len(uninvoiced_appts),
-                "total_amount": round(total, 2),
-                "appointment_ids": [a['id'] for a in uninvoiced_appts]
-            })
+            due.append((client, uninvoiced_appts))
+    
+    # Price every due appointment in one pass
+    appt_prices = await service_prices.price_appointments([a for _, appts in due for a in appts])
+    
+    clients_due = []
+    for client, uninvoiced_appts in due:
+        clients_due.append({
+            "client_id": client['id'],
+            "client_name": client['full_name'],
+            "email": client['email'],
+            "billing_cycle": client.get('billing_cycle', 'weekly'),
+            "uninvoiced_appointments": len(uninvoiced_appts),
+            "total_amount": round(sum(appt_prices[a['id']] for a in uninvoiced_appts), 2),
+            "appointment_ids": [a['id'] for a in uninvoiced_appts]
+        })
     
     return clients_due
 
@@ -4891,15 +6958,12 @@ async def generate_invoice_for_client(client_id: str, appointment_ids: List[str]
         raise HTTPException(status_code=403, detail="Admin only")
     
     # Calculate total from appointments
-    total = 0.0
-    for appt_id in appointment_ids:
-        appt = await db.appointments.find_one({"id": appt_id}, {"_id": 0})
-        if appt:
-            service = await db.services.find_one({"service_type": appt['service_type']}, {"_id": 0})
-            if service:
-                total += service['price']
-            # Mark appointment as invoiced
-            await db.appointments.update_one({"id": appt_id}, {"$set": {"invoiced": True}})
+    appts = await db.appointments.find(
+        {"id": {"$in": appointment_ids}}, {"_id": 0, "id": 1, "client_id": 1, "service_type": 1}
+    ).to_list(None)
+    total = sum((await service_prices.price_appointments(appts)).values())
+    # Mark appointments as invoiced
+    await db.appointments.update_many({"id": {"$in": [a['id'] for a in appts]}}, {"$set": {"invoiced": True}})
     
     due_date = (datetime.now(timezone.utc) + timedelta(days=30)).strftime("%Y-%m-%d")
     invoice = Invoice(
@@ -4940,6 +7004,7 @@ async def update_service_pricing(service_id: str, name: Optional[str] = None, pr
     
     if update_data:
         await db.services.update_one({"id": service_id}, {"$set": update_data})
+        await service_prices.invalidate()
     
     return {"message": "Service updated successfully"}
 
@@ -4951,6 +7016,7 @@ async def delete_service(service_id: str, current_user: dict = Depends(get_curre
     result = await db.services.delete_one({"id": service_id})
     if result.deleted_count == 0:
         raise HTTPException(status_code=404, detail="Service not found")
+    await service_prices.invalidate()
     
     return {"message": "Service deleted successfully"}
 
@@ -5307,6 +7373,7 @@ async def client_edit_appointment(
     
     if update_data:
         await db.appointments.update_one({"id": appt_id}, {"$set": update_data})
+        walker_schedule_index.invalidate(appt.get("scheduled_date"), scheduled_date)
     
     updated = await db.appointments.find_one({"id": appt_id}, {"_id": 0})
     return updated
@@ -5333,6 +7400,7 @@ async def client_cancel_appointment(
         {"id": appt_id}, 
         {"$set": {"status": "cancelled", "cancelled_by": "client", "cancelled_at": datetime.now(timezone.utc).isoformat()}}
     )
+    walker_schedule_index.invalidate(appt.get("scheduled_date"))
     
     return {"message": "Appointment cancelled successfully"}
 
@@ -5448,6 +7516,7 @@ async def accept_trade_request(
         {"id": trade["appointment_id"]},
         {"$set": {"walker_id": trade["target_walker_id"]}}
     )
+    walker_schedule_index.invalidate()
     
     return {"message": "Trade accepted, appointment transferred"}
 
@@ -5494,7 +7563,7 @@ async def create_time_off_request(
         "walker_id": current_user["id"],
         "status": "scheduled",
         "scheduled_date": {"$gte": request.start_date, "$lte": request.end_date}
-    }, {"_id": 0}).to_list(1000)
+    }, APPOINTMENT_LIST_PROJECTION).to_list(1000)
     
     affected_ids = [a["id"] for a in affected_appts]
     
@@ -5525,7 +7594,7 @@ async def create_time_off_request(
             receiver_id=admin["id"],
             content=f"Time-off request: {current_user['full_name']} requested time off from {request.start_date} to {request.end_date}. {len(affected_ids)} appointment(s) need reassignment."
         )
-        await db.messages.insert_one(notification.model_dump())
+        await save_message(notification)
     
     return {
         "message": "Time-off request submitted",
@@ -5594,76 +7663,51 @@ async def auto_generate_invoices(
     start_str = start_date.strftime("%Y-%m-%d")
     end_str = end_date.strftime("%Y-%m-%d")
     
-    # Get all clients with completed appointments in this period
-    clients = await db.users.find({"role": "client"}, {"_id": 0}).to_list(1000)
+    started = time.monotonic()
     
-    invoices_created = []
+    # All unbilled, non-canceled appointments in the period, grouped by client below
+    # Simple logic:
+    # - Walks (service_type contains "walk") = only billable when completed
+    # - Everything else = billable if scheduled or completed (not canceled)
+    all_appts = await db.appointments.find({
+        "status": {"$in": ["completed", "scheduled"]},  # Not canceled
+        "scheduled_date": {"$gte": start_str, "$lte": end_str},
+        "$or": [{"invoiced": {"$ne": True}}, {"invoiced": {"$exists": False}}]
+    }, {"_id": 0, "id": 1, "client_id": 1, "service_type": 1, "status": 1}).to_list(None)
+    
+    clients = await db.users.find(
+        {"role": "client", "id": {"$in": list({a.get("client_id") for a in all_appts})}},
+        {"_id": 0, "id": 1, "full_name": 1}
+    ).to_list(None)
+    
+    billable_by_client = {client["id"]: [] for client in clients}
+    auto_complete_ids = []
+    for appt in all_appts:
+        if appt.get("client_id") not in billable_by_client:
+            continue
+        is_walk = "walk" in (appt.get("service_type") or "").lower()
+        if is_walk and appt.get("status") != "completed":
+            continue  # Walks must be completed to be billed
+        billable_by_client[appt["client_id"]].append(appt)
+        if appt.get("status") == "scheduled":
+            # Daycare, overnight, transport, etc. are billed unless canceled
+            auto_complete_ids.append(appt["id"])
+    
+    appt_prices = await service_prices.price_appointments(
+        [a for appts in billable_by_client.values() for a in appts]
+    )
     
+    due_date = (today + timedelta(days=14)).strftime("%Y-%m-%d")
+    invoice_docs = []
+    invoice_updates = []
+    invoices_created = []
     for client in clients:
-        # Get unbilled appointments for this client in the date range
-        # Simple logic:
-        # - Walks (service_type contains "walk") = only billable when completed
-        # - Everything else = billable if scheduled or completed (not canceled)
-        
-        # Get ALL appointments in date range that aren't invoiced
-        all_appts = await db.appointments.find({
-            "client_id": client["id"],
-            "status": {"$in": ["completed", "scheduled"]},  # Not canceled
-            "scheduled_date": {"$gte": start_str, "$lte": end_str},
-            "$or": [{"invoiced": {"$ne": True}}, {"invoiced": {"$exists": False}}]
-        }, {"_id": 0}).to_list(1000)
-        
-        # Filter: walks must be completed, everything else is billable
-        billable_appts = []
-        for appt in all_appts:
-            service_type = (appt.get("service_type") or "").lower()
-            is_walk = "walk" in service_type
-            
-            if is_walk:
-                # Walks must be completed to be billed
-                if appt.get("status") == "completed":
-                    billable_appts.append(appt)
-            else:
-                # Everything else (daycare, overnight, transport, etc.) is billable if not canceled
-                billable_appts.append(appt)
-        
-        appts = billable_appts
-        
-        # Debug logging
-        print(f"Client {client.get('full_name')}: Found {len(all_appts)} total appts, {len(billable_appts)} billable")
-        for a in all_appts:
-            print(f"  - {a.get('scheduled_date')} | {a.get('service_type')} | status={a.get('status')} | invoiced={a.get('invoiced')}")
-        
+        appts = billable_by_client[client["id"]]
         if not appts:
             continue
-        
-        # Mark any scheduled non-walk appointments as completed since we're billing them
-        for appt in appts:
-            service_type = (appt.get("service_type") or "").lower()
-            if appt.get("status") == "scheduled" and "walk" not in service_type:
-                await db.appointments.update_one(
-                    {"id": appt["id"]},
-                    {"$set": {
-                        "status": "completed",
-                        "completed_at": datetime.now(timezone.utc).isoformat(),
-                        "auto_completed": True,
-                        "completion_data": {"auto_completed": True, "reason": "Completed for billing - service not canceled"}
-                    }}
-                )
-        
-        # Calculate total
-        total = 0
-        for appt in appts:
-            service = await db.services.find_one({"service_type": appt["service_type"]}, {"_id": 0})
-            if service:
-                total += service["price"]
-            else:
-                # Default prices
-                default_prices = {"walk_30": 25, "walk_45": 35, "walk_60": 40, "doggy_day_care": 45, "stay_overnight": 75}
-                total += default_prices.get(appt["service_type"], 30)
+        total = round(sum(appt_prices[a["id"]] for a in appts), 2)
         
         # Create invoice in "draft" status for review
-        due_date = (today + timedelta(days=14)).strftime("%Y-%m-%d")
         invoice = Invoice(
             client_id=client["id"],
             appointment_ids=[a["id"] for a in appts],
@@ -5676,27 +7720,49 @@ async def auto_generate_invoices(
         invoice_dict["billing_period_start"] = start_str
         invoice_dict["billing_period_end"] = end_str
         invoice_dict["review_status"] = "pending"  # pending, approved, sent
-        
-        await db.invoices.insert_one(invoice_dict)
-        
-        # Mark appointments as invoiced
-        appt_ids = [a["id"] for a in appts]
-        await db.appointments.update_many(
-            {"id": {"$in": appt_ids}},
+        invoice_docs.append(invoice_dict)
+        invoice_updates.append(UpdateMany(
+            {"id": {"$in": invoice.appointment_ids}},
             {"$set": {"invoiced": True, "invoice_id": invoice.id}}
-        )
-        
+        ))
         invoices_created.append({
             "invoice_id": invoice.id,
-            "client_name": client["full_name"],
+            "client_name": client.get("full_name"),
             "amount": total,
             "appointments_count": len(appts)
         })
     
+    if auto_complete_ids:
+        # Mark scheduled non-walk appointments as completed since we're billing them
+        await db.appointments.update_many(
+            {"id": {"$in": auto_complete_ids}, "status": "scheduled"},
+            {"$set": {
+                "status": "completed",
+                "completed_at": datetime.now(timezone.utc).isoformat(),
+                "auto_completed": True,
+                "completion_data": {"auto_completed": True, "reason": "Completed for billing - service not canceled"}
+            }}
+        )
+        await sync_payroll_ledger(auto_complete_ids)
+    if invoice_docs:
+        await db.invoices.insert_many(invoice_docs)
+        await db.appointments.bulk_write(invoice_updates, ordered=False)
+    
+    report = {
+        "appointments_scanned": len(all_appts),
+        "appointments_billed": sum(i["appointments_count"] for i in invoices_created),
+        "appointments_auto_completed": len(auto_complete_ids),
+        "clients_billed": len(invoices_created),
+        "total_amount": sum(i["amount"] for i in invoices_created),
+        "duration_ms": round((time.monotonic() - started) * 1000)
+    }
+    logging.info(f"Auto-invoice {cycle} {start_str}..{end_str}: {report}")
+    
     return {
         "message": f"Auto-generated {len(invoices_created)} invoices for {cycle} billing",
         "period": f"{start_str} to {end_str}",
-        "invoices": invoices_created
+        "invoices": invoices_created,
+        "report": report
     }
 
 @api_router.post("/invoices/{invoice_id}/approve-review")
@@ -5795,6 +7861,7 @@ async def walker_cancel_appointment(
             "walker_id": None  # Remove walker assignment
         }}
     )
+    walker_schedule_index.invalidate(appt.get("scheduled_date"))
     
     # Notify admin
     admins = await db.users.find({"role": "admin"}, {"_id": 0}).to_list(100)
@@ -5804,7 +7871,7 @@ async def walker_cancel_appointment(
             receiver_id=admin["id"],
             content=f"Walker {current_user['full_name']} cancelled appointment on {appt['scheduled_date']}. Reason: {request.reason}. Appointment needs reassignment."
         )
-        await db.messages.insert_one(notification.model_dump())
+        await save_message(notification)
     
     return {"message": "Appointment cancelled and flagged for reassignment"}
 
@@ -6322,6 +8389,7 @@ async def complete_client_onboarding(
                 await db.appointments.insert_one(appointment)
                 appointment.pop("_id", None)
                 schedules_created.append(appointment)
+    walker_schedule_index.invalidate()
     
     # Create notification for admin(s)
     admins = await db.users.find({"role": "admin", "is_active": True}, {"_id": 0, "id": 1}).to_list(100)
@@ -6485,6 +8553,397 @@ async def complete_staff_onboarding(
     
     return {"message": "Profile setup completed successfully"}
 
+# ============================================
+# DATABASE INDEXES
+# ============================================
+
+# Declarative index registry: collection -> index specs. Keys use pymongo's
+# (field, direction) tuples; names default to pymongo's generated names so
+# re-applying the registry against an existing database is a no-op.
+DB_INDEXES = {
+    "users": [
+        {"keys": [("id", 1)], "unique": True},
+        {"keys": [("username", 1)]},
+        {"keys": [("email", 1)]},
+        {"keys": [("role", 1), ("is_active", 1)]},
+    ],
+    "pets": [
+        {"keys": [("id", 1)], "unique": True},
+        {"keys": [("owner_id", 1)]},
+    ],
+    "appointments": [
+        {"keys": [("id", 1)], "unique": True},
+        # Guards materialize_appointments against concurrent duplicate inserts
+        {"keys": [("materialized_key", 1)], "unique": True,
+         "partialFilterExpression": {"materialized_key": {"$exists": True}}},
+        {"keys": [("walker_id", 1), ("scheduled_date", 1), ("status", 1)]},
+        {"keys": [("client_id", 1), ("scheduled_date", 1), ("scheduled_time", 1), ("service_type", 1)]},
+        {"keys": [("scheduled_date", 1), ("scheduled_time", 1)]},
+        {"keys": [("status", 1), ("scheduled_date", 1)]},
+        {"keys": [("recurring_schedule_id", 1), ("scheduled_date", 1)]},
+        {"keys": [("is_tracking", 1), ("status", 1)]},
+        {"keys": [("needs_reassignment", 1), ("status", 1)]},
+        {"keys": [("invoice_id", 1)]},
+    ],
+    "recurring_schedules": [
+        {"keys": [("id", 1)], "unique": True},
+        {"keys": [("client_id", 1), ("status", 1)]},
+        {"keys": [("walker_id", 1)]},
+        {"keys": [("status", 1), ("materialized_through", 1)]},
+    ],
+    "messages": [
+        {"keys": [("id", 1)], "unique": True},
+        {"keys": [("sender_id", 1), ("receiver_id", 1), ("created_at", -1), ("id", -1)]},
+        {"keys": [("sender_id", 1), ("is_group_message", 1), ("created_at", -1), ("id", -1)]},
+        {"keys": [("receiver_id", 1), ("is_group_message", 1), ("created_at", -1), ("id", -1)]},
+        {"keys": [("receiver_id", 1), ("is_group_message", 1), ("read", 1)]},
+        {"keys": [("is_group_message", 1), ("created_at", -1), ("id", -1)]},
+    ],
+    "invoices": [
+        {"keys": [("id", 1)], "unique": True},
+        {"keys": [("client_id", 1), ("status", 1)]},
+        {"keys": [("status", 1)]},
+        {"keys": [("review_status", 1)]},
+    ],
+    "paysheets": [
+        {"keys": [("id", 1)], "unique": True},
+        {"keys": [("walker_id", 1), ("submitted", 1)]},
+        {"keys": [("walker_id", 1), ("created_at", -1)]},
+        {"keys": [("paid", 1), ("period_end", 1)]},
+        {"keys": [("walker_id", 1), ("paid", 1), ("period_end", -1)]},
+        {"keys": [("appointment_ids", 1)]},
+    ],
+    "export_jobs": [
+        {"keys": [("id", 1)], "unique": True},
+    ],
+    "payroll_monthly_rollup": [
+        {"keys": [("id", 1)], "unique": True},
+        {"keys": [("month", 1), ("walker_id", 1)]},
+    ],
+    "conversations": [
+        {"keys": [("id", 1)], "unique": True},
+        {"keys": [("participants", 1), ("last_message_at", -1)]},
+    ],
+    "payroll_ledger": [
+        {"keys": [("appointment_id", 1)], "unique": True},
+        {"keys": [("walker_id", 1), ("paysheet_id", 1), ("scheduled_date", -1)]},
+        {"keys": [("paysheet_id", 1)]},
+    ],
+    "notifications": [
+        {"keys": [("user_id", 1), ("type", 1), ("created_at", -1)]},
+        {"keys": [("type", 1), ("client_id", 1)]},
+    ],
+    "dog_park_posts": [
+        {"keys": [("id", 1)], "unique": True},
+        {"keys": [("created_at", -1)]},
+    ],
+    "time_off_requests": [
+        {"keys": [("id", 1)], "unique": True},
+        {"keys": [("walker_id", 1)]},
+    ],
+    "services": [
+        {"keys": [("service_type", 1)]},
+    ],
+    "walk_points": [
+        {"keys": [("appointment_id", 1), ("timestamp", 1)], "unique": True},
+    ],
+}
+
+def index_name(keys: list) -> str:
+    """Default MongoDB index name for a key pattern, e.g. walker_id_1_scheduled_date_1"""
+    return "_".join(f"{field}_{direction}" for field, direction in keys)
+
+async def ensure_indexes() -> dict:
+    """
+    Create every index in DB_INDEXES. Safe to run repeatedly: creating an index
+    that already exists with the same name and options does nothing.
+    Failures (e.g. duplicate data blocking a unique index) are logged and
+    reported, not raised, so one bad collection cannot block startup.
+    """
+    applied = 0
+    failed = []
+    for collection, specs in DB_INDEXES.items():
+        for spec in specs:
+            options = {k: v for k, v in spec.items() if k != "keys"}
+            name = options.pop("name", None) or index_name(spec["keys"])
+            try:
+                await db[collection].create_index(spec["keys"], name=name, **options)
+                applied += 1
+            except PyMongoError as e:
+                logging.warning(f"Could not create index {collection}.{name}: {e}")
+                failed.append({"collection": collection, "index": name, "error": str(e)})
+    return {"applied": applied, "failed": failed}
+
+async def get_index_report() -> dict:
+    """
+    Compare live indexes with DB_INDEXES.
+    - missing: declared in the registry but not present in the database
+    - unmanaged: present in the database but not declared in the registry
+    - unused: no recorded accesses since the mongod process started ($indexStats)
+    - redundant: key pattern is a prefix of another index on the same collection
+    """
+    report = []
+    for collection, specs in DB_INDEXES.items():
+        existing = await db[collection].index_information()
+        declared = {spec.get("name") or index_name(spec["keys"]) for spec in specs}
+        
+        usage = {}
+        try:
+            async for stat in db[collection].aggregate([{"$indexStats": {}}]):
+                usage[stat["name"]] = stat.get("accesses", {}).get("ops", 0)
+        except PyMongoError:
+            usage = {}  # $indexStats not available (e.g. missing privileges)
+        
+        redundant = []
+        for name, info in existing.items():
+            if name == "_id_" or info.get("unique") or info.get("partialFilterExpression"):
+                continue
+            key = list(info["key"])
+            for other_name, other in existing.items():
+                other_key = list(other["key"])
+                if other_name != name and len(other_key) > len(key) and other_key[:len(key)] == key:
+                    redundant.append({"index": name, "covered_by": other_name})
+                    break
+        
+        report.append({
+            "collection": collection,
+            "missing": sorted(declared - existing.keys()),
+            "unmanaged": sorted(n for n in existing if n != "_id_" and n not in declared),
+            "unused": sorted(n for n, ops in usage.items() if ops == 0 and n != "_id_"),
+            "redundant": redundant,
+        })
+    
+    return {
+        "generated_at": datetime.now(timezone.utc).isoformat(),
+        "collections": report,
+        "missing_count": sum(len(c["missing"]) for c in report),
+    }
+
+@api_router.get("/admin/recurring-scheduler")
+async def get_recurring_scheduler_status(current_user: dict = Depends(get_current_user)):
+    """Recurring scheduler settings and the result of its last pass (admin only)"""
+    if current_user['role'] != 'admin':
+        raise HTTPException(status_code=403, detail="Admin only")
+    return {
+        "running": recurring_scheduler._task is not None and not recurring_scheduler._task.done(),
+        "horizon_weeks": recurring_scheduler.horizon_weeks,
+        "interval_seconds": recurring_scheduler.interval_seconds,
+        "last_run": recurring_scheduler.last_run,
+    }
+
+@api_router.post("/admin/recurring-scheduler/run")
+async def run_recurring_scheduler(current_user: dict = Depends(get_current_user)):
+    """Ask the recurring scheduler to run a pass now (admin only)"""
+    if current_user['role'] != 'admin':
+        raise HTTPException(status_code=403, detail="Admin only")
+    recurring_scheduler.wake()
+    return {"message": "Recurring scheduler pass requested"}
+
+@api_router.get("/admin/indexes")
+async def get_admin_index_report(current_user: dict = Depends(get_current_user)):
+    """Report missing, unmanaged, unused and redundant indexes (admin only)"""
+    if current_user['role'] != 'admin':
+        raise HTTPException(status_code=403, detail="Admin only")
+    return await get_index_report()
+
+@api_router.post("/admin/indexes/sync")
+async def sync_admin_indexes(current_user: dict = Depends(get_current_user)):
+    """Apply the index registry now instead of waiting for the next restart (admin only)"""
+    if current_user['role'] != 'admin':
+        raise HTTPException(status_code=403, detail="Admin only")
+    return await ensure_indexes()
+
+# ============================================
+# DATA MIGRATIONS
+# ============================================
+# Each migration is idempotent and works through at most `limit` documents per
+# run, reporting how many remain; run it again until remaining reaches 0.
+
+async def migrate_walk_points(limit: int) -> dict:
+    """Move embedded appointment gps_route arrays into walk_points and store route summaries"""
+    migrated = 0
+    points_moved = 0
+    # New appointments still carry the model's empty gps_route; only non-empty routes need moving
+    async for appt in db.appointments.find(
+        {"gps_route.0": {"$exists": True}},
+        {"_id": 0, "id": 1, "gps_route": 1, "distance_meters": 1, "last_point": 1}
+    ).limit(limit):
+        route = [p for p in appt.get("gps_route") or [] if p.get("lat") is not None and p.get("lng") is not None and p.get("timestamp")]
+        update_ops = {"$unset": {"gps_route": ""}}
+        if route:
+            points_moved += len(await insert_walk_points(appt["id"], route))
+            summary = gps_summary_update(route, 0, 0)
+            update_ops["$min"] = summary["$min"]
+            update_ops["$max"] = summary["$max"]
+            update_ops["$set"] = {
+                "gps_point_count": await db.walk_points.count_documents({"appointment_id": appt["id"]}),
+                "last_point": appt.get("last_point") or route[-1],
+                "distance_meters": appt.get("distance_meters") or calculate_distance(route),
+            }
+        await db.appointments.update_one({"id": appt["id"]}, update_ops)
+        migrated += 1
+    
+    remaining = await db.appointments.count_documents({"gps_route.0": {"$exists": True}})
+    return {"migrated": migrated, "points_moved": points_moved, "remaining": remaining}
+
+async def migrate_message_timestamps(limit: int) -> dict:
+    """Store message created_at values saved as dates as ISO strings, like every other message"""
+    updates = [
+        UpdateOne({"_id": msg["_id"]}, {"$set": {"created_at": msg["created_at"].replace(tzinfo=timezone.utc).isoformat()}})
+        async for msg in db.messages.find({"created_at": {"$type": "date"}}, {"_id": 1, "created_at": 1}).limit(limit)
+    ]
+    if updates:
+        await db.messages.bulk_write(updates, ordered=False)
+    remaining = await db.messages.count_documents({"created_at": {"$type": "date"}})
+    return {"migrated": len(updates), "remaining": remaining}
+
+async def migrate_conversations(limit: int) -> dict:
+    """Build conversation summaries (last message, unread counts) from existing direct messages, `limit` senders per batch; run message_timestamps first"""
+    state = await db.settings.find_one(CONVERSATIONS_MIGRATION, {"_id": 0}) or {}
+    senders = sorted(
+        sender_id for sender_id in await db.messages.distinct("sender_id", {"is_group_message": False})
+        if sender_id and sender_id > state.get('after', '')
+    )
+    batch = senders[:limit]
+    
+    # One pass over this batch's sent messages; each (sender, receiver) row sets
+    # the receiver's unread count and offers its newest message as last_message
+    pipeline = [
+        {"$match": {"is_group_message": False, "receiver_id": {"$ne": None}, "sender_id": {"$in": batch}}},
+        {"$sort": {"created_at": -1}},
+        {"$group": {
+            "_id": {"sender_id": "$sender_id", "receiver_id": "$receiver_id"},
+            "last_message": {"$first": "$$ROOT"},
+            "unread": {"$sum": {"$cond": [{"$eq": ["$read", False]}, 1, 0]}}
+        }}
+    ]
+    updates = []
+    rows = await db.messages.aggregate(pipeline, allowDiskUse=True).to_list(None) if batch else []
+    for row in rows:
+        sender_id, receiver_id = row['_id']['sender_id'], row['_id']['receiver_id']
+        conv_id = conversation_id(sender_id, receiver_id)
+        last_message = row['last_message']
+        last_message.pop('_id', None)
+        last_message_at = message_timestamp(last_message)
+        updates.append(UpdateOne({"id": conv_id}, {
+            "$setOnInsert": {"participants": sorted([sender_id, receiver_id])},
+            "$set": {f"unread.{receiver_id}": row['unread']}
+        }, upsert=True))
+        updates.append(UpdateOne(
+            {"id": conv_id, "$or": [{"last_message_at": {"$lt": last_message_at}}, {"last_message_at": {"$exists": False}}]},
+            {"$set": {"last_message": last_message, "last_message_at": last_message_at}}
+        ))
+    if updates:
+        await db.conversations.bulk_write(updates)
+    
+    remaining = len(senders) - len(batch)
+    progress = {"after": batch[-1]} if batch else {}
+    if not remaining:
+        progress["completed_at"] = datetime.now(timezone.utc).isoformat()
+    await db.settings.update_one(CONVERSATIONS_MIGRATION, {"$set": progress}, upsert=True)
+    return {"migrated": len(batch), "conversations_updated": len(updates) // 2, "remaining": remaining}
+
+async def migrate_group_read_watermarks(limit: int) -> dict:
+    """Replace users' read_group_messages id arrays with a group_read_at watermark"""
+    migrated = 0
+    async for user in db.users.find(
+        {"read_group_messages": {"$exists": True}}, {"_id": 0, "id": 1, "read_group_messages": 1}
+    ).limit(limit):
+        update_ops = {"$unset": {"read_group_messages": ""}}
+        # The newest message the user had read becomes the watermark
+        latest = await db.messages.find_one(
+            {"id": {"$in": user.get('read_group_messages') or []}, "is_group_message": True},
+            {"_id": 0, "created_at": 1}, sort=[("created_at", -1)]
+        )
+        if latest:
+            update_ops["$max"] = {"group_read_at": message_timestamp(latest)}
+        await db.users.update_one({"id": user['id']}, update_ops)
+        migrated += 1
+    
+    remaining = await db.users.count_documents({"read_group_messages": {"$exists": True}})
+    return {"migrated": migrated, "remaining": remaining}
+
+async def migrate_payroll_ledger(limit: int) -> dict:
+    """Create ledger rows for completed walks, linking those already on a submitted paysheet"""
+    # Unclaimed rows created before linking existed may sit on a legacy paysheet
+    unclaimed = await db.payroll_ledger.distinct("appointment_id", {"paysheet_id": None})
+    updates = [
+        UpdateMany({"appointment_id": {"$in": paysheet.get('appointment_ids') or []}, "paysheet_id": None},
+                   {"$set": {"paysheet_id": paysheet['id']}})
+        async for paysheet in db.paysheets.find(
+            {"submitted": True, "appointment_ids": {"$in": unclaimed}}, {"_id": 0, "id": 1, "appointment_ids": 1}
+        )
+    ] if unclaimed else []
+    linked = (await db.payroll_ledger.bulk_write(updates, ordered=False)).modified_count if updates else 0
+    
+    appt_ids = await unledgered_walk_ids()
+    batch = appt_ids[:limit]
+    await sync_payroll_ledger(batch)
+    
+    remaining = len(appt_ids) - len(batch)
+    if not remaining:
+        await db.settings.update_one(
+            PAYROLL_LEDGER_MIGRATION, {"$set": {"completed_at": datetime.now(timezone.utc).isoformat()}}, upsert=True
+        )
+    return {"migrated": len(batch), "linked_rows": linked, "remaining": remaining}
+
+async def migrate_payroll_monthly_rollup(limit: int) -> dict:
+    """Rebuild walker/month payroll rollups from paid paysheets (needed before PAYROLL_ROLLUP_REPORTS=true)"""
+    pipeline = [
+        {"$match": {"paid": True, "walker_id": {"$nin": [None, ""]}, "period_end": {"$nin": [None, ""]}}},
+        {"$group": {
+            "_id": {"walker_id": "$walker_id", "month": {"$substr": ["$period_end", 0, 7]}},
+            "earnings": {"$sum": "$total_earnings"},
+            "walks": {"$sum": "$total_walks"},
+            "hours": {"$sum": "$total_hours"},
+            "paysheets": {"$sum": 1},
+            "paysheet_ids": {"$push": "$id"}
+        }}
+    ]
+    buckets = {f"{row['_id']['walker_id']}|{row['_id']['month']}": row async for row in db.paysheets.aggregate(pipeline)}
+    done = set(await db.payroll_monthly_rollup.distinct("id", {"backfilled_at": {"$exists": True}}))
+    todo = [rollup_id for rollup_id in buckets if rollup_id not in done]
+    
+    now = datetime.now(timezone.utc).isoformat()
+    updates = [
+        UpdateOne({"id": rollup_id}, {"$set": {
+            **buckets[rollup_id]['_id'],
+            **{k: buckets[rollup_id][k] for k in ("earnings", "walks", "hours", "paysheets", "paysheet_ids")},
+            "backfilled_at": now
+        }}, upsert=True)
+        for rollup_id in todo[:limit]
+    ]
+    if updates:
+        await db.payroll_monthly_rollup.bulk_write(updates, ordered=False)
+    return {"migrated": len(updates), "remaining": len(todo) - len(updates)}
+
+MIGRATIONS = {
+    "walk_points": migrate_walk_points,
+    "message_timestamps": migrate_message_timestamps,
+    "conversations": migrate_conversations,
+    "group_read_watermarks": migrate_group_read_watermarks,
+    "payroll_ledger": migrate_payroll_ledger,
+    "payroll_monthly_rollup": migrate_payroll_monthly_rollup,
+}
+
+@api_router.get("/admin/migrations")
+async def list_migrations(current_user: dict = Depends(get_current_user)):
+    """Available data migrations (admin only)"""
+    if current_user['role'] != 'admin':
+        raise HTTPException(status_code=403, detail="Admin only")
+    return [{"name": name, "description": fn.__doc__} for name, fn in MIGRATIONS.items()]
+
+@api_router.post("/admin/migrations/{name}")
+async def run_migration(name: str, limit: int = Query(500, ge=1, le=10000), current_user: dict = Depends(get_current_user)):
+    """Run one batch of a data migration (admin only)"""
+    if current_user['role'] != 'admin':
+        raise HTTPException(status_code=403, detail="Admin only")
+    if name not in MIGRATIONS:
+        raise HTTPException(status_code=404, detail="Unknown migration")
+    result = await MIGRATIONS[name](limit)
+    logging.info(f"Migration {name}: {result}")
+    return {"migration": name, **result}
+
 # Include router
 app.include_router(api_router)
 
@@ -6499,6 +8958,7 @@ app.add_middleware(
     allow_origins=os.environ.get('CORS_ORIGINS', '*').split(','),
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "X-Before-Cursor", "X-After-Cursor"],
 )
 
 logging.basicConfig(
@@ -6507,6 +8967,42 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+@app.on_event("startup")
+async def create_db_indexes():
+    try:
+        result = await ensure_indexes()
+        logger.info(f"Database indexes applied: {result['applied']}, failed: {len(result['failed'])}")
+    except PyMongoError as e:
+        logger.error(f"Index setup skipped, database unavailable: {e}")
+
+@app.on_event("startup")
+async def start_recurring_scheduler():
+    if os.environ.get('RECURRING_SCHEDULER_ENABLED', 'true').lower() == 'true':
+        recurring_scheduler.start()
+
+@app.on_event("startup")
+async def start_message_broker():
+    await message_broker.start()
+
+@app.on_event("startup")
+async def start_active_walk_reconciler():
+    active_walks.start_reconciler()
+
+@app.on_event("startup")
+async def fail_interrupted_exports():
+    try:
+        failed = await fail_stale_export_jobs()
+        if failed:
+            logger.warning(f"Marked {failed} interrupted export jobs as failed")
+    except PyMongoError as e:
+        logger.error(f"Export job cleanup skipped, database unavailable: {e}")
+
 @app.on_event("shutdown")
 async def shutdown_db_client():
+    await recurring_scheduler.stop()
+    await message_broker.stop()
+    await active_walks.stop_reconciler()
+    await cancel_export_tasks()
+    if _export_executor is not None:
+        _export_executor.shutdown(wait=False, cancel_futures=True)
     client.close()
@@ -1,6 +1,7 @@
 import "@/index.css";
 import { BrowserRouter, Routes, Route, Navigate } from "react-router-dom";
 import { AuthProvider, useAuth } from "./context/AuthContext";
+import { MessageStreamProvider } from "./context/MessageStreamContext";
 import { Toaster } from "./components/ui/sonner";
 import LocationPermissionPrompt from "./components/LocationPermissionPrompt";
 import InstallAppBanner from "./components/InstallAppBanner";
@@ -385,10 +386,12 @@ function App() {
   return (
     <BrowserRouter>
       <AuthProvider>
-        <LocationPermissionPrompt />
-        <InstallAppBanner />
-        <AppRoutes />
-        <Toaster richColors position="top-right" />
+        <MessageStreamProvider>
+          <LocationPermissionPrompt />
+          <InstallAppBanner />
+          <AppRoutes />
+          <Toaster richColors position="top-right" />
+        </MessageStreamProvider>
       </AuthProvider>
     </BrowserRouter>
   );
@@ -1,6 +1,7 @@
 import { useState, useEffect, useRef } from 'react';
 import { Link, useLocation, useNavigate } from 'react-router-dom';
 import { useAuth } from '../context/AuthContext';
+import { useMessageStream } from '../context/MessageStreamContext';
 import { Button } from '../components/ui/button';
 import { Avatar, AvatarFallback, AvatarImage } from '../components/ui/avatar';
 import {
@@ -41,8 +42,31 @@ const Layout = ({ children }) => {
   const [hasNewMessage, setHasNewMessage] = useState(false);
   const prevCountRef = useRef(0);
 
-  // Poll for unread messages (but not on messages page to avoid conflicts)
+  const showUnreadCount = (newCount) => {
+    // Check if count increased (new message arrived)
+    if (newCount > prevCountRef.current) {
+      setHasNewMessage(true);
+      // Reset animation after 3 seconds
+      setTimeout(() => setHasNewMessage(false), 3000);
+    }
+    
+    prevCountRef.current = newCount;
+    setUnreadCount(newCount);
+  };
+
+  // Unread counts are pushed over the message stream; group messages only bump the badge
+  const streamConnected = useMessageStream((event) => {
+    if (event.type === 'unread_count') {
+      showUnreadCount(event.unread_count);
+    } else if (event.type === 'message' && event.message.is_group_message && event.message.sender_id !== user?.id) {
+      showUnreadCount(prevCountRef.current + 1);
+    }
+  });
+
+  // Poll for unread messages while the stream is down (but not on messages page to avoid conflicts)
   useEffect(() => {
+    if (streamConnected) return undefined;
+
     const isOnMessagesPage = location.pathname.includes('/messages') || 
                               location.pathname.includes('/chat') ||
                               location.pathname === '/admin/chat' ||
@@ -53,17 +77,7 @@ const Layout = ({ children }) => {
       
       try {
         const response = await api.get('/messages/unread-count');
-        const newCount = response.data.unread_count;
-        
-        // Check if count increased (new message arrived)
-        if (newCount > prevCountRef.current) {
-          setHasNewMessage(true);
-          // Reset animation after 3 seconds
-          setTimeout(() => setHasNewMessage(false), 3000);
-        }
-        
-        prevCountRef.current = newCount;
-        setUnreadCount(newCount);
+        showUnreadCount(response.data.unread_count);
       } catch (error) {
         console.error('Failed to fetch unread count');
       }
@@ -73,7 +87,7 @@ const Layout = ({ children }) => {
     const interval = setInterval(fetchUnreadCount, 10000); // Poll every 10 seconds (was 5)
     
     return () => clearInterval(interval);
-  }, [api, location.pathname]);
+  }, [api, location.pathname, streamConnected]);
 
   const handleLogout = () => {
     logout();
@@ -0,0 +1,76 @@
+import { createContext, useCallback, useContext, useEffect, useRef, useState } from 'react';
+import { useAuth } from './AuthContext';
+
+const MessageStreamContext = createContext(null);
+
+const WS_URL = `${process.env.REACT_APP_BACKEND_URL.replace(/^http/, 'ws')}/api/messages/ws`;
+
+// One message stream (new messages and unread counts) per tab, shared by every subscriber.
+// Reconnects with backoff; `connected` is false while callers should fall back to polling.
+export const MessageStreamProvider = ({ children }) => {
+  const { user } = useAuth();
+  const [connected, setConnected] = useState(false);
+  const listenersRef = useRef(new Set());
+
+  const subscribe = useCallback((listener) => {
+    listenersRef.current.add(listener);
+    return () => listenersRef.current.delete(listener);
+  }, []);
+
+  useEffect(() => {
+    if (!user || typeof WebSocket === 'undefined') return undefined;
+    let socket = null;
+    let retryTimer = null;
+    let retryDelay = 1000;
+    let closed = false;
+
+    const connect = () => {
+      const token = localStorage.getItem('token');
+      if (!token) return;
+      socket = new WebSocket(`${WS_URL}?token=${token}`);
+      socket.onopen = () => {
+        retryDelay = 1000;
+        setConnected(true);
+      };
+      socket.onmessage = (event) => {
+        const message = JSON.parse(event.data);
+        listenersRef.current.forEach(listener => listener(message));
+      };
+      socket.onclose = (event) => {
+        setConnected(false);
+        // 1008: the token was refused; stay on polling instead of retrying
+        if (closed || event.code === 1008) return;
+        retryTimer = setTimeout(connect, retryDelay);
+        retryDelay = Math.min(retryDelay * 2, 30000);
+      };
+    };
+
+    connect();
+    return () => {
+      closed = true;
+      clearTimeout(retryTimer);
+      socket?.close();
+    };
+  }, [user?.id]);
+
+  return (
+    <MessageStreamContext.Provider value={{ subscribe, connected }}>
+      {children}
+    </MessageStreamContext.Provider>
+  );
+};
+
+// Calls onEvent for every streamed event; returns whether the stream is connected
+export const useMessageStream = (onEvent) => {
+  const context = useContext(MessageStreamContext);
+  if (!context) {
+    throw new Error('useMessageStream must be used within a MessageStreamProvider');
+  }
+  const onEventRef = useRef(onEvent);
+  onEventRef.current = onEvent;
+  const { subscribe, connected } = context;
+
+  useEffect(() => subscribe((event) => onEventRef.current?.(event)), [subscribe]);
+
+  return connected;
+};
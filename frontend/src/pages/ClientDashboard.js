@@ -1148,7 +1148,7 @@ const ClientDashboard = () => {
               )}
 
               {/* GPS Route */}
-              {selectedCompletedWalk.gps_route && selectedCompletedWalk.gps_route.length > 0 ? (
+              {(selectedCompletedWalk.gps_point_count || selectedCompletedWalk.gps_route?.length) > 0 ? (
                 <div className="p-3 rounded-lg bg-blue-50 border border-blue-100">
                   <div className="flex items-center gap-2 mb-2">
                     <MapPin className="w-4 h-4 text-blue-500" />
@@ -1159,7 +1159,7 @@ const ClientDashboard = () => {
                     <div className="absolute inset-0 flex items-center justify-center text-gray-500">
                       <div className="text-center">
                         <MapPin className="w-8 h-8 mx-auto mb-2 text-blue-500" />
-                        <p className="text-sm">{selectedCompletedWalk.gps_route.length} GPS points recorded</p>
+                        <p className="text-sm">{selectedCompletedWalk.gps_point_count || selectedCompletedWalk.gps_route.length} GPS points recorded</p>
                         {selectedCompletedWalk.distance_miles && (
                           <p className="text-xs text-gray-400 mt-1">
                             Distance: {selectedCompletedWalk.distance_miles.toFixed(2)} miles
@@ -20,6 +20,13 @@ L.Icon.Default.mergeOptions({
   shadowUrl: 'https://cdnjs.cloudflare.com/ajax/libs/leaflet/1.7.1/images/marker-shadow.png',
 });
 
+// Matches MAX_GPS_BATCH_POINTS on the backend; the offline queue keeps at most
+// MAX_PENDING_POINTS, dropping the oldest
+const MAX_BATCH_POINTS = 2000;
+const MAX_PENDING_POINTS = MAX_BATCH_POINTS * 5;
+
+const fixTime = (pos) => new Date(pos.timestamp || Date.now()).toISOString();
+
 // Custom dog paw marker
 const createPawIcon = (color) => {
   return L.divIcon({
@@ -57,10 +64,13 @@ const LiveTrackingPage = () => {
   const [walkerAppointments, setWalkerAppointments] = useState([]);
   const watchIdRef = useRef(null);
   const updateIntervalRef = useRef(null);
+  const pendingPointsRef = useRef([]);
+  const liveSocketRef = useRef(null);
+  const liveRetryRef = useRef({ timer: null, delay: 1000 });
 
   useEffect(() => {
     fetchData();
-    const interval = setInterval(fetchActiveWalks, 10000); // Poll every 10 seconds
+    const interval = setInterval(fetchActiveWalks, 5000); // Poll every 5 seconds
     return () => {
       clearInterval(interval);
       if (watchIdRef.current) {
@@ -69,6 +79,7 @@ const LiveTrackingPage = () => {
       if (updateIntervalRef.current) {
         clearInterval(updateIntervalRef.current);
       }
+      closeLiveStream();
     };
   }, []);
 
@@ -89,14 +100,9 @@ const LiveTrackingPage = () => {
 
   const fetchActiveWalks = async () => {
     try {
-      const response = await api.get('/walks/active');
-      setActiveWalks(response.data);
-      
-      // If viewing a walk, update live data
-      if (selectedWalk && response.data.find(w => w.id === selectedWalk.id)) {
-        const updatedWalk = response.data.find(w => w.id === selectedWalk.id);
-        setLiveData(updatedWalk);
-      }
+      // Served from memory on the backend, so frequent polling is cheap
+      const response = await api.get('/walks/live-map');
+      setActiveWalks(response.data.walks);
     } catch (error) {
       console.error('Error fetching active walks:', error);
     }
@@ -137,7 +143,7 @@ const LiveTrackingPage = () => {
           
           // Start tracking on backend
           await api.post(`/appointments/${appointmentId}/start-tracking`, null, {
-            params: { lat: latitude, lng: longitude }
+            params: { lat: latitude, lng: longitude, timestamp: fixTime(position) }
           });
           
           setTracking(true);
@@ -153,16 +159,28 @@ const LiveTrackingPage = () => {
             { enableHighAccuracy: true, maximumAge: 5000 }
           );
           
-          // Send updates every 15 seconds
+          // Send updates every 15 seconds; points that fail to upload are
+          // kept and replayed with the next batch
+          pendingPointsRef.current = [];
           updateIntervalRef.current = setInterval(async () => {
             navigator.geolocation.getCurrentPosition(
               async (pos) => {
+                pendingPointsRef.current.push({
+                  lat: pos.coords.latitude,
+                  lng: pos.coords.longitude,
+                  timestamp: fixTime(pos)
+                });
+                pendingPointsRef.current = pendingPointsRef.current.slice(-MAX_PENDING_POINTS);
+                const batch = pendingPointsRef.current.slice(0, MAX_BATCH_POINTS);
                 try {
-                  await api.post(`/appointments/${appointmentId}/update-location`, null, {
-                    params: { lat: pos.coords.latitude, lng: pos.coords.longitude }
-                  });
+                  await api.post(`/appointments/${appointmentId}/locations:batch`, batch);
+                  pendingPointsRef.current = pendingPointsRef.current.slice(batch.length);
                 } catch (err) {
                   console.error('Failed to update location:', err);
+                  // A rejected batch would be rejected again; drop it so the queue drains
+                  if (err.response?.status === 400) {
+                    pendingPointsRef.current = pendingPointsRef.current.slice(batch.length);
+                  }
                 }
               },
               (err) => console.error('Location update error:', err),
@@ -190,7 +208,7 @@ const LiveTrackingPage = () => {
       navigator.geolocation.getCurrentPosition(
         async (position) => {
           await api.post(`/appointments/${appointmentId}/stop-tracking`, null, {
-            params: { lat: position.coords.latitude, lng: position.coords.longitude }
+            params: { lat: position.coords.latitude, lng: position.coords.longitude, timestamp: fixTime(position) }
           });
           
           // Clear watchers
@@ -222,15 +240,91 @@ const LiveTrackingPage = () => {
     }
   };
 
+  const closeLiveStream = () => {
+    clearTimeout(liveRetryRef.current.timer);
+    liveRetryRef.current = { timer: null, delay: 1000 };
+    if (liveSocketRef.current) {
+      liveSocketRef.current.onclose = null;
+      liveSocketRef.current.close();
+      liveSocketRef.current = null;
+    }
+  };
+
+  // Server pushes a snapshot, then only the new points as they are recorded.
+  // If the socket drops mid-walk, refresh once over HTTP and reconnect with backoff.
+  const openLiveStream = (walk) => {
+    const wsUrl = process.env.REACT_APP_BACKEND_URL.replace(/^http/, 'ws');
+    const token = localStorage.getItem('token');
+    const socket = new WebSocket(`${wsUrl}/api/appointments/${walk.id}/live-tracking/ws?token=${token}`);
+    let finished = false;
+
+    socket.onmessage = (event) => {
+      const message = JSON.parse(event.data);
+      if (message.type === 'snapshot') {
+        liveRetryRef.current.delay = 1000;
+        finished = !message.data.is_tracking;
+        setLiveData(message.data);
+        return;
+      }
+      if (message.type === 'completed') finished = true;
+      setLiveData(prev => {
+        if (!prev) return prev;
+        const gps_route = [...(prev.gps_route || []), ...message.points];
+        return {
+          ...prev,
+          gps_route,
+          current_location: gps_route[gps_route.length - 1] || prev.current_location,
+          distance_meters: message.distance_meters,
+          point_count: message.point_count,
+          ...(message.type === 'completed' && {
+            is_tracking: false,
+            status: 'completed',
+            duration_minutes: message.duration_minutes
+          })
+        };
+      });
+      if (message.type === 'completed') {
+        setSelectedWalk(prev => prev?.id === walk.id ? { ...prev, is_tracking: false } : prev);
+        fetchActiveWalks();
+        fetchCompletedWalks();
+      }
+    };
+    socket.onclose = (event) => {
+      liveSocketRef.current = null;
+      if (finished) return;
+      // 1008: the server refused the token or the walk; retrying won't help
+      if (event.code === 1008) {
+        toast.error('Live tracking is not available for this walk');
+        return;
+      }
+      api.get(`/appointments/${walk.id}/live-tracking`)
+        .then(response => setLiveData(response.data))
+        .catch(error => console.error('Error refreshing live tracking:', error));
+      const retry = liveRetryRef.current;
+      retry.timer = setTimeout(() => openLiveStream(walk), retry.delay);
+      retry.delay = Math.min(retry.delay * 2, 30000);
+    };
+    liveSocketRef.current = socket;
+  };
+
+  const fetchLiveTracking = async (walk) => {
+    try {
+      const response = await api.get(`/appointments/${walk.id}/live-tracking`);
+      setLiveData(response.data);
+    } catch (error) {
+      toast.error('Failed to load live tracking data');
+    }
+  };
+
   const viewWalkDetails = async (walk) => {
+    closeLiveStream();
     setSelectedWalk(walk);
     if (walk.is_tracking) {
-      // Fetch live data
-      try {
-        const response = await api.get(`/appointments/${walk.id}/live-tracking`);
-        setLiveData(response.data);
-      } catch (error) {
-        toast.error('Failed to load live tracking data');
+      setLiveData(null);
+      if (typeof WebSocket !== 'undefined') {
+        openLiveStream(walk);
+      } else {
+        await fetchLiveTracking(walk);
       }
     } else {
       setLiveData(walk);
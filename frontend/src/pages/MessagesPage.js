@@ -1,5 +1,6 @@
 import { useState, useEffect, useRef, useCallback, memo } from 'react';
 import { useAuth } from '../context/AuthContext';
+import { useMessageStream } from '../context/MessageStreamContext';
 import Layout from '../components/Layout';
 import { Card, CardContent, CardDescription, CardHeader, CardTitle } from '../components/ui/card';
 import { Button } from '../components/ui/button';
@@ -84,6 +85,13 @@ const formatDate = (dateString) => {
   return date.toLocaleDateString();
 };
 
+// Merge message lists by id, oldest first (pages and pushed messages can overlap)
+const mergeMessages = (current, incoming) => {
+  const byId = new Map(current.map(m => [m.id, m]));
+  incoming.forEach(m => byId.set(m.id, m));
+  return [...byId.values()].sort((a, b) => new Date(a.created_at) - new Date(b.created_at));
+};
+
 // ChatArea component - defined OUTSIDE MessagesPage to prevent recreation on parent re-renders
 const ChatArea = memo(({ 
   selectedContact, 
@@ -93,7 +101,9 @@ const ChatArea = memo(({
   onSendMessage, 
   onBack,
   isMobile,
-  messagesEndRef 
+  messagesEndRef,
+  hasOlder,
+  onLoadOlder
 }) => {
   return (
     <Card className="h-full rounded-2xl shadow-sm flex flex-col">
@@ -140,6 +150,13 @@ const ChatArea = memo(({
 
           <ScrollArea className="flex-1 p-4">
             <div className="space-y-4">
+              {hasOlder && (
+                <div className="text-center">
+                  <Button variant="ghost" size="sm" className="rounded-full" onClick={onLoadOlder}>
+                    Load earlier messages
+                  </Button>
+                </div>
+              )}
               {messages.length === 0 ? (
                 <div className="text-center py-12 text-muted-foreground">
                   <MessageCircle className="w-12 h-12 mx-auto mb-3 opacity-50" />
@@ -359,6 +376,7 @@ const MessagesPage = () => {
   const [loading, setLoading] = useState(true);
   const [showChat, setShowChat] = useState(false);
   const messagesEndRef = useRef(null);
+  const [olderCursor, setOlderCursor] = useState(null);
   const pollInterval = useRef(null);
   const hasMarkedRead = useRef(false);
 
@@ -403,7 +421,8 @@ const MessagesPage = () => {
         return;
       }
       const response = await api.get(url);
-      setMessages(response.data.reverse());
+      // Keep any earlier pages the user has scrolled back through
+      setMessages(prev => mergeMessages(prev, response.data));
     } catch (error) {
       console.error('Failed to load messages');
     }
@@ -429,11 +448,24 @@ const MessagesPage = () => {
       }
       const response = await api.get(url);
       setMessages(response.data.reverse());
+      setOlderCursor(response.headers['x-before-cursor'] || null);
     } catch (error) {
       console.error('Failed to load messages');
     }
   }, [api, isGroupChat, selectedContact]);
 
+  const loadOlderMessages = useCallback(async () => {
+    if (!olderCursor) return;
+    try {
+      const params = isGroupChat ? { group: true } : { receiver_id: selectedContact?.id };
+      const response = await api.get('/messages', { params: { ...params, before: olderCursor } });
+      setMessages(prev => mergeMessages(prev, response.data));
+      setOlderCursor(response.headers['x-before-cursor'] || null);
+    } catch (error) {
+      toast.error('Failed to load earlier messages');
+    }
+  }, [api, isGroupChat, selectedContact, olderCursor]);
+
   useEffect(() => {
     fetchContacts();
     return () => {
@@ -441,21 +473,43 @@ const MessagesPage = () => {
     };
   }, [fetchContacts]);
 
+  // New messages are pushed; append those for the open chat and refresh contact previews
+  const streamConnected = useMessageStream((event) => {
+    if (event.type !== 'message') return;
+    const message = event.message;
+    const inOpenChat = message.is_group_message
+      ? isGroupChat
+      : !isGroupChat && selectedContact && [message.sender_id, message.receiver_id].includes(selectedContact.id);
+    if (inOpenChat) {
+      setMessages(prev => mergeMessages(prev, [message]));
+      if (message.sender_id !== user?.id) {
+        api.post(message.is_group_message
+          ? '/messages/mark-read?mark_group=true'
+          : `/messages/mark-read?sender_id=${message.sender_id}`).catch(() => {});
+      }
+    }
+    if (!message.is_group_message) fetchContacts();
+  });
+
   useEffect(() => {
     if (selectedContact || isGroupChat) {
       hasMarkedRead.current = false;
       fetchMessages();
-      // Longer polling interval to reduce re-renders
-      pollInterval.current = setInterval(fetchMessagesOnly, 8000);
+      // Poll only while the message stream is unavailable
+      if (!streamConnected) {
+        pollInterval.current = setInterval(fetchMessagesOnly, 8000);
+      }
     }
     return () => {
       if (pollInterval.current) clearInterval(pollInterval.current);
     };
-  }, [selectedContact, isGroupChat, fetchMessages, fetchMessagesOnly]);
+  }, [selectedContact, isGroupChat, fetchMessages, fetchMessagesOnly, streamConnected]);
 
+  // Scroll to the newest message when one arrives, not when earlier pages load
+  const lastMessageId = messages[messages.length - 1]?.id;
   useEffect(() => {
     messagesEndRef.current?.scrollIntoView({ behavior: 'smooth' });
-  }, [messages]);
+  }, [lastMessageId]);
 
   const sendMessage = useCallback(async (content) => {
     try {
@@ -538,6 +592,8 @@ const MessagesPage = () => {
               onBack={goBackToContacts}
               isMobile={false}
               messagesEndRef={messagesEndRef}
+              hasOlder={!!olderCursor}
+              onLoadOlder={loadOlderMessages}
             />
           </div>
         </div>
@@ -570,6 +626,8 @@ const MessagesPage = () => {
                 onBack={goBackToContacts}
                 isMobile={true}
                 messagesEndRef={messagesEndRef}
+                hasOlder={!!olderCursor}
+                onLoadOlder={loadOlderMessages}
               />
             </div>
           )}
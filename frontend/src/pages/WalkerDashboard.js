@@ -307,7 +307,11 @@ const WalkerDashboard = () => {
           async (position) => {
             try {
               await api.post(`/appointments/${pendingWalkId}/start-tracking`, null, {
-                params: { lat: position.coords.latitude, lng: position.coords.longitude }
+                params: {
+                  lat: position.coords.latitude,
+                  lng: position.coords.longitude,
+                  timestamp: new Date(position.timestamp || Date.now()).toISOString()
+                }
               });
               toast.success('Walk started with GPS tracking!');
               navigate('/tracking');
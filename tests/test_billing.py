@@ -0,0 +1,79 @@
+"""
+Test Billing
+Tests for:
+1. Clients registered without custom pricing are priced at the standard service rates
+2. Billing endpoints still load with such clients present
+"""
+import pytest
+import requests
+import os
+import uuid
+
+BASE_URL = os.environ.get('REACT_APP_BACKEND_URL', '').rstrip('/')
+
+# Test credentials
+ADMIN_USERNAME = "demo_admin"
+ADMIN_PASSWORD = "demo123"
+
+
+class TestRegisteredClientBilling:
+    """Test pricing for a client created through /api/auth/register, which sets no custom prices"""
+
+    @pytest.fixture(autouse=True)
+    def setup(self):
+        """Setup test fixtures"""
+        self.session = requests.Session()
+        self.session.headers.update({"Content-Type": "application/json"})
+
+    def login_admin(self):
+        response = self.session.post(f"{BASE_URL}/api/auth/login", json={
+            "username": ADMIN_USERNAME,
+            "password": ADMIN_PASSWORD
+        })
+        if response.status_code != 200:
+            pytest.skip("Admin login failed")
+        return {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+    def register_client(self):
+        suffix = uuid.uuid4().hex[:8]
+        response = self.session.post(f"{BASE_URL}/api/auth/register", json={
+            "username": f"TEST_client_{suffix}",
+            "email": f"test_client_{suffix}@example.com",
+            "password": "test123",
+            "full_name": f"TEST Client {suffix}"
+        })
+        assert response.status_code == 200
+        data = response.json()
+        return data["user"]["id"], {"Authorization": f"Bearer {data['access_token']}"}
+
+    def test_invoice_for_registered_client_uses_standard_price(self):
+        """POST /invoices prices a fresh client's walk at the service's base price"""
+        admin_headers = self.login_admin()
+        client_id, client_headers = self.register_client()
+
+        response = self.session.post(f"{BASE_URL}/api/appointments", headers=client_headers, json={
+            "pet_ids": [],
+            "service_type": "walk_30",
+            "scheduled_date": "2030-06-03",
+            "scheduled_time": "10:00"
+        })
+        assert response.status_code == 200
+        appointment_id = response.json()["id"]
+
+        services = self.session.get(f"{BASE_URL}/api/services").json()
+        base_price = next(s["price"] for s in services if s["service_type"] == "walk_30")
+
+        response = self.session.post(
+            f"{BASE_URL}/api/invoices", headers=admin_headers,
+            params={"client_id": client_id}, json=[appointment_id]
+        )
+        assert response.status_code == 200
+        assert response.json()["amount"] == pytest.approx(base_price)
+
+    def test_clients_due_loads_with_registered_client(self):
+        """GET /billing/clients-due does not fail on clients without custom pricing"""
+        admin_headers = self.login_admin()
+        self.register_client()
+
+        response = self.session.get(f"{BASE_URL}/api/billing/clients-due", headers=admin_headers)
+        assert response.status_code == 200
@@ -294,6 +294,65 @@ class TestAdminAppointmentCreation:
         appointments = response.json()
         print(f"✓ Calendar endpoint returned {len(appointments)} appointments")
 
+    def test_calendar_date_window(self):
+        """Test calendar only returns appointments inside the start/end window"""
+        assert self.get_admin_token(), "Failed to get admin token"
+
+        response = self.session.get(f"{BASE_URL}/api/appointments/calendar", params={
+            "start": "2025-12-21",
+            "end": "2025-12-27"
+        })
+        assert response.status_code == 200, f"Failed to get calendar window: {response.text}"
+
+        appointments = response.json()
+        for appt in appointments:
+            assert "2025-12-21" <= appt["scheduled_date"] <= "2025-12-27", f"Out of window: {appt['scheduled_date']}"
+        print(f"✓ Calendar window returned {len(appointments)} appointments")
+
+    def test_calendar_cursor_pagination(self):
+        """Test paging through the calendar with the X-Next-Cursor header"""
+        assert self.get_admin_token(), "Failed to get admin token"
+
+        seen_ids = []
+        cursor = None
+        for _ in range(5):
+            params = {"limit": 2}
+            if cursor:
+                params["cursor"] = cursor
+            response = self.session.get(f"{BASE_URL}/api/appointments/calendar", params=params)
+            assert response.status_code == 200, f"Failed to get calendar page: {response.text}"
+
+            page = response.json()
+            assert len(page) <= 2, "Page larger than limit"
+            seen_ids.extend(a["id"] for a in page)
+
+            cursor = response.headers.get("X-Next-Cursor")
+            if not cursor:
+                break
+
+        assert len(seen_ids) == len(set(seen_ids)), "Pages returned duplicate appointments"
+        print(f"✓ Paged through {len(seen_ids)} appointments without duplicates")
+
+    def test_appointments_field_projection(self):
+        """Test fields= returns only the requested fields, without model defaults"""
+        assert self.get_admin_token(), "Failed to get admin token"
+
+        response = self.session.get(f"{BASE_URL}/api/appointments", params={"fields": "notes", "limit": 5})
+        assert response.status_code == 200, f"Failed to get projected appointments: {response.text}"
+
+        for appt in response.json():
+            assert "created_at" not in appt, "Unrequested field filled in with a default"
+            assert "gps_route" not in appt, "Unrequested field filled in with a default"
+        print("✓ Field projection returned only the requested fields")
+
+    def test_calendar_invalid_cursor(self):
+        """Test a malformed cursor is rejected"""
+        assert self.get_admin_token(), "Failed to get admin token"
+
+        response = self.session.get(f"{BASE_URL}/api/appointments/calendar", params={"cursor": "not-a-cursor"})
+        assert response.status_code == 400, f"Expected 400 for bad cursor, got {response.status_code}"
+        print("✓ Invalid cursor rejected")
+
 
 class TestWalkerDropdownLogic:
     """Test the walker dropdown visibility logic based on service type"""
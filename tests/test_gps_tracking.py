@@ -0,0 +1,139 @@
+"""
+Test GPS Walk Tracking
+Tests for:
+1. Single-point location updates accumulate distance and point count
+2. Batched location upload de-duplicates, orders and appends points
+3. Replaying a batch does not add points twice
+4. Completed walks store a simplified route and polyline
+5. Live map snapshot tracks the latest position of active walks
+"""
+import pytest
+import requests
+import os
+from datetime import datetime, timezone, timedelta
+
+BASE_URL = os.environ.get('REACT_APP_BACKEND_URL', '').rstrip('/')
+
+# Test credentials
+ADMIN_USERNAME = "demo_admin"
+ADMIN_PASSWORD = "demo123"
+
+
+class TestGPSTracking:
+    """Test GPS ingestion endpoints on a freshly created walk"""
+
+    @pytest.fixture(autouse=True)
+    def setup(self):
+        """Login as admin and create a walk to track"""
+        self.session = requests.Session()
+        self.session.headers.update({"Content-Type": "application/json"})
+        response = self.session.post(f"{BASE_URL}/api/auth/login", json={
+            "username": ADMIN_USERNAME,
+            "password": ADMIN_PASSWORD
+        })
+        if response.status_code != 200:
+            pytest.skip("Admin login failed")
+        self.session.headers.update({"Authorization": f"Bearer {response.json()['access_token']}"})
+
+        clients = self.session.get(f"{BASE_URL}/api/users/clients").json()
+        if not clients:
+            pytest.skip("No clients available")
+        response = self.session.post(f"{BASE_URL}/api/appointments/admin", json={
+            "client_id": clients[0]["id"],
+            "service_type": "walk_30",
+            "scheduled_date": "2031-06-01",
+            "scheduled_time": "05:00",
+            "pet_ids": [],
+            "notes": "TEST_GPS tracking"
+        })
+        if response.status_code not in [200, 201]:
+            pytest.skip(f"Could not create appointment: {response.text}")
+        self.appt_id = response.json()["id"]
+
+        response = self.session.post(f"{BASE_URL}/api/appointments/{self.appt_id}/start-tracking", params={"lat": 40.0, "lng": -75.0})
+        assert response.status_code == 200
+        yield
+        self.session.post(f"{BASE_URL}/api/appointments/{self.appt_id}/stop-tracking")
+
+    def test_single_point_update(self):
+        """Each ping adds one point and the segment distance"""
+        response = self.session.post(f"{BASE_URL}/api/appointments/{self.appt_id}/update-location", params={"lat": 40.001, "lng": -75.0})
+        assert response.status_code == 200
+        data = response.json()
+        assert data["point_count"] == 2
+        assert 100 < data["distance_meters"] < 125  # ~111 m per 0.001 degree of latitude
+
+        live = self.session.get(f"{BASE_URL}/api/appointments/{self.appt_id}/live-tracking", params={"include_route": False}).json()
+        assert live["current_location"]["lat"] == 40.001
+        assert live["gps_route"] is None
+
+    def test_batch_upload(self):
+        """Batch is ordered, de-duplicated and idempotent on replay"""
+        base = datetime.now(timezone.utc) + timedelta(minutes=1)
+        points = [
+            {"lat": 40.002, "lng": -75.0, "timestamp": (base + timedelta(seconds=10)).isoformat()},
+            {"lat": 40.001, "lng": -75.0, "timestamp": (base + timedelta(seconds=5)).isoformat()},
+            {"lat": 40.001, "lng": -75.0, "timestamp": (base + timedelta(seconds=5)).isoformat()},
+        ]
+        response = self.session.post(f"{BASE_URL}/api/appointments/{self.appt_id}/locations:batch", json=points)
+        assert response.status_code == 200, response.text
+        data = response.json()
+        assert data["accepted"] == 2
+        assert data["point_count"] == 3
+        assert 200 < data["distance_meters"] < 250
+
+        response = self.session.post(f"{BASE_URL}/api/appointments/{self.appt_id}/locations:batch", json=points)
+        assert response.status_code == 200
+        assert response.json()["accepted"] == 0
+        assert response.json()["point_count"] == 3
+
+    def test_batch_phone_clock_behind(self):
+        """Points from a phone whose clock is behind the server are still accepted"""
+        base = datetime.now(timezone.utc) - timedelta(minutes=5)
+        points = [
+            {"lat": 40.001, "lng": -75.0, "timestamp": base.isoformat()},
+            {"lat": 40.002, "lng": -75.0, "timestamp": (base + timedelta(seconds=5)).isoformat()},
+        ]
+        response = self.session.post(f"{BASE_URL}/api/appointments/{self.appt_id}/locations:batch", json=points)
+        assert response.status_code == 200, response.text
+        assert response.json()["accepted"] == 2
+        assert response.json()["point_count"] == 3
+
+    def test_batch_invalid_timestamp(self):
+        """Unparseable timestamps are rejected"""
+        response = self.session.post(f"{BASE_URL}/api/appointments/{self.appt_id}/locations:batch", json=[
+            {"lat": 40.0, "lng": -75.0, "timestamp": "yesterday"}
+        ])
+        assert response.status_code == 400
+
+    def test_completed_walk_compact_route(self):
+        """Stopping a walk stores a simplified route; full route stays available"""
+        base = datetime.now(timezone.utc) + timedelta(minutes=1)
+        points = [
+            {"lat": 40.0 + i * 0.0001, "lng": -75.0, "timestamp": (base + timedelta(seconds=5 * i)).isoformat()}
+            for i in range(1, 50)
+        ]
+        response = self.session.post(f"{BASE_URL}/api/appointments/{self.appt_id}/locations:batch", json=points)
+        assert response.status_code == 200
+        response = self.session.post(f"{BASE_URL}/api/appointments/{self.appt_id}/stop-tracking")
+        assert response.status_code == 200
+
+        full = self.session.get(f"{BASE_URL}/api/appointments/{self.appt_id}/route").json()
+        assert len(full["gps_route"]) == 50
+        simplified = self.session.get(f"{BASE_URL}/api/appointments/{self.appt_id}/route", params={"resolution": "simplified"}).json()
+        assert len(simplified["gps_route"]) == 2  # A straight line keeps only its endpoints
+        assert simplified["gps_polyline"]
+
+    def test_live_map(self):
+        """Live map lists the walk with its latest position and drops it once stopped"""
+        self.session.post(f"{BASE_URL}/api/appointments/{self.appt_id}/update-location", params={"lat": 40.001, "lng": -75.0})
+        data = self.session.get(f"{BASE_URL}/api/walks/live-map").json()
+        walk = next(w for w in data["walks"] if w["id"] == self.appt_id)
+        assert walk["current_location"]["lat"] == 40.001
+        assert walk["point_count"] == 2
+        assert "gps_route" not in walk
+
+        self.session.post(f"{BASE_URL}/api/appointments/{self.appt_id}/stop-tracking")
+        after = self.session.get(f"{BASE_URL}/api/walks/live-map").json()
+        assert after["version"] > data["version"]
+        assert self.appt_id not in [w["id"] for w in after["walks"]]
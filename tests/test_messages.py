@@ -0,0 +1,115 @@
+"""
+Test Messaging
+Tests for:
+1. Contact list carries last message and unread count per contact
+2. Conversations list matches the contact summaries
+3. Unread badge totals and the group read watermark
+4. Keyset pagination through message history
+"""
+import pytest
+import requests
+import os
+import uuid
+
+BASE_URL = os.environ.get('REACT_APP_BACKEND_URL', '').rstrip('/')
+
+# Test credentials
+ADMIN_USERNAME = "demo_admin"
+ADMIN_PASSWORD = "demo123"
+
+
+class TestMessageContacts:
+    """Test GET /api/messages/contacts and /api/messages/conversations"""
+
+    @pytest.fixture(autouse=True)
+    def setup(self):
+        """Login as admin and pick a client to message"""
+        self.session = requests.Session()
+        self.session.headers.update({"Content-Type": "application/json"})
+        response = self.session.post(f"{BASE_URL}/api/auth/login", json={
+            "username": ADMIN_USERNAME,
+            "password": ADMIN_PASSWORD
+        })
+        if response.status_code != 200:
+            pytest.skip("Admin login failed")
+        self.session.headers.update({"Authorization": f"Bearer {response.json()['access_token']}"})
+
+        clients = self.session.get(f"{BASE_URL}/api/users/clients").json()
+        if not clients:
+            pytest.skip("No clients available")
+        self.client_id = clients[0]["id"]
+
+    def test_contact_last_message(self):
+        """Sending a message makes it the contact's preview and puts the contact first"""
+        content = f"TEST_MSG {uuid.uuid4()}"
+        response = self.session.post(f"{BASE_URL}/api/messages", json={"receiver_id": self.client_id, "content": content})
+        assert response.status_code == 200
+
+        contacts = self.session.get(f"{BASE_URL}/api/messages/contacts", params={"contact_type": "clients"}).json()
+        assert contacts[0]["id"] == self.client_id
+        assert contacts[0]["has_messages"] is True
+        assert contacts[0]["last_message_preview"] == content[:50]
+        assert isinstance(contacts[0]["unread_count"], int)
+
+        conversations = self.session.get(f"{BASE_URL}/api/messages/conversations").json()
+        conversation = next(c for c in conversations if c["partner"]["id"] == self.client_id)
+        assert conversation["last_message"]["content"] == content
+        assert isinstance(conversation["unread_count"], int)
+
+    def test_unread_count_shape(self):
+        """Unread badge adds direct and group counts"""
+        data = self.session.get(f"{BASE_URL}/api/messages/unread-count").json()
+        assert data["unread_count"] == data["unread_direct"] + data["unread_group"]
+
+    def test_mark_group_read(self):
+        """Marking the group chat read clears the group badge until someone posts again"""
+        response = self.session.post(f"{BASE_URL}/api/messages/mark-read", params={"mark_group": True})
+        assert response.status_code == 200
+        data = self.session.get(f"{BASE_URL}/api/messages/unread-count").json()
+        assert data["unread_group"] == 0
+
+
+class TestMessagePagination:
+    """Test keyset pagination on GET /api/messages"""
+
+    @pytest.fixture(autouse=True)
+    def setup(self):
+        """Login as admin"""
+        self.session = requests.Session()
+        self.session.headers.update({"Content-Type": "application/json"})
+        response = self.session.post(f"{BASE_URL}/api/auth/login", json={
+            "username": ADMIN_USERNAME,
+            "password": ADMIN_PASSWORD
+        })
+        if response.status_code != 200:
+            pytest.skip("Admin login failed")
+        self.session.headers.update({"Authorization": f"Bearer {response.json()['access_token']}"})
+
+    def test_pages_do_not_overlap(self):
+        """Following X-Before-Cursor walks back through history without repeats"""
+        seen = []
+        params = {"limit": 5}
+        for _ in range(4):
+            response = self.session.get(f"{BASE_URL}/api/messages", params=params)
+            assert response.status_code == 200
+            seen += [m["id"] for m in response.json()]
+            cursor = response.headers.get("X-Before-Cursor")
+            if not cursor:
+                break
+            params = {"limit": 5, "before": cursor}
+        assert len(seen) == len(set(seen))
+
+    def test_after_cursor_returns_nothing_new(self):
+        """Asking for messages after the newest one returns an empty page"""
+        response = self.session.get(f"{BASE_URL}/api/messages", params={"limit": 1})
+        cursor = response.headers.get("X-After-Cursor")
+        if not cursor:
+            pytest.skip("No messages yet")
+        response = self.session.get(f"{BASE_URL}/api/messages", params={"after": cursor})
+        assert response.status_code == 200
+        assert response.json() == []
+
+    def test_invalid_cursor(self):
+        """Tampered cursors and before+after together are rejected"""
+        assert self.session.get(f"{BASE_URL}/api/messages", params={"before": "not-a-cursor"}).status_code == 400
+        assert self.session.get(f"{BASE_URL}/api/messages", params={"before": "x", "after": "x"}).status_code == 400
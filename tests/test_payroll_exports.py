@@ -0,0 +1,72 @@
+"""
+Test Payroll Exports
+Tests for:
+1. 1099 export job runs to completion and reports progress
+2. Completed export downloads as a ZIP with a summary and per-staff statements
+3. Export endpoints are admin only
+"""
+import pytest
+import requests
+import os
+import io
+import time
+import zipfile
+
+BASE_URL = os.environ.get('REACT_APP_BACKEND_URL', '').rstrip('/')
+
+# Test credentials
+ADMIN_USERNAME = "demo_admin"
+ADMIN_PASSWORD = "demo123"
+
+
+class Test1099Export:
+    """Test POST /api/admin/exports/1099 and the job status/download endpoints"""
+
+    @pytest.fixture(autouse=True)
+    def setup(self):
+        """Setup test fixtures"""
+        self.session = requests.Session()
+        self.session.headers.update({"Content-Type": "application/json"})
+
+    def login_admin(self):
+        response = self.session.post(f"{BASE_URL}/api/auth/login", json={
+            "username": ADMIN_USERNAME,
+            "password": ADMIN_PASSWORD
+        })
+        if response.status_code != 200:
+            pytest.skip("Admin login failed")
+        self.session.headers.update({"Authorization": f"Bearer {response.json()['access_token']}"})
+
+    def test_export_completes_and_downloads(self):
+        """Job finishes and its ZIP has one CSV and PDF per staff member"""
+        self.login_admin()
+        response = self.session.post(f"{BASE_URL}/api/admin/exports/1099")
+        assert response.status_code == 200
+        job = response.json()
+        assert job["status"] == "queued"
+
+        for _ in range(60):
+            job = self.session.get(f"{BASE_URL}/api/admin/exports/{job['id']}").json()
+            if job["status"] in ("completed", "failed"):
+                break
+            time.sleep(1)
+        assert job["status"] == "completed", job.get("error")
+        assert job["processed"] == job["total"]
+
+        response = self.session.get(f"{BASE_URL}/api/admin/exports/{job['id']}/download")
+        assert response.status_code == 200
+        names = zipfile.ZipFile(io.BytesIO(response.content)).namelist()
+        assert "summary.csv" in names
+        assert len([n for n in names if n.endswith(".pdf")]) == job["total"]
+        assert len([n for n in names if n.endswith(".csv")]) == job["total"] + 1
+        print(f"✓ Exported {job['total']} statements")
+
+    def test_unknown_export(self):
+        """Unknown job ids return 404"""
+        self.login_admin()
+        assert self.session.get(f"{BASE_URL}/api/admin/exports/does-not-exist").status_code == 404
+
+    def test_export_requires_auth(self):
+        """Unauthenticated requests are rejected"""
+        response = self.session.post(f"{BASE_URL}/api/admin/exports/1099")
+        assert response.status_code in [401, 403]
@@ -0,0 +1,153 @@
+"""
+Test Walker Availability
+Tests for:
+1. Availability matrix agrees with the single-slot availability check
+2. Busy cells carry the conflicting appointment
+3. Matrix is admin only and validates its input
+"""
+import pytest
+import requests
+import os
+
+BASE_URL = os.environ.get('REACT_APP_BACKEND_URL', '').rstrip('/')
+
+# Test credentials
+ADMIN_USERNAME = "demo_admin"
+ADMIN_PASSWORD = "demo123"
+
+
+class TestAvailabilityMatrix:
+    """Test POST /api/walkers/availability-matrix"""
+
+    @pytest.fixture(autouse=True)
+    def setup(self):
+        """Setup test fixtures"""
+        self.session = requests.Session()
+        self.session.headers.update({"Content-Type": "application/json"})
+
+    def login_admin(self):
+        response = self.session.post(f"{BASE_URL}/api/auth/login", json={
+            "username": ADMIN_USERNAME,
+            "password": ADMIN_PASSWORD
+        })
+        if response.status_code != 200:
+            pytest.skip("Admin login failed")
+        self.session.headers.update({"Authorization": f"Bearer {response.json()['access_token']}"})
+
+    def test_matrix_matches_check_availability(self):
+        """Every cell should agree with /walkers/{id}/check-availability"""
+        self.login_admin()
+
+        response = self.session.get(f"{BASE_URL}/api/appointments/calendar", params={"limit": 20})
+        assert response.status_code == 200
+        walks = [a for a in response.json() if a.get("walker_id") and a.get("service_type", "").startswith("walk_")]
+        if not walks:
+            pytest.skip("No walker appointments to check against")
+        appt = walks[0]
+
+        times = [appt["scheduled_time"], "06:00", "21:00"]
+        response = self.session.post(f"{BASE_URL}/api/walkers/availability-matrix", json={
+            "dates": [appt["scheduled_date"]],
+            "times": times,
+            "service_types": ["walk_30"],
+            "walker_ids": [appt["walker_id"]]
+        })
+        assert response.status_code == 200, f"Matrix failed: {response.text}"
+        data = response.json()
+        assert len(data["walkers"]) <= 1
+
+        for walker in data["walkers"]:
+            assert len(walker["cells"]) == len(times)
+            for cell in walker["cells"]:
+                check = self.session.get(
+                    f"{BASE_URL}/api/walkers/{walker['walker_id']}/check-availability",
+                    params={"scheduled_date": cell["date"], "scheduled_time": cell["time"], "service_type": cell["service_type"]}
+                )
+                assert check.status_code == 200
+                assert check.json()["available"] == cell["available"]
+                if not cell["available"]:
+                    assert cell["conflict"]["appointment_id"]
+                    assert cell["conflict"]["message"] == check.json()["message"]
+        print(f"✓ Matrix agrees with check-availability for {len(times)} slots")
+
+    def test_matrix_non_walk_services_always_free(self):
+        """Overlapping services never conflict"""
+        self.login_admin()
+        response = self.session.post(f"{BASE_URL}/api/walkers/availability-matrix", json={
+            "dates": ["2030-01-01"],
+            "times": ["09:00", "12:00"],
+            "service_types": ["overnight", "doggy_day_care"]
+        })
+        assert response.status_code == 200
+        for walker in response.json()["walkers"]:
+            assert all(cell["available"] for cell in walker["cells"])
+
+    def test_matrix_invalid_input(self):
+        """Bad dates and times are rejected"""
+        self.login_admin()
+        response = self.session.post(f"{BASE_URL}/api/walkers/availability-matrix", json={
+            "dates": ["01/01/2030"],
+            "times": ["09:00"]
+        })
+        assert response.status_code == 400
+        response = self.session.post(f"{BASE_URL}/api/walkers/availability-matrix", json={
+            "dates": ["2030-01-01"],
+            "times": ["9am"]
+        })
+        assert response.status_code == 400
+
+    def test_matrix_requires_auth(self):
+        """Unauthenticated requests are rejected"""
+        response = self.session.post(f"{BASE_URL}/api/walkers/availability-matrix", json={
+            "dates": ["2030-01-01"],
+            "times": ["09:00"]
+        })
+        assert response.status_code in [401, 403]
+
+
+class TestAvailableSlots:
+    """Test GET /api/appointments/available-slots"""
+
+    @pytest.fixture(autouse=True)
+    def setup(self):
+        """Setup test fixtures"""
+        self.session = requests.Session()
+        self.session.headers.update({"Content-Type": "application/json"})
+        response = self.session.post(f"{BASE_URL}/api/auth/login", json={
+            "username": ADMIN_USERNAME,
+            "password": ADMIN_PASSWORD
+        })
+        if response.status_code != 200:
+            pytest.skip("Admin login failed")
+        self.session.headers.update({"Authorization": f"Bearer {response.json()['access_token']}"})
+
+    def test_single_day_shape(self):
+        """Single day keeps the original response shape"""
+        response = self.session.get(f"{BASE_URL}/api/appointments/available-slots", params={"date": "2030-01-01"})
+        assert response.status_code == 200
+        data = response.json()
+        assert data["date"] == "2030-01-01"
+        assert len(data["slots"]) == 60
+        assert data["slots"][0]["time"] == "06:00"
+        assert data["slots"][-1]["time"] == "20:45"
+        for slot in data["slots"]:
+            assert slot["is_full"] == (slot["booked_count"] >= 3)
+
+    def test_date_range(self):
+        """end_date returns one entry per day"""
+        response = self.session.get(f"{BASE_URL}/api/appointments/available-slots", params={
+            "date": "2030-01-01", "end_date": "2030-01-14"
+        })
+        assert response.status_code == 200
+        data = response.json()
+        assert [d["date"] for d in data["days"]][0] == "2030-01-01"
+        assert len(data["days"]) == 14
+
+    def test_invalid_range(self):
+        """Reversed or oversized ranges are rejected"""
+        response = self.session.get(f"{BASE_URL}/api/appointments/available-slots", params={
+            "date": "2030-01-10", "end_date": "2030-01-01"
+        })
+        assert response.status_code == 400
+        response = self.session.get(f"{BASE_URL}/api/appointments/available-slots", params={"date": "tomorrow"})
+        assert response.status_code == 400